@@ -0,0 +1,129 @@
+"""
+Benchmark: QuoteIndex vs. the raw substring guardrails the pipeline used before it (kept below as the
+reference implementation: quotes_present / locate_quote_msg_index / max_problem_msg_index /
+resolution_quotes_are_later) on long synthetic threads.
+
+Run:
+  python benchmarks/bench_quote_index.py --messages 100 500 2000 --issues 20
+"""
+
+import sys, time, random, argparse
+from pathlib import Path
+from typing import List, Optional
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import email_processing_agent as agent
+
+# Reference implementation: one raw substring scan over the thread / every chunk per quote
+def quotes_present(text: str, quotes: List[str]) -> bool:
+    for q in quotes or []:
+        qq = (q or "").strip()
+        if not qq or qq not in text:
+            return False
+    return True
+
+def locate_quote_msg_index(msg_chunks: List[str], quote: str) -> Optional[int]:
+    q = (quote or "").strip()
+    if not q:
+        return None
+    for idx, chunk in enumerate(msg_chunks, 1):
+        if q in chunk:
+            return idx
+    return None
+
+def max_problem_msg_index(msg_chunks: List[str], evidence_quotes: List[str]) -> int:
+    idxs = [locate_quote_msg_index(msg_chunks, q) for q in (evidence_quotes or [])]
+    idxs = [i for i in idxs if isinstance(i, int)]
+    return max(idxs) if idxs else 0
+
+def resolution_quotes_are_later(msg_chunks: List[str], evidence_quotes: List[str], resolution_quotes: List[str]) -> bool:
+    prob_max = max_problem_msg_index(msg_chunks, evidence_quotes)
+    if prob_max == 0:
+        return True
+    for rq in resolution_quotes or []:
+        ridx = locate_quote_msg_index(msg_chunks, rq)
+        if ridx is None or ridx <= prob_max:
+            return False
+    return True
+
+def long_thread(input_dir: str, n_messages: int, rng: random.Random):
+    # Sample messages recycled with shuffled words, so quotes are unique and scans can't stop early
+    base = []
+    for p in sorted(Path(input_dir).glob("email*.txt")):
+        base.extend(agent.parse_email_thread(str(p)))
+    out = []
+    for i in range(n_messages):
+        m = base[i % len(base)]
+        words = m.body.split(" ")
+        rng.shuffle(words)
+        out.append(agent.EmailMessage(**{**m.__dict__, "body": " ".join(words)}))
+    return out
+
+def pick_quotes(msg_chunks, rng: random.Random, n: int):
+    quotes = []
+    for _ in range(n):
+        idx = rng.randrange(len(msg_chunks))
+        body = msg_chunks[idx].split("Body:\n", 1)[-1]
+        start = rng.randrange(max(1, len(body) - 60))
+        quotes.append(body[start:start + 50].strip() or body[:50])
+    return quotes
+
+def wrap_variant(q: str) -> str:
+    # What models typically return: re-wrapped lines and smart quotes
+    return q.replace(" ", "\n", 1).replace("'", "’")
+
+def legacy_pass(thread_text, msg_chunks, issues):
+    ok = 0
+    for ev, res in issues:
+        if not quotes_present(thread_text, ev):
+            continue
+        max_problem_msg_index(msg_chunks, ev)                    # candidate harvesting
+        if quotes_present(thread_text, res) and resolution_quotes_are_later(msg_chunks, ev, res):
+            ok += 1
+        locate_quote_msg_index(msg_chunks, ev[0])                # opened_at / subject
+    return ok
+
+def index_pass(msg_chunks, issues, mode):
+    qi = agent.QuoteIndex(msg_chunks, mode)
+    ok = 0
+    for ev, res in issues:
+        if not qi.present(ev):
+            continue
+        qi.max_index(ev)
+        if qi.present(res) and qi.resolution_is_later(ev, res):
+            ok += 1
+        qi.locate(ev[0])
+    return ok
+
+def timed(fn, repeat):
+    best = float("inf")
+    out = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = fn()
+        best = min(best, time.perf_counter() - t0)
+    return best, out
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--input_dir", default=str(Path(__file__).resolve().parents[1] / "AI_Developer"))
+    ap.add_argument("--messages", type=int, nargs="+", default=[100, 500, 2000])
+    ap.add_argument("--issues", type=int, default=20)
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--seed", type=int, default=7)
+    args = ap.parse_args()
+
+    rng = random.Random(args.seed)
+    print(f"{'msgs':>6} {'variant':>8} {'legacy ms':>10} {'index ms':>9} {'speedup':>8} {'legacy ok':>10} {'index ok':>9}")
+    for n in args.messages:
+        thread_text, msg_chunks = agent.build_thread_text(long_thread(args.input_dir, n, rng))
+        exact = [(pick_quotes(msg_chunks, rng, 3), pick_quotes(msg_chunks, rng, 2)) for _ in range(args.issues)]
+        wrapped = [([wrap_variant(q) for q in ev], [wrap_variant(q) for q in res]) for ev, res in exact]
+        for label, issues in (("exact", exact), ("wrapped", wrapped)):
+            t_old, ok_old = timed(lambda: legacy_pass(thread_text, msg_chunks, issues), args.repeat)
+            t_new, ok_new = timed(lambda: index_pass(msg_chunks, issues, agent.DEFAULT_QUOTE_MATCH), args.repeat)
+            print(f"{n:>6} {label:>8} {t_old * 1e3:>10.2f} {t_new * 1e3:>9.2f} {t_old / t_new:>7.1f}x {ok_old:>10} {ok_new:>9}")
+
+if __name__ == "__main__":
+    main()
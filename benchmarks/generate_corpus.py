@@ -0,0 +1,148 @@
+"""
+Synthetic corpus generator: email*.txt threads in the AI_Developer/ export format, plus a Colleagues.txt roster.
+
+Mixes both header layouts seen in the real exports (From/To/Cc/Date/Subject and Subject/Date/From/To/Cc),
+"Name email" vs "Name (email)" address styles, RFC 2822 vs "YYYY.MM.DD HH:MM" dates, and Unicode names.
+
+Run:
+  python benchmarks/generate_corpus.py --out_dir bench_corpus --threads 200 --messages 50
+  python benchmarks/generate_corpus.py --out_dir bench_corpus_xl --threads 10000 --messages 500
+"""
+
+import random, argparse, unicodedata
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+FIRST_NAMES = ["Zsuzsa", "István", "Anna", "Gábor", "Péter", "Eszter", "Bence", "Zsófia", "Zoltán", "Ágnes",
+               "Örs", "Réka", "Ünige", "Márton", "Łukasz", "Søren", "José", "Chloé", "Dmitrij", "Naïma"]
+LAST_NAMES = ["Varga", "Nagy", "Kiss", "Horváth", "Kovács", "Szabó", "Tóth", "Farkas", "Molnár", "Fűzfa",
+              "Özdemir", "Dvořák", "Müller", "Ångström", "Nuñez"]
+ROLES = ["Project Manager (PM)", "Business Analyst (BA)", "Senior Developer", "Frontend Developer",
+         "Junior Developer", "Account Manager (AM)", "QA Engineer", "DevOps Engineer"]
+DOMAINS = ["kisjozsitech.hu", "nagyker.hu", "divatkiralynagyker.hu"]
+PROJECTS = ["Project Phoenix", "DivatKirály webshop", "Solar Panel Tender", "Payment Gateway", "Mobile App Revamp"]
+TOPICS = ["Login page specification", "Weekly status", "Staging environment anomaly", "CI/CD pipeline",
+          "Client feedback on demo", "Report export", "User registration process", "Search by SKU"]
+SUBJECT_PREFIXES = ["", "", "Re: ", "RE: ", "Fwd: ", "FW: ", "URGENT: "]
+
+ASKS = [
+    "Could you please take a look at {topic} by {day}?",
+    "Has this been confirmed with the client?",
+    "Can someone own the {topic} follow-up?",
+    "Should it be 8 characters, like in other modules?",
+    "Please send your update on {topic} by end of day.",
+]
+RISKS = [
+    "The {topic} is not working live since yesterday's deployment, there's a lot of panic!",
+    "This wasn't included in the estimate, so the timeline for {topic} is at risk.",
+    "We are blocked on {topic} until the API keys arrive.",
+    "Production errors spiked after the release; {topic} may be affected.",
+]
+RESOLUTIONS = [
+    "I've pushed the fix for {topic}, tested it on staging and it works now.",
+    "The fix is deployed and verified, {topic} is working again.",
+    "Rolled back the release; {topic} is back online.",
+    "Confirmed with the client, we can close {topic}.",
+]
+NOISE = [
+    "Thanks for the update, I'll check it later today.",
+    "Lunch on Friday? Pizza or Mexican, vote please :)",
+    "Sorry, wrong thread!",
+    "Noted, thanks.",
+    "Meeting moved to 14:00 in the small room.",
+]
+
+def ascii_slug(s: str) -> str:
+    return unicodedata.normalize("NFKD", s).encode("ascii", "ignore").decode("ascii").lower()
+
+def make_people(rng: random.Random, n: int):
+    people = []
+    seen = set()
+    while len(people) < n:
+        first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        if (first, last) in seen:
+            continue
+        seen.add((first, last))
+        domain = DOMAINS[0] if rng.random() < 0.85 else rng.choice(DOMAINS[1:])
+        local = f"{ascii_slug(last)}.{ascii_slug(first)}" if rng.random() < 0.5 else f"{ascii_slug(first)}.{ascii_slug(last)}"
+        people.append({"name": f"{first} {last}", "email": f"{local}@{domain}", "role": rng.choice(ROLES)})
+    return people
+
+def fmt_addr(p, paren: bool) -> str:
+    return f"{p['name']} ({p['email']})" if paren else f"{p['name']} {p['email']}"
+
+def fmt_date(dt: datetime, rfc: bool) -> str:
+    if rfc:
+        return dt.strftime("%a, %d %b %Y %H:%M:%S %z")
+    return dt.strftime("%Y.%m.%d %H:%M")
+
+def make_body(rng: random.Random, topic: str, sender, position: int, n_messages: int) -> str:
+    lines = [f"Hi {rng.choice(FIRST_NAMES)},"]
+    roll = rng.random()
+    day = rng.choice(["Monday", "Wednesday", "Friday", "EOD"])
+    if position == 0 or roll < 0.25:
+        lines.append(rng.choice(ASKS).format(topic=topic, day=day))
+    if roll < 0.15:
+        lines.append(rng.choice(RISKS).format(topic=topic))
+    if position > n_messages // 2 and rng.random() < 0.2:
+        lines.append(rng.choice(RESOLUTIONS).format(topic=topic))
+    lines.extend(rng.choice(NOISE) for _ in range(rng.randint(1, 4)))
+    lines.append(sender["name"].split(" ")[0])
+    return "\n".join(lines)
+
+def make_thread(rng: random.Random, people, n_messages: int, start: datetime) -> str:
+    project, topic = rng.choice(PROJECTS), rng.choice(TOPICS)
+    base_subject = f"{project} - {topic}"
+    subject_first = rng.random() < 0.4       # "Subject/Date/From/To/Cc" layout (email7-12 style)
+    paren = subject_first or rng.random() < 0.3
+    rfc = not subject_first and rng.random() < 0.7
+    members = rng.sample(people, k=min(len(people), rng.randint(3, 7)))
+    dt = start
+    blocks = []
+    for i in range(n_messages):
+        sender = rng.choice(members)
+        others = [p for p in members if p is not sender]
+        to = rng.sample(others, k=max(1, min(len(others), rng.randint(1, 3))))
+        cc = rng.sample(others, k=rng.randint(0, min(2, len(others))))
+        subject = (rng.choice(SUBJECT_PREFIXES) if i else "") + base_subject
+        hdr = {
+            "From": fmt_addr(sender, paren),
+            "To": ", ".join(fmt_addr(p, paren) for p in to),
+            "Cc": ", ".join(fmt_addr(p, paren) for p in cc),
+            "Date": fmt_date(dt, rfc),
+            "Subject": subject,
+        }
+        order = ["Subject", "Date", "From", "To", "Cc"] if subject_first else ["From", "To", "Cc", "Date", "Subject"]
+        header = "\n".join(f"{k}: {hdr[k]}" for k in order if k != "Cc" or hdr["Cc"])
+        blocks.append(header + "\n\n" + make_body(rng, topic, sender, i, n_messages))
+        dt += timedelta(minutes=rng.randint(2, 60 * 20))
+    return "\n\n".join(blocks) + "\n"
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--out_dir", default="bench_corpus")
+    ap.add_argument("--threads", type=int, default=200)
+    ap.add_argument("--messages", type=int, default=50, help="Messages per thread (max; see --min_messages)")
+    ap.add_argument("--min_messages", type=int, default=0, help="If set, thread lengths are drawn from [min_messages, messages]")
+    ap.add_argument("--people", type=int, default=40)
+    ap.add_argument("--seed", type=int, default=1)
+    args = ap.parse_args()
+
+    rng = random.Random(args.seed)
+    out = Path(args.out_dir)
+    out.mkdir(parents=True, exist_ok=True)
+    people = make_people(rng, args.people)
+    roster = "Characters:\n" + "\n".join(f"{p['role']}: {p['name']} ({p['email']})" for p in people) + "\n"
+    (out / "Colleagues.txt").write_text(roster, encoding="utf-8")
+
+    start = datetime(2025, 1, 6, 9, 0, tzinfo=timezone(timedelta(hours=2)))
+    total = 0
+    for t in range(1, args.threads + 1):
+        n = rng.randint(args.min_messages, args.messages) if args.min_messages else args.messages
+        text = make_thread(rng, people, n, start + timedelta(hours=rng.randint(0, 24 * 180)))
+        (out / f"email{t}.txt").write_text(text, encoding="utf-8")
+        total += len(text.encode("utf-8"))
+    print(f"Wrote {args.threads} threads ({total / 1e6:.1f} MB) + Colleagues.txt to {out}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+"""
+Benchmark the parsing and guardrail hot paths per stage on a corpus of email*.txt threads.
+
+Reports throughput (threads/s, MB/s), p50/p99 latency per thread and peak traced memory for each stage,
+and can save a baseline and fail on regressions against it. Each stage gets warmup passes, then --repeat
+timed passes; the reported numbers are medians over passes, and the pass-to-pass spread widens the
+regression tolerance so a noisy machine does not fail the gate on unchanged code.
+
+Run:
+  python benchmarks/generate_corpus.py --out_dir bench_corpus --threads 200 --messages 50
+  python benchmarks/run_benchmarks.py --input_dir bench_corpus --save bench_baseline.json
+  python benchmarks/run_benchmarks.py --input_dir bench_corpus --compare bench_baseline.json --threshold 0.15
+"""
+
+import sys, json, time, argparse, platform, tracemalloc
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import email_processing_agent as agent
+
+def percentile(sorted_vals: List[float], pct: float) -> float:
+    if not sorted_vals:
+        return 0.0
+    k = min(len(sorted_vals) - 1, max(0, int(round(pct / 100.0 * (len(sorted_vals) - 1)))))
+    return sorted_vals[k]
+
+def prepare(paths: List[str]) -> Dict[str, List[Any]]:
+    # Inputs for each stage are built once, outside the timed region
+    raws = [Path(p).read_bytes() for p in paths]
+    threads = [agent.parse_email_thread(p) for p in paths]
+    built = [agent.build_thread_text(t) for t in threads]
+    return {
+        "paths": paths,
+        "raws": raws,
+        "threads": threads,
+        "texts": [b[0] for b in built],
+        "chunks": [b[1] for b in built],
+    }
+
+def stages(data: Dict[str, List[Any]]) -> Dict[str, Callable[[int], Any]]:
+    return {
+        # The ingest path: header-run scan of an in-memory buffer, then the pool worker's mmap + parse per file
+        "parse_thread_buffer": lambda i: agent.parse_thread_buffer(data["raws"][i], data["paths"][i]),
+        "ingest_task": lambda i: agent.ingest_task(("thread", data["paths"][i], 0, 0)),
+        "build_thread_text": lambda i: agent.build_thread_text(data["threads"][i]),
+        "redact_emails_in_text": lambda i: agent.redact_emails_in_text(data["texts"][i]),
+        "redact_messages": lambda i: [agent.PSEUDONYMS.redact_message(m) for m in data["threads"][i]],
+        "harvest_resolution_snippets": lambda i: agent.harvest_resolution_snippets(data["chunks"][i], after_msg_index=1, limit=6),
+        "quote_index_build": lambda i: agent.QuoteIndex(data["chunks"][i]),
+    }
+
+# Per-metric tolerance as a multiple of --threshold: tail latency is noisier than throughput, traced memory is not
+METRIC_SCALE = {"threads_per_s": 1.0, "p99_ms": 2.0, "peak_mem_mb": 0.5}
+
+def median(vals: List[float]) -> float:
+    return percentile(sorted(vals), 50)
+
+def rel_spread(vals: List[float]) -> float:
+    # (max - min) / median over passes: how far apart two runs of unchanged code can land
+    m = median(vals)
+    return (max(vals) - min(vals)) / m if m else 0.0
+
+def run_stage(fn: Callable[[int], Any], n: int, repeat: int, warmup: int = 1) -> Dict[str, Any]:
+    for _ in range(warmup):
+        for i in range(n):
+            fn(i)
+    passes: Dict[str, List[float]] = {"threads_per_s": [], "p50_ms": [], "p99_ms": []}
+    total = 0.0
+    for _ in range(repeat):
+        lat: List[float] = []
+        for i in range(n):
+            t0 = time.perf_counter()
+            fn(i)
+            lat.append(time.perf_counter() - t0)
+        lat.sort()
+        total += sum(lat)
+        passes["threads_per_s"].append(n / sum(lat) if sum(lat) else 0.0)
+        passes["p50_ms"].append(percentile(lat, 50) * 1e3)
+        passes["p99_ms"].append(percentile(lat, 99) * 1e3)
+    # Peak memory in a separate pass so tracemalloc overhead doesn't skew latencies
+    tracemalloc.start()
+    for i in range(n):
+        fn(i)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        **{k: median(v) for k, v in passes.items()},
+        "total_s": total,
+        "peak_mem_mb": peak / 1e6,
+        "spread": {k: round(rel_spread(passes[k]), 4) for k in ("threads_per_s", "p99_ms")},
+    }
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> List[str]:
+    # Worse than baseline by more than the metric's tolerance is a regression. The tolerance is
+    # threshold x METRIC_SCALE, widened to the larger pass-to-pass spread seen in either run.
+    regressions: List[str] = []
+    for stage, cur in current["stages"].items():
+        base = baseline.get("stages", {}).get(stage)
+        if not base:
+            continue
+        checks = [
+            ("threads_per_s", base["threads_per_s"] / max(cur["threads_per_s"], 1e-12) - 1),
+            ("p99_ms", cur["p99_ms"] / max(base["p99_ms"], 1e-12) - 1),
+            ("peak_mem_mb", cur["peak_mem_mb"] / max(base["peak_mem_mb"], 1e-12) - 1),
+        ]
+        for metric, worse_by in checks:
+            noise = max((base.get("spread") or {}).get(metric, 0.0), (cur.get("spread") or {}).get(metric, 0.0))
+            tolerance = max(threshold * METRIC_SCALE[metric], noise)
+            if worse_by > tolerance:
+                regressions.append(f"{stage}.{metric}: {worse_by * 100:.1f}% worse than baseline (tolerance {tolerance * 100:.0f}%)")
+    return regressions
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--input_dir", default="bench_corpus", help="Folder containing email*.txt (see generate_corpus.py)")
+    ap.add_argument("--limit", type=int, default=0, help="Only use the first N files (0 = all)")
+    ap.add_argument("--repeat", type=int, default=5, help="Timed passes per stage; medians over passes are reported")
+    ap.add_argument("--warmup", type=int, default=1, help="Untimed passes per stage before measuring")
+    ap.add_argument("--stages", nargs="*", default=None, help="Subset of stages to run")
+    ap.add_argument("--save", default=None, help="Write results JSON (e.g. as a new baseline)")
+    ap.add_argument("--compare", default=None, help="Baseline JSON to compare against")
+    ap.add_argument("--threshold", type=float, default=0.15,
+                    help="Allowed relative regression before failing (x2 for p99, x0.5 for memory; never below the measured spread)")
+    args = ap.parse_args()
+
+    paths = sorted(str(p) for p in Path(args.input_dir).glob("email*.txt"))
+    if args.limit:
+        paths = paths[:args.limit]
+    if not paths:
+        raise SystemExit(f"No email*.txt files in {args.input_dir}. Generate some with benchmarks/generate_corpus.py")
+
+    data = prepare(paths)
+    n = len(paths)
+    corpus_mb = sum(len(r) for r in data["raws"]) / 1e6
+    n_msgs = sum(len(t) for t in data["threads"])
+    results: Dict[str, Any] = {
+        "python": platform.python_version(),
+        "corpus": {"threads": n, "messages": n_msgs, "mb": round(corpus_mb, 2)},
+        "stages": {},
+    }
+
+    print(f"Corpus: {n} threads, {n_msgs} messages, {corpus_mb:.1f} MB")
+    print(f"{'stage':<30} {'threads/s':>10} {'MB/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'peak MB':>8}")
+    for name, fn in stages(data).items():
+        if args.stages and name not in args.stages:
+            continue
+        r = run_stage(fn, n, args.repeat, args.warmup)
+        r["mb_per_s"] = corpus_mb * args.repeat / r["total_s"] if r["total_s"] else 0.0
+        results["stages"][name] = r
+        print(f"{name:<30} {r['threads_per_s']:>10.1f} {r['mb_per_s']:>8.1f} {r['p50_ms']:>8.3f} {r['p99_ms']:>8.3f} {r['peak_mem_mb']:>8.2f}")
+
+    if args.save:
+        Path(args.save).write_text(json.dumps(results, indent=2), encoding="utf-8")
+        print(f"Saved results to {args.save}")
+
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text(encoding="utf-8"))
+        if baseline.get("corpus") != results["corpus"]:
+            print(f"WARNING: corpus differs from baseline ({baseline.get('corpus')} vs {results['corpus']})")
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print("REGRESSIONS:")
+            for r in regressions:
+                print(f"  - {r}")
+            sys.exit(1)
+        print(f"No regressions beyond tolerance against {args.compare}")
+
+if __name__ == "__main__":
+    main()
@@ -4,22 +4,28 @@ Run (PowerShell):
   python .\email_processing_agent.py --input_dir .\AI_Developer --out_json report.json --out_md report.md --redact
 """
 
-import os, re, glob, json, hashlib
-from dataclasses import dataclass
+import os, re, glob, json, hashlib, asyncio, sqlite3, time, textwrap, functools, bisect, unicodedata, mmap, contextlib, heapq, random, struct
+import email.utils, email.header, email.policy
+from abc import ABC, abstractmethod
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field, replace
 from datetime import datetime, timezone
-from typing import List, Optional, Dict, Any, Literal, Tuple
+from typing import List, Optional, Dict, Any, Literal, Tuple, Iterable, Iterator, Callable, Awaitable
 from pathlib import Path
 
-# LangChain + OpenAI integration 
-try:
-    from langchain_openai import ChatOpenAI
-    from langchain_core.prompts import ChatPromptTemplate
-except Exception as e:
-    raise SystemExit(
-        "Missing dependency: langchain / langchain-openai. Install with:\n"
-        "  pip install langchain langchain-openai\n"
-        f"Import error: {e}"
-    )
+# LangChain + OpenAI integration (imported lazily: only the live backends need it)
+@functools.lru_cache(maxsize=None)
+def require_langchain():
+    try:
+        from langchain_openai import ChatOpenAI
+        from langchain_core.prompts import ChatPromptTemplate
+    except Exception as e:
+        raise SystemExit(
+            "Missing dependency: langchain / langchain-openai. Install with:\n"
+            "  pip install langchain langchain-openai\n"
+            f"Import error: {e}"
+        )
+    return ChatOpenAI, ChatPromptTemplate
 
 try:
     from pydantic import BaseModel, Field
@@ -33,6 +39,10 @@ except Exception as e:
 ANALYZE_MODEL   = os.getenv("OPENAI_ANALYZE_MODEL", "gpt-4o-mini")
 RESOLVE_MODEL   = os.getenv("OPENAI_RESOLVE_MODEL", "gpt-4o-mini")
 SUMMARY_MODEL   = os.getenv("OPENAI_SUMMARY_MODEL", "gpt-5-mini")
+# Cascade fast tier (--cascade): tried first, the models above are the strong tier escalated to
+ANALYZE_FAST_MODEL = os.getenv("OPENAI_ANALYZE_FAST_MODEL", "gpt-4.1-nano")
+RESOLVE_FAST_MODEL = os.getenv("OPENAI_RESOLVE_FAST_MODEL", "gpt-4.1-nano")
+SUMMARY_FAST_MODEL = os.getenv("OPENAI_SUMMARY_FAST_MODEL", "gpt-5-nano")
 
 # Prompts
 THREAD_SYSTEM = (
@@ -90,6 +100,30 @@ CANDIDATE_RESOLUTION_SNIPPETS (may be empty):
 {candidate_snippets}
 """
 
+RESOLVE_BATCH_USER = """Decide, for EACH issue below, whether it is resolved by the END of the thread.
+
+Inputs:
+- THREAD (verbatim)
+- ISSUES_JSON: list of issues, each with issue_id, title, flag, level, problem evidence quotes
+  and candidate_resolution_snippets (machine-selected snippets that may indicate resolution)
+
+Rules (strict):
+1) Return exactly one decision per issue, with the same issue_id.
+2) status must be one of: resolved|unresolved|unknown.
+3) If status=resolved, you MUST provide 1-3 resolution_quotes copied verbatim from the thread that show:
+   - a fix was applied/deployed OR completion happened AND
+   - confirmation/verification (e.g., tested, working again) when available.
+4) resolution_quotes should come from later messages than that issue's problem evidence (chronologically).
+5) rationale_status: 1-2 sentences explaining why you chose the status.
+6) Judge each issue on its own; do not reuse one issue's proof for another unless it clearly covers both.
+
+THREAD:
+{thread_text}
+
+ISSUES_JSON:
+{issues_json}
+"""
+
 SUMMARY_SYSTEM = (
     "You write concise executive summaries for Directors.\n"
     "Use only the provided unresolved/unknown items.\n"
@@ -108,6 +142,40 @@ PAYLOAD_JSON:
 {payload_json}
 """
 
+SUMMARY_BATCH_USER = """Create a Portfolio Health summary for EACH thread below.
+
+Rules:
+- Return exactly one summary per thread, with the same thread_id.
+- For each thread: group by Attention Flag A and B, using only that thread's items with status='unresolved' and 'unknown' (unknown -> needs clarification).
+- Each bullet MUST reference evidence IDs like [E1], [E2] from THAT thread's evidence; IDs are per thread and never shared across threads.
+- Keep each summary short and actionable.
+
+THREADS_JSON (list of {{thread_id, attention_flag_A, attention_flag_B, evidence}}):
+{threads_json}
+"""
+
+PORTFOLIO_SYSTEM = (
+    "You write portfolio-level briefings for Directors.\n"
+    "Use only the provided thread summaries and clusters.\n"
+    "Do not invent facts."
+)
+
+PORTFOLIO_USER = """Create a portfolio overview across all threads below.
+
+Rules:
+- Lead with the most severe open risks/blockers, then unresolved action items, then items needing clarification.
+- Merge items that describe the same problem across threads; CROSS_THREAD_CLUSTERS lists known duplicates.
+- Reference threads by their id in backticks, e.g. `email7`. Do not use evidence IDs (they are per thread).
+- At most 12 bullets. Short and actionable.
+- ITEMS_JSON holds either per-thread summaries or partial portfolio overviews of earlier batches; combine them.
+
+CROSS_THREAD_CLUSTERS:
+{clusters_json}
+
+ITEMS_JSON:
+{items_json}
+"""
+
 # Structured output schemas
 FlagType = Literal["A_unresolved_action_item", "B_emerging_risk_blocker"]
 LevelType = Literal["low", "medium", "high"]
@@ -128,34 +196,314 @@ class ResolutionDecision(BaseModel):
     rationale_status: str
     resolution_quotes: List[str] = Field(default_factory=list)
 
+class IssueResolution(ResolutionDecision):
+    issue_id: str
+
+class ThreadResolutions(BaseModel):
+    decisions: List[IssueResolution] = Field(default_factory=list)
+
 class SummaryResult(BaseModel):
     summary_md: str
 
+class ThreadSummary(SummaryResult):
+    thread_id: str
+
+class ThreadSummaries(BaseModel):
+    summaries: List[ThreadSummary] = Field(default_factory=list)
+
 # LCEL chain builder with compatibility fallback
-def structured_chain(prompt: ChatPromptTemplate, model: str, schema):
-    llm = ChatOpenAI(model=model, temperature=0)
+def structured_chain(prompt, model: str, schema, include_raw: bool = False):
+    ChatOpenAI, _ = require_langchain()
+    # Retries and pacing are done by RequestScheduler, so the client must not retry on its own
+    llm = ChatOpenAI(model=model, temperature=0, max_retries=0)
     try:
-        return prompt | llm.with_structured_output(schema, method="json_schema")
+        return prompt | llm.with_structured_output(schema, method="json_schema", include_raw=include_raw)
     except TypeError:
-        return prompt | llm.with_structured_output(schema)
-
-draft_chain = structured_chain(
-    ChatPromptTemplate.from_messages([("system", THREAD_SYSTEM), ("human", THREAD_USER)]),
-    ANALYZE_MODEL,
-    ThreadIssuesDraft,
-)
-
-resolve_chain = structured_chain(
-    ChatPromptTemplate.from_messages([("system", RESOLVE_SYSTEM), ("human", RESOLVE_USER)]),
-    RESOLVE_MODEL,
-    ResolutionDecision,
-)
-
-summary_chain = structured_chain(
-    ChatPromptTemplate.from_messages([("system", SUMMARY_SYSTEM), ("human", SUMMARY_USER)]),
-    SUMMARY_MODEL,
-    SummaryResult,
-)
+        return prompt | llm.with_structured_output(schema, include_raw=include_raw)
+
+STAGE_PROMPTS: Dict[str, Tuple[str, str]] = {
+    "draft": (THREAD_SYSTEM, THREAD_USER),
+    "resolve": (RESOLVE_SYSTEM, RESOLVE_USER),
+    "resolve_batch": (RESOLVE_SYSTEM, RESOLVE_BATCH_USER),
+    "summary": (SUMMARY_SYSTEM, SUMMARY_USER),
+    "summary_batch": (SUMMARY_SYSTEM, SUMMARY_BATCH_USER),
+    "portfolio": (PORTFOLIO_SYSTEM, PORTFOLIO_USER),
+}
+STAGE_MODELS: Dict[str, str] = {"draft": ANALYZE_MODEL, "resolve": RESOLVE_MODEL, "resolve_batch": RESOLVE_MODEL, "summary": SUMMARY_MODEL,
+                                "summary_batch": SUMMARY_MODEL, "portfolio": SUMMARY_MODEL}
+FAST_STAGE_MODELS: Dict[str, str] = {"draft": ANALYZE_FAST_MODEL, "resolve": RESOLVE_FAST_MODEL, "resolve_batch": RESOLVE_FAST_MODEL,
+                                     "summary": SUMMARY_FAST_MODEL, "summary_batch": SUMMARY_FAST_MODEL, "portfolio": SUMMARY_FAST_MODEL}
+STAGE_SCHEMAS: Dict[str, Any] = {"draft": ThreadIssuesDraft, "resolve": ResolutionDecision, "resolve_batch": ThreadResolutions, "summary": SummaryResult,
+                                 "summary_batch": ThreadSummaries, "portfolio": SummaryResult}
+
+def stage_prompt(stage: str):
+    _, ChatPromptTemplate = require_langchain()
+    system, user = STAGE_PROMPTS[stage]
+    return ChatPromptTemplate.from_messages([("system", system), ("human", user)])
+
+# Persistent LLM response cache (content-addressed, SQLite)
+DEFAULT_CACHE_DIR = os.getenv("AGENT_CACHE_DIR", ".llm_cache")
+CACHE_MAX_MB = float(os.getenv("AGENT_CACHE_MAX_MB", "256"))
+CACHE_MAX_AGE_DAYS = float(os.getenv("AGENT_CACHE_MAX_AGE_DAYS", "30"))
+
+def sha256_hex(s: str) -> str:
+    return hashlib.sha256(s.encode("utf-8")).hexdigest()
+
+def prompt_hash(stage: str) -> str:
+    system, user = STAGE_PROMPTS[stage]
+    return sha256_hex(system + "\x00" + user)
+
+def request_key(stage: str, model: str, inputs: Dict[str, Any], attempt: int = 1) -> str:
+    payload = json.dumps(inputs, ensure_ascii=False, sort_keys=True)
+    return sha256_hex(f"{model}\x00{prompt_hash(stage)}\x00{sha256_hex(payload)}\x00{attempt}")
+
+class LLMCache:
+    def __init__(self, cache_dir: str, max_mb: float = CACHE_MAX_MB, max_age_days: float = CACHE_MAX_AGE_DAYS):
+        Path(cache_dir).mkdir(parents=True, exist_ok=True)
+        self.path = str(Path(cache_dir) / "llm_cache.sqlite3")
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.max_age_s = max_age_days * 86400
+        self.hits: Dict[str, int] = {}
+        self.misses: Dict[str, int] = {}
+        self.db = sqlite3.connect(self.path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY, stage TEXT NOT NULL, model TEXT NOT NULL, value TEXT NOT NULL,"
+            " size INTEGER NOT NULL, created_at REAL NOT NULL, last_used REAL NOT NULL)"
+        )
+        self.db.commit()
+        self.evict()
+
+    def get(self, stage: str, key: str) -> Optional[str]:
+        row = self.db.execute("SELECT value, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+        now = time.time()
+        if row is None or (self.max_age_s > 0 and now - row[1] > self.max_age_s):
+            self.misses[stage] = self.misses.get(stage, 0) + 1
+            return None
+        self.db.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+        self.db.commit()
+        self.hits[stage] = self.hits.get(stage, 0) + 1
+        return row[0]
+
+    def put(self, stage: str, model: str, key: str, value: str) -> None:
+        now = time.time()
+        self.db.execute(
+            "INSERT OR REPLACE INTO responses (key, stage, model, value, size, created_at, last_used) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (key, stage, model, value, len(value.encode("utf-8")), now, now),
+        )
+        self.db.commit()
+
+    def evict(self) -> None:
+        # Age first, then least-recently-used entries until the store fits the size budget
+        if self.max_age_s > 0:
+            self.db.execute("DELETE FROM responses WHERE created_at < ?", (time.time() - self.max_age_s,))
+        if self.max_bytes > 0:
+            total = 0
+            stale: List[Tuple[str]] = []
+            for key, size in self.db.execute("SELECT key, size FROM responses ORDER BY last_used DESC"):
+                total += size
+                if total > self.max_bytes:
+                    stale.append((key,))
+            self.db.executemany("DELETE FROM responses WHERE key = ?", stale)
+        self.db.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": True,
+            "path": self.path,
+            "hits": dict(self.hits),
+            "misses": dict(self.misses),
+            "hit_total": sum(self.hits.values()),
+            "miss_total": sum(self.misses.values()),
+        }
+
+    def close(self) -> None:
+        self.evict()
+        self.db.close()
+
+# LLM backends: live OpenAI, record (live + fixtures), replay (fixtures only) and a deterministic stub
+BACKENDS = ("openai", "record", "replay", "stub")
+DEFAULT_BACKEND = os.getenv("AGENT_LLM_BACKEND", "openai")
+DEFAULT_FIXTURES_DIR = os.getenv("AGENT_FIXTURES_DIR", os.path.join("fixtures", "llm"))
+DEFAULT_STUB_LATENCY_MS = float(os.getenv("AGENT_STUB_LATENCY_MS", "0"))
+
+class LLMBackend(ABC):
+    name = "base"
+    needs_api_key = False
+    # Whether responses may be stored in / served from the persistent LLMCache
+    cacheable = False
+    # Whether calls count against provider rate limits (paced by RequestScheduler)
+    rate_limited = False
+
+    async def ainvoke(self, stage: str, inputs: Dict[str, Any], attempt: int = 1, model: Optional[str] = None):
+        return (await self.acall(stage, inputs, attempt, model))[0]
+
+    @abstractmethod
+    async def acall(self, stage: str, inputs: Dict[str, Any], attempt: int = 1, model: Optional[str] = None) -> Tuple[Any, Optional[Dict[str, Any]]]:
+        # (parsed result, provider usage metadata or None when the backend doesn't report token usage);
+        # model defaults to the stage's configured model
+        ...
+
+class OpenAIBackend(LLMBackend):
+    name = "openai"
+    needs_api_key = True
+    cacheable = True
+    rate_limited = True
+
+    def __init__(self):
+        self._chains: Dict[Tuple[str, str], Any] = {}
+
+    def chain(self, stage: str, model: Optional[str] = None):
+        # Chains (and the ChatOpenAI clients behind them) are built on first use, one per (stage, model)
+        model = model or STAGE_MODELS[stage]
+        if (stage, model) not in self._chains:
+            self._chains[(stage, model)] = structured_chain(stage_prompt(stage), model, STAGE_SCHEMAS[stage], include_raw=True)
+        return self._chains[(stage, model)]
+
+    async def acall(self, stage: str, inputs: Dict[str, Any], attempt: int = 1, model: Optional[str] = None):
+        # include_raw keeps the AIMessage so its usage_metadata (input/output/cached tokens) can be reported
+        out = await self.chain(stage, model).ainvoke(inputs)
+        if out.get("parsing_error") is not None:
+            raise out["parsing_error"]
+        if out.get("parsed") is None:
+            raise ValueError(f"{stage}: model returned no structured output")
+        return out["parsed"], getattr(out.get("raw"), "usage_metadata", None)
+
+def fixture_path(fixtures_dir: str, stage: str, inputs: Dict[str, Any], attempt: int, model: Optional[str] = None) -> Path:
+    return Path(fixtures_dir) / stage / f"{request_key(stage, model or STAGE_MODELS[stage], inputs, attempt)}.json"
+
+class RecordBackend(OpenAIBackend):
+    name = "record"
+    # Always go to the network so every response of the run lands in the fixtures
+    cacheable = False
+
+    def __init__(self, fixtures_dir: str = DEFAULT_FIXTURES_DIR):
+        super().__init__()
+        self.fixtures_dir = fixtures_dir
+
+    async def acall(self, stage: str, inputs: Dict[str, Any], attempt: int = 1, model: Optional[str] = None):
+        result, usage = await super().acall(stage, inputs, attempt, model)
+        fp = fixture_path(self.fixtures_dir, stage, inputs, attempt, model)
+        fp.parent.mkdir(parents=True, exist_ok=True)
+        fp.write_text(json.dumps({
+            "stage": stage,
+            "model": model or STAGE_MODELS[stage],
+            "attempt": attempt,
+            "inputs": inputs,
+            "output": result.model_dump(),
+            "usage": dict(usage) if usage else None,
+        }, ensure_ascii=False, indent=2), encoding="utf-8")
+        return result, usage
+
+class ReplayBackend(LLMBackend):
+    name = "replay"
+
+    def __init__(self, fixtures_dir: str = DEFAULT_FIXTURES_DIR):
+        self.fixtures_dir = fixtures_dir
+
+    async def acall(self, stage: str, inputs: Dict[str, Any], attempt: int = 1, model: Optional[str] = None):
+        fp = fixture_path(self.fixtures_dir, stage, inputs, attempt, model)
+        if not fp.exists():
+            raise LookupError(
+                f"No recorded {stage} response for this input in {self.fixtures_dir} (expected {fp.name}). "
+                "Re-record with --backend record."
+            )
+        data = json.loads(fp.read_text(encoding="utf-8"))
+        return STAGE_SCHEMAS[stage].model_validate(data["output"]), data.get("usage")
+
+class StubBackend(LLMBackend):
+    # Schema-valid, input-grounded answers with simulated latency, to load-test the pipeline without a model
+    name = "stub"
+
+    def __init__(self, latency_ms: float = DEFAULT_STUB_LATENCY_MS, jitter: float = 0.2, max_issues: int = 3):
+        self.latency_s = max(0.0, latency_ms) / 1000.0
+        self.jitter = jitter
+        self.max_issues = max_issues
+
+    async def acall(self, stage: str, inputs: Dict[str, Any], attempt: int = 1, model: Optional[str] = None):
+        if self.latency_s:
+            # Deterministic per-request jitter so runs are reproducible
+            h = int(request_key(stage, model or STAGE_MODELS[stage], inputs, attempt)[:8], 16) / 0xFFFFFFFF
+            await asyncio.sleep(self.latency_s * (1 + self.jitter * (2 * h - 1)))
+        return getattr(self, f"_{stage}")(inputs), None
+
+    def _draft(self, inputs: Dict[str, Any]) -> ThreadIssuesDraft:
+        issues: List[IssueDraft] = []
+        for chunk in inputs["thread_text"].split("\n---\n"):
+            body = chunk.split("Body:\n", 1)[-1]
+            for line in body.splitlines():
+                line = line.strip()
+                if len(line) < 20:
+                    continue
+                if line.endswith("?") or "URGENT" in line.upper():
+                    flag = "A_unresolved_action_item" if line.endswith("?") else "B_emerging_risk_blocker"
+                    issues.append(IssueDraft(
+                        flag=flag,
+                        title=line[:60],
+                        severity_or_priority="high" if "URGENT" in line.upper() else "medium",
+                        rationale_flag_level="Stub: question or urgency cue in the message.",
+                        evidence_quotes=[line],
+                    ))
+                    break
+            if len(issues) >= self.max_issues:
+                break
+        return ThreadIssuesDraft(issues=issues)
+
+    @staticmethod
+    def _decide(candidates: List[str]) -> ResolutionDecision:
+        if candidates:
+            return ResolutionDecision(status="resolved", rationale_status="Stub: later resolution cue found.", resolution_quotes=candidates[:1])
+        return ResolutionDecision(status="unresolved", rationale_status="Stub: no later resolution cue.")
+
+    def _resolve(self, inputs: Dict[str, Any]) -> ResolutionDecision:
+        return self._decide(json.loads(inputs["candidate_snippets"]))
+
+    def _resolve_batch(self, inputs: Dict[str, Any]) -> ThreadResolutions:
+        decisions = []
+        for item in json.loads(inputs["issues_json"]):
+            d = self._decide(item.get("candidate_resolution_snippets") or [])
+            decisions.append(IssueResolution(issue_id=item["issue_id"], **d.model_dump()))
+        return ThreadResolutions(decisions=decisions)
+
+    def _summary(self, inputs: Dict[str, Any]) -> SummaryResult:
+        return self._summarize(json.loads(inputs["payload_json"]))
+
+    def _summary_batch(self, inputs: Dict[str, Any]) -> ThreadSummaries:
+        return ThreadSummaries(summaries=[
+            ThreadSummary(thread_id=p["thread_id"], summary_md=self._summarize(p).summary_md) for p in json.loads(inputs["threads_json"])
+        ])
+
+    def _portfolio(self, inputs: Dict[str, Any]) -> SummaryResult:
+        # Per-thread items become one bullet each; partial overviews of a previous level are concatenated
+        lines: List[str] = []
+        for item in json.loads(inputs["items_json"]):
+            if "thread_id" in item:
+                lines.append(f"- `{item['thread_id']}`: {item['open_items']} open items")
+            else:
+                lines.extend(item["summary_md"].splitlines())
+        return SummaryResult(summary_md="\n".join(lines) or "No open items.")
+
+    @staticmethod
+    def _summarize(payload: Dict[str, Any]) -> SummaryResult:
+        lines: List[str] = []
+        for label, key in (("A", "attention_flag_A"), ("B", "attention_flag_B")):
+            items = payload.get(key) or []
+            if items:
+                lines.append(f"**Flag {label}**")
+                lines.extend(f"- {x['title']}" + "".join(f" [{i}]" for i in x.get("evidence_ids", [])) for x in items)
+        return SummaryResult(summary_md="\n".join(lines) or "No open items.")
+
+def make_backend(name: str = DEFAULT_BACKEND, fixtures_dir: str = DEFAULT_FIXTURES_DIR, stub_latency_ms: float = DEFAULT_STUB_LATENCY_MS) -> LLMBackend:
+    if name == "openai":
+        return OpenAIBackend()
+    if name == "record":
+        return RecordBackend(fixtures_dir)
+    if name == "replay":
+        return ReplayBackend(fixtures_dir)
+    if name == "stub":
+        return StubBackend(latency_ms=stub_latency_ms)
+    raise ValueError(f"Unknown LLM backend: {name!r} (expected one of {', '.join(BACKENDS)})")
 
 # Email parsing
 EMAIL_RE = re.compile(r'[\w\.\-]+@[\w\.\-]+\.\w+')
@@ -177,6 +525,9 @@ class EmailMessage:
     date: datetime
     subject: str
     body: str
+    # RFC 822 sources only (.eml / mbox): used to group replies into threads
+    message_id: str = ""
+    references: List[str] = field(default_factory=list)
 
 def parse_date(s: str) -> datetime:
     s = (s or "").strip()
@@ -188,48 +539,34 @@ def parse_date(s: str) -> datetime:
             return dt
         except Exception:
             continue
+    try:
+        # Real-world RFC 2822 variants: no weekday, "(CEST)" comments, obsolete zone names
+        dt = email.utils.parsedate_to_datetime(s)
+        return dt if dt.tzinfo is not None else dt.replace(tzinfo=timezone.utc)
+    except Exception:
+        pass
     return datetime.now(timezone.utc)
 
 def extract_emails(s: str) -> List[str]:
     return [e.lower() for e in EMAIL_RE.findall(s or "")]
 
-def split_messages(raw: str) -> List[str]:
-    raw = (raw or "").strip()
-    if not raw:
-        return []
-    if re.search(r"(?m)^Subject:\s", raw):
-        parts = re.split(r"(?m)^(?=Subject:\s)", raw)
-    else:
-        parts = re.split(r"(?m)^(?=From:\s)", raw)
-    return [p.strip() for p in parts if p.strip()]
-
 def parse_email_thread(path: str) -> List[EmailMessage]:
-    raw = Path(path).read_text(encoding="utf-8")
-    blocks = split_messages(raw)
-    msgs: List[EmailMessage] = []
-    tid = Path(path).stem
-    for b in blocks:
-        lines = b.splitlines()
-        hdr: Dict[str, str] = {}
-        i = 0
-        while i < len(lines) and re.match(r"^(From|To|Cc|Date|Subject):", lines[i]):
-            k, v = lines[i].split(":", 1)
-            hdr[k.lower().strip()] = v.strip()
-            i += 1
-        body = "\n".join(lines[i:]).strip()
-        from_email = (extract_emails(hdr.get("from",""))[:1] or ["unknown"])[0]
-        msgs.append(EmailMessage(
-            thread_id=tid,
-            source_file=Path(path).name,
-            from_email=from_email,
-            to_emails=extract_emails(hdr.get("to","")),
-            cc_emails=extract_emails(hdr.get("cc","")),
-            date=parse_date(hdr.get("date","")),
-            subject=(hdr.get("subject","") or "").strip(),
-            body=body,
-        ))
-    msgs.sort(key=lambda m: m.date)
-    return msgs
+    # The file is memory-mapped and scanned once for header runs; only one message is decoded at a time
+    with mapped_file(path) as buf:
+        return parse_thread_buffer(buf, path)
+
+def make_message(tid: str, source_file: str, hdr: Dict[str, str], body: str) -> EmailMessage:
+    from_email = (extract_emails(hdr.get("from",""))[:1] or ["unknown"])[0]
+    return EmailMessage(
+        thread_id=tid,
+        source_file=source_file,
+        from_email=from_email,
+        to_emails=extract_emails(hdr.get("to","")),
+        cc_emails=extract_emails(hdr.get("cc","")),
+        date=parse_date(hdr.get("date","")),
+        subject=(hdr.get("subject","") or "").strip(),
+        body=body,
+    )
 
 def build_thread_text(thread: List[EmailMessage]) -> Tuple[str, List[str]]:
     chunks = []
@@ -245,46 +582,576 @@ def build_thread_text(thread: List[EmailMessage]) -> Tuple[str, List[str]]:
         )
     return "\n---\n".join(chunks).strip(), chunks
 
+# Ingestion: email*.txt thread files, .eml files and mbox archives, memory-mapped and parsed in a process pool
+TXT_THREAD_GLOB = "email*.txt"
+RFC822_GLOBS = ("**/*.eml", "**/*.mbox", "**/mbox")
+DEFAULT_INGEST_WORKERS = int(os.getenv("AGENT_INGEST_WORKERS", "0"))   # 0 = one per CPU (max 8), 1 = in-process
+INGEST_POOL_MIN_BYTES = int(os.getenv("AGENT_INGEST_POOL_MIN_MB", "8")) * 1024 * 1024
+MBOX_SPLIT_BYTES = int(os.getenv("AGENT_MBOX_SPLIT_MB", "64")) * 1024 * 1024
+
+# email*.txt: one match per run of header lines; each run starts a message (header order varies between exports)
+TXT_HEADER_RUN_RE = re.compile(rb"(?m)^(?:(?:From|To|Cc|Date|Subject):[^\n]*(?:\n|\Z))+")
+# RFC 822: every header field of a message in one pass, folded continuation lines included
+RFC822_HEADER_RE = re.compile(rb"(?m)^([!-9;-~]+):[ \t]*([^\r\n]*(?:\r?\n[ \t][^\r\n]*)*)")
+RFC822_HEADER_END_RE = re.compile(rb"\r?\n\r?\n")
+RFC822_FOLD_RE = re.compile(rb"\r?\n[ \t]+")
+MBOX_FROM_RE = re.compile(rb"(?m)^From ")
+MBOX_ESCAPED_FROM_RE = re.compile(rb"(?m)^>(>*From )")
+MSG_ID_RE = re.compile(r"<[^<>\s]+>")
+CHARSET_RE = re.compile(r"charset=\"?([\w.:-]+)", re.IGNORECASE)
+
+@contextlib.contextmanager
+def mapped_file(path: str):
+    # Read-only mmap of the whole file (b"" for empty files, which can't be mapped)
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            yield b""
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            yield mm
+
+def decode_bytes(b: bytes, charset: str = "utf-8") -> str:
+    try:
+        return b.decode(charset, errors="replace")
+    except LookupError:
+        return b.decode("utf-8", errors="replace")
+
+def parse_thread_buffer(buf, path: str) -> List[EmailMessage]:
+    tid, name = Path(path).stem, Path(path).name
+    msgs: List[EmailMessage] = []
+    hdr: Optional[Dict[str, str]] = None
+    pos = 0
+
+    def emit(end: int) -> None:
+        body = decode_bytes(buf[pos:end]).strip()
+        # Text before the first header run only counts as a message if it isn't blank
+        if hdr is not None or body:
+            msgs.append(make_message(tid, name, hdr or {}, body))
+
+    for m in TXT_HEADER_RUN_RE.finditer(buf):
+        emit(m.start())
+        hdr = {}
+        for line in decode_bytes(m.group(0)).split("\n"):
+            if line:
+                k, v = line.split(":", 1)
+                hdr[k.lower().strip()] = v.strip()
+        pos = m.end()
+    emit(len(buf))
+    msgs.sort(key=lambda m: m.date)
+    return msgs
+
+def rfc822_headers(block: bytes) -> Dict[str, str]:
+    hdr: Dict[str, str] = {}
+    for m in RFC822_HEADER_RE.finditer(block):
+        k = m.group(1).decode("ascii", errors="replace").lower()
+        if k in hdr:
+            continue
+        v = RFC822_FOLD_RE.sub(b" ", m.group(2)).strip()
+        if b"=?" in v:
+            try:
+                hdr[k] = str(email.header.make_header(email.header.decode_header(v.decode("ascii", errors="replace"))))
+                continue
+            except Exception:
+                pass
+        hdr[k] = decode_bytes(v)
+    return hdr
+
+def rfc822_body(raw: bytes, hdr: Dict[str, str], body: bytes) -> str:
+    ctype = hdr.get("content-type", "text/plain").lower()
+    cte = hdr.get("content-transfer-encoding", "").strip().lower()
+    if not ctype.startswith("multipart/") and cte in ("", "7bit", "8bit", "binary"):
+        cs = CHARSET_RE.search(ctype)
+        return decode_bytes(body, cs.group(1) if cs else "utf-8")
+    # MIME structure or transfer encoding: the stdlib parser picks and decodes the text part (this message only)
+    msg = email.message_from_bytes(raw, policy=email.policy.default)
+    part = msg.get_body(preferencelist=("plain", "html"))
+    try:
+        return part.get_content() if part is not None else ""
+    except Exception:
+        return decode_bytes(body)
+
+def parse_rfc822(raw: bytes, source_file: str) -> EmailMessage:
+    end = RFC822_HEADER_END_RE.search(raw)
+    head, body = (raw[:end.start()], raw[end.end():]) if end else (raw, b"")
+    hdr = rfc822_headers(head)
+    m = make_message("", source_file, hdr, rfc822_body(raw, hdr, body).strip())
+    m.message_id = (MSG_ID_RE.findall(hdr.get("message-id", "")) or [""])[0]
+    m.references = MSG_ID_RE.findall(hdr.get("references", "")) + [
+        r for r in MSG_ID_RE.findall(hdr.get("in-reply-to", "")) if r not in hdr.get("references", "")
+    ]
+    return m
+
+def mbox_ranges(path: str, split_bytes: int = MBOX_SPLIT_BYTES) -> List[Tuple[int, int]]:
+    # Byte ranges of roughly split_bytes, cut at "From " separator lines so each range holds whole messages
+    with mapped_file(path) as buf:
+        size = len(buf)
+        ranges: List[Tuple[int, int]] = []
+        start = 0
+        while start < size:
+            cut = buf.find(b"\nFrom ", min(start + max(split_bytes, 1), size))
+            end = size if cut < 0 else cut + 1
+            ranges.append((start, end))
+            start = end
+    return ranges
+
+def parse_mbox_range(buf, start: int, end: int, source_file: str) -> List[EmailMessage]:
+    msgs: List[EmailMessage] = []
+    seps = [m.start() for m in MBOX_FROM_RE.finditer(buf, start, end)] + [end]
+    for a, b in zip(seps, seps[1:]):
+        nl = buf.find(b"\n", a, b)
+        if nl < 0:
+            continue
+        raw = MBOX_ESCAPED_FROM_RE.sub(rb"\1", buf[nl + 1:b])
+        if raw.strip():
+            msgs.append(parse_rfc822(raw, source_file))
+    return msgs
+
+def input_sources(input_dir: str) -> List[Tuple[str, str]]:
+    # (kind, path) with kind in thread | eml | mbox; .eml files and mbox archives are also found in subfolders
+    sources: List[Tuple[str, str]] = [("thread", p) for p in sorted(glob.glob(os.path.join(input_dir, TXT_THREAD_GLOB)))]
+    seen = set()
+    for pattern in RFC822_GLOBS:
+        for p in sorted(glob.glob(os.path.join(input_dir, pattern), recursive=True)):
+            if p not in seen and os.path.isfile(p):
+                seen.add(p)
+                sources.append(("eml" if p.endswith(".eml") else "mbox", p))
+    return sources
+
+def input_files(input_dir: str) -> List[str]:
+    return [p for _, p in input_sources(input_dir)]
+
+def ingest_tasks(input_dir: str) -> List[Tuple[str, str, int, int]]:
+    # (kind, path, start, end); large mbox archives become several tasks so one file spreads across workers
+    tasks: List[Tuple[str, str, int, int]] = []
+    for kind, p in input_sources(input_dir):
+        if kind == "mbox":
+            tasks.extend((kind, p, a, b) for a, b in mbox_ranges(p))
+        else:
+            tasks.append((kind, p, 0, 0))
+    return tasks
+
+def ingest_task(task: Tuple[str, str, int, int]) -> Tuple[str, str, List[EmailMessage], float]:
+    # Runs in a worker process; returns (kind, path, messages, parse seconds)
+    kind, path, start, end = task
+    t0 = time.perf_counter()
+    name = Path(path).name
+    if kind == "thread":
+        msgs = parse_email_thread(path)
+    elif kind == "eml":
+        msgs = [parse_rfc822(Path(path).read_bytes(), name)]
+    else:
+        with mapped_file(path) as buf:
+            msgs = parse_mbox_range(buf, start, end, name)
+    return kind, path, msgs, time.perf_counter() - t0
+
+# Subject prefixes added by replies, forwards and urgency tags ("Re: FW: URGENT: ..."), stripped repeatedly
+SUBJECT_PREFIX_RE = re.compile(r"^\s*((re|fwd?|aw|sv|vs|urgent)\s*(\[\d+\])?\s*:\s*)+", re.IGNORECASE)
+THREAD_GROUPINGS = ("file", "reconstruct")
+DEFAULT_THREAD_GROUPING = os.getenv("AGENT_THREAD_GROUPING", "file")
+DEFAULT_THREAD_GAP_DAYS = float(os.getenv("AGENT_THREAD_GAP_DAYS", "14"))
+
+def normalize_subject(subject: str) -> str:
+    return " ".join(SUBJECT_PREFIX_RE.sub("", subject or "").lower().split())
+
+def participants(m: EmailMessage) -> set:
+    return {a for a in [m.from_email, *m.to_emails, *m.cc_emails] if a != "unknown"}
+
+class UnionFind:
+    # Path halving + union by size: amortized near-constant time per operation
+    def __init__(self, n: int):
+        self.parent = list(range(n))
+        self.size = [1] * n
+
+    def find(self, x: int) -> int:
+        parent = self.parent
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    def union(self, a: int, b: int) -> None:
+        ra, rb = self.find(a), self.find(b)
+        if ra == rb:
+            return
+        if self.size[ra] < self.size[rb]:
+            ra, rb = rb, ra
+        self.parent[rb] = ra
+        self.size[ra] += self.size[rb]
+
+def link_by_headers(uf: UnionFind, msgs: List[EmailMessage]) -> None:
+    # Message-ID / In-Reply-To / References; replies to a message missing from the export still meet at its ID
+    by_id: Dict[str, int] = {}
+    for i, m in enumerate(msgs):
+        if m.message_id:
+            by_id.setdefault(m.message_id, i)
+    for i, m in enumerate(msgs):
+        for ref in m.references:
+            uf.union(i, by_id.setdefault(ref, i))
+
+def thread_groups(msgs: List[EmailMessage], uf: UnionFind) -> Dict[str, List[EmailMessage]]:
+    members: Dict[int, List[EmailMessage]] = {}
+    for i, m in enumerate(msgs):
+        members.setdefault(uf.find(i), []).append(m)
+    file_sizes: Dict[str, int] = {}
+    for m in msgs:
+        if m.thread_id:
+            file_sizes[m.thread_id] = file_sizes.get(m.thread_id, 0) + 1
+    named: List[Tuple[str, List[EmailMessage]]] = []
+    for group in members.values():
+        group.sort(key=lambda m: m.date)
+        first = group[0]
+        if first.thread_id and len(group) == file_sizes[first.thread_id] and all(m.thread_id == first.thread_id for m in group):
+            # Exactly one whole email*.txt file: keep the file stem as before
+            tid = first.thread_id
+        else:
+            # Named after the earliest message so the ID stays stable as replies arrive
+            tid = "thread-" + sha256_hex(first.message_id or f"{first.source_file}\x00{first.subject}\x00{first.date.isoformat()}")[:12]
+        named.append((tid, group))
+    threads: Dict[str, List[EmailMessage]] = {}
+    for tid, group in sorted(named, key=lambda kv: (kv[1][0].date, kv[0])):
+        for m in group:
+            m.thread_id = tid
+        threads[tid] = group
+    return threads
+
+def group_rfc822_threads(msgs: List[EmailMessage]) -> Dict[str, List[EmailMessage]]:
+    # Header links; messages without any IDs group by normalized subject
+    uf = UnionFind(len(msgs))
+    link_by_headers(uf, msgs)
+    by_subject: Dict[str, int] = {}
+    for i, m in enumerate(msgs):
+        if not m.message_id and not m.references:
+            uf.union(i, by_subject.setdefault(normalize_subject(m.subject), i))
+    return thread_groups(msgs, uf)
+
+def reconstruct_threads(msgs: List[EmailMessage], max_gap_days: float = DEFAULT_THREAD_GAP_DAYS) -> Dict[str, List[EmailMessage]]:
+    # Regroups messages regardless of which file they came from. Besides header links, a message joins the
+    # conversation of the latest message with the same normalized subject that shares a participant with it
+    # and is at most max_gap_days older. Messages of one email*.txt file with the same subject always stay
+    # together. One date sort plus a (subject, participant) index, so cost is O(n log n + total participants).
+    uf = UnionFind(len(msgs))
+    link_by_headers(uf, msgs)
+    gap_s = max_gap_days * 86400
+    latest: Dict[Tuple[str, str], Tuple[int, float]] = {}
+    same_file: Dict[Tuple[str, str], int] = {}
+    for i in sorted(range(len(msgs)), key=lambda i: msgs[i].date):
+        m = msgs[i]
+        subject = normalize_subject(m.subject)
+        if not subject:
+            continue
+        if m.thread_id:
+            uf.union(i, same_file.setdefault((m.thread_id, subject), i))
+        ts = m.date.timestamp()
+        for p in participants(m):
+            prev = latest.get((subject, p))
+            if prev is not None and ts - prev[1] <= gap_s:
+                uf.union(i, prev[0])
+            latest[(subject, p)] = (i, ts)
+    return thread_groups(msgs, uf)
+
+def ingest_workers(tasks: List[Tuple[str, str, int, int]], workers: int) -> int:
+    if workers <= 0:
+        workers = min(os.cpu_count() or 1, 8)
+    total = sum((b - a) if kind == "mbox" else os.path.getsize(p) for kind, p, a, b in tasks)
+    # Pool start-up costs more than it saves on small inputs
+    return 1 if len(tasks) < 2 or total < INGEST_POOL_MIN_BYTES else min(workers, len(tasks))
+
+def iter_threads(input_dir: str, workers: int = DEFAULT_INGEST_WORKERS, metrics: Optional["RunMetrics"] = None,
+                 grouping: str = DEFAULT_THREAD_GROUPING, max_gap_days: float = DEFAULT_THREAD_GAP_DAYS) -> Iterator[Tuple[str, List[EmailMessage]]]:
+    # grouping="file": email*.txt threads are yielded as soon as their file is parsed (in input order);
+    # .eml / mbox messages (and every message with grouping="reconstruct") are grouped once all sources are read.
+    reconstruct = grouping == "reconstruct"
+    tasks = ingest_tasks(input_dir)
+    n = ingest_workers(tasks, workers)
+    pool = ProcessPoolExecutor(max_workers=n) if n > 1 else None
+    pending: List[EmailMessage] = []
+    try:
+        results = pool.map(ingest_task, tasks, chunksize=max(1, len(tasks) // (n * 4))) if pool else map(ingest_task, tasks)
+        for kind, path, msgs, parse_s in results:
+            direct = kind == "thread" and not reconstruct
+            if metrics is not None:
+                metrics.record(msgs[0].thread_id if direct and msgs else None, "parse", calls=1, wall_s=parse_s)
+            if not direct:
+                pending.extend(msgs)
+            elif msgs:
+                yield msgs[0].thread_id, msgs
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+    if pending:
+        t0 = time.perf_counter()
+        groups = reconstruct_threads(pending, max_gap_days) if reconstruct else group_rfc822_threads(pending)
+        if metrics is not None:
+            metrics.record(None, "group", calls=1, wall_s=time.perf_counter() - t0)
+        yield from groups.items()
+
+# Token budgeting (tiktoken when its encodings are available locally, ~4 chars/token otherwise)
+try:
+    import tiktoken
+except Exception:
+    tiktoken = None
+
+# Draft window budget per model (prompt tokens for the thread slice, not the full context window)
+DRAFT_WINDOW_TOKENS: Dict[str, int] = {"gpt-4o-mini": 24000, "gpt-4o": 24000, "gpt-5-mini": 48000, "gpt-5": 48000}
+DEFAULT_DRAFT_WINDOW_TOKENS = int(os.getenv("AGENT_DRAFT_WINDOW_TOKENS", "0"))
+DEFAULT_WINDOW_OVERLAP_MSGS = int(os.getenv("AGENT_WINDOW_OVERLAP_MSGS", "2"))
+FALLBACK_WINDOW_TOKENS = 16000
+
+@functools.lru_cache(maxsize=None)
+def token_encoder(model: str):
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except Exception:
+        return None
+
+def estimate_tokens(text: str, model: str = ANALYZE_MODEL) -> int:
+    enc = token_encoder(model)
+    if enc is not None:
+        return len(enc.encode(text or "", disallowed_special=()))
+    return (len(text or "") + 3) // 4
+
+def draft_window_budget(model: str, override: int = 0) -> int:
+    if override > 0:
+        return override
+    return DRAFT_WINDOW_TOKENS.get(model, FALLBACK_WINDOW_TOKENS)
+
+def split_windows(msg_chunks: List[str], budget: int, overlap: int, model: str = ANALYZE_MODEL) -> List[Tuple[int, int]]:
+    # Greedy [start, end) message ranges under the token budget; consecutive windows share `overlap` messages
+    sizes = [estimate_tokens(c, model) for c in msg_chunks]
+    windows: List[Tuple[int, int]] = []
+    start = 0
+    while start < len(msg_chunks):
+        end, used = start, 0
+        while end < len(msg_chunks) and (end == start or used + sizes[end] <= budget):
+            used += sizes[end]
+            end += 1
+        windows.append((start, end))
+        if end >= len(msg_chunks):
+            break
+        start = max(end - overlap, start + 1)
+    return windows
+
+def normalize_title(title: str) -> str:
+    return re.sub(r"[^\w]+", " ", (title or "").lower()).strip()
+
+def merge_window_drafts(drafts: List[IssueDraft]) -> List[IssueDraft]:
+    # Reduce step: issues from overlapping windows are the same issue when they share a flag and either
+    # a normalized title or an evidence quote; merged issues keep the highest level and up to 3 quotes.
+    rank = {"high": 2, "medium": 1, "low": 0}
+    merged: List[IssueDraft] = []
+    for it in drafts:
+        quotes = {q.strip() for q in it.evidence_quotes if q.strip()}
+        for m in merged:
+            if m.flag != it.flag:
+                continue
+            if normalize_title(m.title) == normalize_title(it.title) or quotes & {q.strip() for q in m.evidence_quotes}:
+                for q in it.evidence_quotes:
+                    if len(m.evidence_quotes) < 3 and q.strip() not in {x.strip() for x in m.evidence_quotes}:
+                        m.evidence_quotes.append(q)
+                if rank[it.severity_or_priority] > rank[m.severity_or_priority]:
+                    m.severity_or_priority = it.severity_or_priority
+                    m.rationale_flag_level = it.rationale_flag_level
+                break
+        else:
+            merged.append(it.model_copy(deep=True))
+    return merged
+
 # Security: email redaction (pseudonymize)
+PSEUDONYM_MAP_VERSION = 1
+
+class Pseudonymizer:
+    # Memoized address -> pseudonym map (one SHA-256 per distinct address); the reverse map allows de-redaction
+    def __init__(self):
+        self.forward: Dict[str, str] = {}
+        self.reverse: Dict[str, str] = {}
+
+    def pseudonym(self, address: str) -> str:
+        addr = address.lower()
+        p = self.forward.get(addr)
+        if p is None:
+            h = hashlib.sha256(addr.encode("utf-8")).hexdigest()[:8]
+            p = f"user_{h}@{addr.split('@')[-1]}"
+            self.forward[addr] = p
+            self.reverse[p] = addr
+        return p
+
+    def register(self, addresses: Iterable[str]) -> None:
+        # Adds map entries without redacting anything ("unknown" senders are never pseudonymized)
+        for a in addresses:
+            if a != "unknown":
+                self.pseudonym(a)
+
+    def redact_text(self, text: str) -> str:
+        return EMAIL_RE.sub(lambda m: self.pseudonym(m.group(0)), text or "")
+
+    def redact_message(self, m: EmailMessage) -> EmailMessage:
+        return replace(
+            m,
+            from_email=m.from_email if m.from_email == "unknown" else self.pseudonym(m.from_email),
+            to_emails=[self.pseudonym(a) for a in m.to_emails],
+            cc_emails=[self.pseudonym(a) for a in m.cc_emails],
+            subject=self.redact_text(m.subject),
+            body=self.redact_text(m.body),
+        )
+
+    def load(self, path: str) -> None:
+        # The map holds real addresses: keep the file next to the secrets, not next to the reports
+        p = Path(path)
+        if not p.exists():
+            return
+        data = json.loads(p.read_text(encoding="utf-8"))
+        if data.get("version") != PSEUDONYM_MAP_VERSION:
+            return
+        for addr, pseudo in (data.get("pseudonyms") or {}).items():
+            self.forward.setdefault(addr, pseudo)
+            self.reverse.setdefault(pseudo, addr)
+
+    def save(self, path: str) -> None:
+        p = Path(path)
+        p.parent.mkdir(parents=True, exist_ok=True)
+        tmp = p.with_name(p.name + ".tmp")
+        tmp.write_text(json.dumps({"version": PSEUDONYM_MAP_VERSION, "pseudonyms": dict(sorted(self.forward.items()))},
+                                  ensure_ascii=False, indent=2), encoding="utf-8")
+        os.replace(tmp, p)
+
+# Process-wide map: every thread of the run (and of later runs in watch mode) shares one memo
+PSEUDONYMS = Pseudonymizer()
+
 def redact_emails_in_text(text: str) -> str:
+    return PSEUDONYMS.redact_text(text)
+
+# Roster (Colleagues.txt): "Role: Name (email)" lines, parsed once into an email -> colleague lookup
+ROSTER_LINE_RE = re.compile(r"^\s*(?P<role>[^:]+?)\s*:\s*(?P<name>[^()]+?)\s*\((?P<email>[^()\s]+@[^()\s]+)\)\s*$")
+
+@dataclass
+class Colleague:
+    name: str
+    email: str
+    roles: List[str] = field(default_factory=list)
+
+    def label(self) -> str:
+        return f"{self.name} ({' / '.join(self.roles)})" if self.roles else self.name
+
+@functools.lru_cache(maxsize=None)
+def load_roster(path: str) -> Dict[str, Colleague]:
+    roster: Dict[str, Colleague] = {}
+    p = Path(path)
+    if not p.exists():
+        return roster
+    for line in p.read_text(encoding="utf-8").splitlines():
+        m = ROSTER_LINE_RE.match(line)
+        if not m:
+            continue
+        addr = m.group("email").lower()
+        c = roster.setdefault(addr, Colleague(name=m.group("name"), email=addr))
+        # The same person can appear in several project rosters with different roles
+        if m.group("role") not in c.roles:
+            c.roles.append(m.group("role"))
+    return roster
+
+def deredact_text(text: str, pseudonyms: Pseudonymizer, roster: Dict[str, Colleague]) -> str:
     def repl(m: re.Match) -> str:
-        email = m.group(0).lower()
-        h = hashlib.sha256(email.encode("utf-8")).hexdigest()[:8]
-        domain = email.split("@")[-1]
-        return f"user_{h}@{domain}"
+        addr = pseudonyms.reverse.get(m.group(0).lower())
+        if addr is None:
+            return m.group(0)
+        c = roster.get(addr)
+        return c.label() if c is not None else addr
     return EMAIL_RE.sub(repl, text or "")
 
-# Guardrails / helpers
-def quotes_present(text: str, quotes: List[str]) -> bool:
-    for q in quotes or []:
-        qq = (q or "").strip()
-        if not qq or qq not in text:
-            return False
-    return True
-
-def locate_quote_msg_index(msg_chunks: List[str], quote: str) -> Optional[int]:
-    q = (quote or "").strip()
-    if not q:
-        return None
-    for idx, chunk in enumerate(msg_chunks, 1):
-        if q in chunk:
-            return idx
-    return None
-
-def max_problem_msg_index(msg_chunks: List[str], evidence_quotes: List[str]) -> int:
-    idxs = [locate_quote_msg_index(msg_chunks, q) for q in (evidence_quotes or [])]
-    idxs = [i for i in idxs if isinstance(i, int)]
-    return max(idxs) if idxs else 0
+def deredact_entry(value: Any, pseudonyms: Pseudonymizer, roster: Dict[str, Colleague]) -> Any:
+    # Every string of a thread entry (quotes, evidence bank, titles, rationales, summary); keys are left alone
+    if isinstance(value, str):
+        return deredact_text(value, pseudonyms, roster)
+    if isinstance(value, list):
+        return [deredact_entry(v, pseudonyms, roster) for v in value]
+    if isinstance(value, dict):
+        return {k: deredact_entry(v, pseudonyms, roster) for k, v in value.items()}
+    return value
+
+def make_reredactor(pseudonyms: Pseudonymizer, roster: Dict[str, Colleague]) -> Callable[[str], str]:
+    # Inverse of deredact_text, for de-redacted output that goes back to a model: every label or address that
+    # deredact_text produced becomes its original pseudonym again. Read-only on the map; one regex per run.
+    back: Dict[str, str] = {}
+    for pseudo, addr in pseudonyms.reverse.items():
+        c = roster.get(addr)
+        back.setdefault(c.label() if c is not None else addr, pseudo)
+    if not back:
+        return lambda text: text or ""
+    pattern = re.compile("|".join(re.escape(k) for k in sorted(back, key=len, reverse=True)))
+    return lambda text: pattern.sub(lambda m: back[m.group(0)], text or "")
+
+# Quote-location index: each message is normalized once, then every "present?" / "which message?"
+# query is a single C-level substring search over one haystack plus a bisect, memoized per quote.
+QUOTE_MATCH_MODES = ("exact", "normalized", "casefold")
+DEFAULT_QUOTE_MATCH = os.getenv("AGENT_QUOTE_MATCH", "normalized")
+QUOTE_CHAR_MAP: Dict[str, str] = {
+    "\u2018": "'", "\u2019": "'", "\u201a": "'", "\u201b": "'", "\u2032": "'",
+    "\u201c": '"', "\u201d": '"', "\u201e": '"', "\u201f": '"', "\u2033": '"',
+    "\u2013": "-", "\u2014": "-", "\u2212": "-", "\u2026": "...", "\u00a0": " ",
+}
+QUOTE_CHAR_RE = re.compile("[" + "".join(QUOTE_CHAR_MAP) + "]")
+
+def normalize_quote_text(s: str, mode: str = DEFAULT_QUOTE_MATCH) -> str:
+    s = (s or "").strip()
+    if mode == "exact":
+        return s
+    if not s.isascii():
+        s = QUOTE_CHAR_RE.sub(lambda m: QUOTE_CHAR_MAP[m.group(0)], unicodedata.normalize("NFKC", s))
+    s = " ".join(s.split())
+    return s.casefold() if mode == "casefold" else s
+
+class QuoteIndex:
+    SEP = "\x00"
+
+    def __init__(self, msg_chunks: List[str], mode: str = DEFAULT_QUOTE_MATCH):
+        self.chunks = msg_chunks
+        self.mode = mode
+        self.starts: List[int] = []
+        parts: List[str] = []
+        pos = 0
+        for c in msg_chunks:
+            self.starts.append(pos)
+            norm = normalize_quote_text(c, mode)
+            parts.append(norm)
+            pos += len(norm) + len(self.SEP)
+        self.haystack = self.SEP.join(parts)
+        self._memo: Dict[str, Optional[int]] = {}
+
+    def locate(self, quote: str) -> Optional[int]:
+        # 1-based message index of the first message containing the quote, None if absent
+        q = normalize_quote_text(quote, self.mode)
+        if not q:
+            return None
+        if q not in self._memo:
+            at = self.haystack.find(q)
+            self._memo[q] = None if at < 0 else bisect.bisect_right(self.starts, at)
+        return self._memo[q]
+
+    def present(self, quotes: List[str]) -> bool:
+        for q in quotes or []:
+            if self.locate(q) is None:
+                return False
+        return True
 
-def resolution_quotes_are_later(msg_chunks: List[str], evidence_quotes: List[str], resolution_quotes: List[str]) -> bool:
-    prob_max = max_problem_msg_index(msg_chunks, evidence_quotes)
-    if prob_max == 0:
+    def max_index(self, quotes: List[str]) -> int:
+        idxs = [i for i in (self.locate(q) for q in (quotes or [])) if isinstance(i, int)]
+        return max(idxs) if idxs else 0
+
+    def min_index(self, quotes: List[str]) -> int:
+        idxs = [i for i in (self.locate(q) for q in (quotes or [])) if isinstance(i, int)]
+        return min(idxs) if idxs else 0
+
+    def resolution_is_later(self, evidence_quotes: List[str], resolution_quotes: List[str]) -> bool:
+        prob_max = self.max_index(evidence_quotes)
+        if prob_max == 0:
+            return True
+        for rq in resolution_quotes or []:
+            ridx = self.locate(rq)
+            if ridx is None or ridx <= prob_max:
+                return False
         return True
-    for rq in resolution_quotes or []:
-        ridx = locate_quote_msg_index(msg_chunks, rq)
-        if ridx is None or ridx <= prob_max:
-            return False
-    return True
 
 # Candidate resolution snippet harvesting
 RESOLUTION_PATTERNS = [
@@ -309,214 +1176,2303 @@ def harvest_resolution_snippets(msg_chunks: List[str], after_msg_index: int, lim
                     return snippets
     return snippets
 
+# Local pre-triage: keyword/question/urgency cues score a thread before any LLM call
+ASK_PATTERNS = [
+    r"\bplease\b", r"\bcould you\b", r"\bcan you\b", r"\bcan someone\b", r"\bwould you\b", r"\bneeds? to\b",
+    r"\bwe need\b", r"\blet me know\b", r"\bdeadline\b", r"\bconfirm", r"\bdecid", r"\bdecision\b", r"\bapprov",
+    r"\baction item\b", r"\bfollow[- ]?up\b", r"\btake a look\b", r"\breview\b",
+    r"\bby (?:mon|tues|wednes|thurs|fri)day\b", r"\bby (?:eod|tomorrow|end of (?:the )?(?:day|week))\b",
+]
+RISK_PATTERNS = [
+    r"\bblock(?:er|ed|ing)?\b", r"\brisk", r"\bissue", r"\bbug", r"\berror", r"\bfail", r"\bbroken\b",
+    r"\bnot working\b", r"\bdoesn'?t work\b", r"\bcrash", r"\boutage\b", r"\bdown\b", r"\bdelay", r"\bbehind schedule\b",
+    r"\bescalat", r"\bcomplain", r"\bestimate\b", r"\bscope\b", r"\bpanic\b", r"\bincident\b", r"\banomal",
+]
+URGENT_PATTERNS = [
+    r"\burgent\b", r"\basap\b", r"\bcritical\b", r"\bimmediately\b", r"\bprod(?:uction)?\b", r"\blive\b",
+    r"\ball hands\b", r"\bhotfix\b",
+]
+ASK_RE = re.compile("|".join(ASK_PATTERNS), re.IGNORECASE)
+RISK_RE = re.compile("|".join(RISK_PATTERNS), re.IGNORECASE)
+URGENT_RE = re.compile("|".join(URGENT_PATTERNS), re.IGNORECASE)
+QUESTION_RE = re.compile(r"\?(?:\s|$)")
+TRIAGE_CUES: Dict[str, re.Pattern] = {"ask": ASK_RE, "risk": RISK_RE, "question": QUESTION_RE, "urgent": URGENT_RE}
+TRIAGE_WEIGHTS: Dict[str, float] = {"ask": 1.0, "risk": 1.5, "question": 1.0, "urgent": 2.0}
+TRIAGE_MODES = ("off", "skip", "downgrade")
+DEFAULT_TRIAGE_MODE = os.getenv("AGENT_TRIAGE_MODE", "off")
+DEFAULT_TRIAGE_THRESHOLD = float(os.getenv("AGENT_TRIAGE_THRESHOLD", "2"))
+
+def triage_thread(thread: List[EmailMessage]) -> Dict[str, Any]:
+    # Cue counts are lines (subjects included) matching each pattern group; the score is their weighted sum
+    cues = dict.fromkeys(TRIAGE_CUES, 0)
+    seen = set()
+    for m in thread:
+        for line in [m.subject] + m.body.splitlines():
+            s = line.strip()
+            if not s or s in seen:
+                continue
+            seen.add(s)
+            for name, rx in TRIAGE_CUES.items():
+                if rx.search(s):
+                    cues[name] += 1
+    return {"score": round(sum(TRIAGE_WEIGHTS[k] * n for k, n in cues.items()), 2), "cues": cues}
+
+def triage_evaluation(scored: List[Tuple[float, bool]], threshold: float) -> Dict[str, Any]:
+    # scored: (triage score, thread has attention flags in the full-LLM result) per thread
+    def at(t: float) -> Dict[str, Any]:
+        tp = sum(1 for s, pos in scored if s >= t and pos)
+        fp = sum(1 for s, pos in scored if s >= t and not pos)
+        fn = sum(1 for s, pos in scored if s < t and pos)
+        return {
+            "threshold": t,
+            "precision": round(tp / (tp + fp), 3) if tp + fp else None,
+            "recall": round(tp / (tp + fn), 3) if tp + fn else None,
+            "skip_rate": round(sum(1 for s, _ in scored if s < t) / len(scored), 3) if scored else 0.0,
+            "missed_threads": fn,
+        }
+    return {
+        "threads": len(scored),
+        "positives": sum(1 for _, pos in scored if pos),
+        **at(threshold),
+        # What other thresholds would have done on the same threads, to tune AGENT_TRIAGE_THRESHOLD
+        "sweep": [at(t) for t in sorted({s for s, _ in scored} | {threshold})],
+    }
+
+def local_summary_md(A: List[Dict[str, Any]], B: List[Dict[str, Any]]) -> str:
+    # Deterministic stand-in for the summary call, same shape as the model's bullets
+    lines: List[str] = []
+    for label, items in (("Attention Flag A — Unresolved action items", A), ("Attention Flag B — Emerging risks / blockers", B)):
+        if items:
+            lines.append(f"**{label}**")
+            lines.extend(f"- {x['title']} ({x['status']})" + "".join(f" [{i}]" for i in x.get("evidence_ids", [])) for x in items)
+    return "\n".join(lines) or "No unresolved or unknown items."
+
+def template_summary_md(finalized: List[Dict[str, Any]]) -> str:
+    # Batch mode: a thread with nothing open gets this fixed text instead of a summary call
+    resolved = [x for x in finalized if x["status"] == "resolved"]
+    lines = ["No unresolved or unknown items."]
+    if resolved:
+        lines.append(f"**Resolved in this thread ({len(resolved)})**")
+        lines.extend(f"- {x['title']}" + "".join(f" [{i}]" for i in x["resolution_evidence_ids"] or x["evidence_ids"]) for x in resolved)
+    return "\n".join(lines)
+
 def issue_type(flag: FlagType) -> str:
     return "action_item" if flag == "A_unresolved_action_item" else "risk"
 
 def issue_level_key(flag: FlagType) -> str:
     return "priority" if flag == "A_unresolved_action_item" else "severity"
 
-# Report generation 
-def build_report(input_dir: str, redact: bool) -> Dict[str, Any]:
-    threads: Dict[str, List[EmailMessage]] = {}
-    for p in sorted(glob.glob(os.path.join(input_dir, "email*.txt"))):
-        msgs = parse_email_thread(p)
-        if msgs:
-            threads[msgs[0].thread_id] = msgs
+# Run metrics: wall time, tokens and estimated cost per stage and per thread
+# USD per 1M tokens as (input, cached input, output); extend/override with AGENT_MODEL_PRICES='{"model": [in, cached, out]}'
+MODEL_PRICES: Dict[str, Tuple[float, float, float]] = {
+    "gpt-4o-mini": (0.15, 0.075, 0.60),
+    "gpt-4o": (2.50, 1.25, 10.00),
+    "gpt-5-mini": (0.25, 0.025, 2.00),
+    "gpt-5": (1.25, 0.125, 10.00),
+    "gpt-4.1-nano": (0.10, 0.025, 0.40),
+    "gpt-4.1-mini": (0.40, 0.10, 1.60),
+    "gpt-5-nano": (0.05, 0.005, 0.40),
+}
+MODEL_PRICES.update({m: tuple(p) for m, p in json.loads(os.getenv("AGENT_MODEL_PRICES", "{}")).items()})
+METRIC_FIELDS = ("calls", "wall_s", "queue_s", "prompt_tokens", "completion_tokens", "cached_tokens", "cost_usd", "llm_cache_hits")
+TOKEN_FIELDS = ("prompt_tokens", "completion_tokens", "cached_tokens", "cost_usd")
+
+def estimate_cost(model: str, prompt_tokens: int, completion_tokens: int, cached_tokens: int = 0) -> float:
+    price = MODEL_PRICES.get(model)
+    if price is None:
+        return 0.0
+    p_in, p_cached, p_out = price
+    return ((prompt_tokens - cached_tokens) * p_in + cached_tokens * p_cached + completion_tokens * p_out) / 1e6
+
+def prompt_tokens(stage: str, inputs: Dict[str, Any], model: Optional[str] = None) -> int:
+    system, user = STAGE_PROMPTS[stage]
+    return estimate_tokens(system + "\n" + user.format(**inputs), model or STAGE_MODELS[stage])
+
+def call_tokens(stage: str, inputs: Dict[str, Any], result, usage: Optional[Dict[str, Any]], model: Optional[str] = None) -> Tuple[Dict[str, int], bool]:
+    # Provider-reported usage when the backend returns it; otherwise estimated from the rendered prompt and the parsed answer
+    if usage:
+        details = usage.get("input_token_details") or {}
+        return {
+            "prompt_tokens": int(usage.get("input_tokens") or 0),
+            "completion_tokens": int(usage.get("output_tokens") or 0),
+            "cached_tokens": int(details.get("cache_read") or 0),
+        }, False
+    model = model or STAGE_MODELS[stage]
+    return {
+        "prompt_tokens": prompt_tokens(stage, inputs, model),
+        "completion_tokens": estimate_tokens(result.model_dump_json(), model),
+        "cached_tokens": 0,
+    }, True
+
+class RunMetrics:
+    def __init__(self, trace: bool = False):
+        self.started = time.perf_counter()
+        self.stages: Dict[str, Dict[str, float]] = {}
+        self.models: Dict[str, Dict[str, float]] = {}
+        self.threads: Dict[str, Dict[str, Any]] = {}
+        self.guardrails: Dict[str, int] = {}
+        self.retries: Dict[str, int] = {}
+        self.token_source: Dict[str, int] = {"usage": 0, "estimated": 0}
+        # Per-call trace events, kept only when a JSON-lines trace export was requested
+        self.events: Optional[List[Dict[str, Any]]] = [] if trace else None
+
+    def _thread(self, tid: str) -> Dict[str, Any]:
+        return self.threads.setdefault(tid, {"analyzed": False, "wall_s": 0.0, "guardrail_rejections": 0, "stages": {}})
+
+    def record(self, tid: Optional[str], stage: str, model: Optional[str] = None, **values: float) -> None:
+        buckets = [self.stages.setdefault(stage, dict.fromkeys(METRIC_FIELDS, 0))]
+        if model is not None:
+            buckets.append(self.models.setdefault(model, dict.fromkeys(METRIC_FIELDS, 0)))
+        if tid is not None:
+            buckets.append(self._thread(tid)["stages"].setdefault(stage, dict.fromkeys(METRIC_FIELDS, 0)))
+        for b in buckets:
+            for k, v in values.items():
+                b[k] += v
+
+    def trace(self, **event: Any) -> None:
+        if self.events is not None:
+            self.events.append({"ts": datetime.now(timezone.utc).isoformat(), **event})
+
+    def reject(self, tid: Optional[str], reason: str) -> None:
+        self.guardrails[reason] = self.guardrails.get(reason, 0) + 1
+        if tid is not None:
+            self._thread(tid)["guardrail_rejections"] += 1
+        self.trace(thread_id=tid, stage="guardrail", reason=reason)
+
+    def retry(self, tid: Optional[str], stage: str, model: str, reason: str, delay_s: float) -> None:
+        self.retries[reason] = self.retries.get(reason, 0) + 1
+        self.trace(thread_id=tid, stage=stage, model=model, retry=reason, backoff_s=round(delay_s, 3))
+
+    def thread_done(self, tid: str, wall_s: float) -> None:
+        t = self._thread(tid)
+        t["analyzed"] = True
+        t["wall_s"] = wall_s
+
+    def summary(self) -> Dict[str, Any]:
+        def rounded(d: Dict[str, float]) -> Dict[str, float]:
+            return {k: round(v, 6) if isinstance(v, float) else v for k, v in d.items()}
+
+        def llm_totals(stages: Dict[str, Dict[str, float]]) -> Dict[str, float]:
+            tot = dict.fromkeys(("calls", "llm_cache_hits") + TOKEN_FIELDS, 0)
+            for stage, b in stages.items():
+                if stage in STAGE_MODELS:
+                    for k in tot:
+                        tot[k] += b[k]
+            return rounded(tot)
+
+        # Threads reused from a previous report (incremental/resume) were only parsed, so they are left out
+        threads = {}
+        for tid, t in sorted(self.threads.items()):
+            if not t["analyzed"]:
+                continue
+            threads[tid] = {
+                "wall_s": round(t["wall_s"], 6),
+                **llm_totals(t["stages"]),
+                "guardrail_rejections": t["guardrail_rejections"],
+                "stages": {s: rounded(b) for s, b in t["stages"].items()},
+            }
+        return {
+            "wall_s": round(time.perf_counter() - self.started, 6),
+            "totals": llm_totals(self.stages),
+            "token_source": dict(self.token_source),
+            "prices_usd_per_1m": {m: list(MODEL_PRICES[m]) for m in sorted(self.models) if m in MODEL_PRICES},
+            "stages": {s: rounded(b) for s, b in self.stages.items()},
+            "models": {m: rounded(b) for m, b in sorted(self.models.items())},
+            "guardrail_rejections": dict(sorted(self.guardrails.items())),
+            "retries": dict(sorted(self.retries.items())),
+            "threads": threads,
+        }
+
+def slowest_threads(metrics: Dict[str, Any], n: int) -> List[Tuple[str, Dict[str, Any]]]:
+    return sorted((metrics.get("threads") or {}).items(), key=lambda kv: -kv[1]["wall_s"])[:n]
+
+def prom_label(v: str) -> str:
+    return v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def write_prometheus(path: str, metrics: Dict[str, Any]) -> None:
+    # node_exporter textfile-collector format; written to a temp file and renamed so scrapes never see a partial file
+    lines: List[str] = []
 
-    report: Dict[str, Any] = {
-        "generated_at": datetime.now(timezone.utc).isoformat(),
-        "threads": [],
-        "models": {"draft": ANALYZE_MODEL, "resolve": RESOLVE_MODEL, "summary": SUMMARY_MODEL},
-    }
+    def metric(name: str, kind: str, help_text: str, samples: List[Tuple[Dict[str, str], float]]) -> None:
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, value in samples:
+            lbl = ",".join(f'{k}="{prom_label(v)}"' for k, v in labels.items())
+            lines.append(f"{name}{{{lbl}}} {value}" if lbl else f"{name} {value}")
+
+    stages = metrics["stages"]
+    metric("email_agent_run_seconds", "gauge", "Wall time of the last report run.", [({}, metrics["wall_s"])])
+    metric("email_agent_threads_analyzed", "gauge", "Threads analyzed (not reused) in the last run.", [({}, len(metrics["threads"]))])
+    metric("email_agent_stage_seconds", "gauge", "Wall time per pipeline stage (LLM stages: time inside the call).",
+           [({"stage": s}, b["wall_s"]) for s, b in stages.items()])
+    metric("email_agent_stage_queue_seconds", "gauge", "Time LLM calls waited for a concurrency slot or rate-limit budget, per stage.",
+           [({"stage": s}, b["queue_s"]) for s, b in stages.items() if s in STAGE_MODELS])
+    metric("email_agent_stage_calls", "gauge", "Invocations per stage (LLM stages: calls sent to the backend).",
+           [({"stage": s}, b["calls"]) for s, b in stages.items()])
+    metric("email_agent_llm_cache_hits", "gauge", "LLM calls answered from the response cache, per stage.",
+           [({"stage": s}, b["llm_cache_hits"]) for s, b in stages.items() if s in STAGE_MODELS])
+    metric("email_agent_tokens", "gauge", "Tokens per stage and kind.",
+           [({"stage": s, "kind": kind}, b[f"{kind}_tokens"]) for s, b in stages.items() if s in STAGE_MODELS
+            for kind in ("prompt", "completion", "cached")])
+    metric("email_agent_cost_usd", "gauge", "Estimated cost per stage in USD.",
+           [({"stage": s}, b["cost_usd"]) for s, b in stages.items() if s in STAGE_MODELS])
+    metric("email_agent_model_calls", "gauge", "LLM calls per model.", [({"model": m}, b["calls"]) for m, b in metrics["models"].items()])
+    metric("email_agent_model_cost_usd", "gauge", "Estimated cost per model in USD.", [({"model": m}, b["cost_usd"]) for m, b in metrics["models"].items()])
+    metric("email_agent_guardrail_rejections", "gauge", "Model outputs rejected by the quote guardrails, per reason.",
+           [({"reason": r}, n) for r, n in metrics["guardrail_rejections"].items()])
+    metric("email_agent_llm_retries", "gauge", "LLM calls retried after a transient failure, per reason.",
+           [({"reason": r}, n) for r, n in metrics.get("retries", {}).items()])
+    tmp = f"{path}.tmp"
+    Path(tmp).write_text("\n".join(lines) + "\n", encoding="utf-8")
+    os.replace(tmp, path)
+
+def write_trace_jsonl(path: str, events: List[Dict[str, Any]]) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        for e in events:
+            f.write(json.dumps(e, ensure_ascii=False) + "\n")
+
+# Request scheduling: per-model RPM/TPM token buckets, stage priorities and retries with jittered backoff
+# Requests and tokens per minute; extend/override with AGENT_RATE_LIMITS='{"model": [rpm, tpm]}'
+MODEL_RATE_LIMITS: Dict[str, Tuple[int, int]] = {
+    "gpt-4o-mini": (500, 200_000),
+    "gpt-4o": (500, 30_000),
+    "gpt-5-mini": (500, 500_000),
+    "gpt-5": (500, 500_000),
+    "gpt-4.1-nano": (500, 200_000),
+    "gpt-4.1-mini": (500, 200_000),
+    "gpt-5-nano": (500, 200_000),
+}
+MODEL_RATE_LIMITS.update({m: tuple(v) for m, v in json.loads(os.getenv("AGENT_RATE_LIMITS", "{}")).items()})
+DEFAULT_MAX_CONCURRENCY = int(os.getenv("AGENT_MAX_CONCURRENCY", "8"))
+DEFAULT_MAX_RETRIES = int(os.getenv("AGENT_MAX_RETRIES", "6"))
+RETRY_BASE_S = 1.0
+RETRY_CAP_S = 60.0
+# Lower runs first: a summary is the last call of its thread, so finishing it releases a complete result
+STAGE_PRIORITY: Dict[str, int] = {"summary": 0, "summary_batch": 0, "portfolio": 0, "resolve": 1, "resolve_batch": 1, "draft": 2}
+TRANSIENT_STATUS = {408, 409, 429, 500, 502, 503, 504}
+TRANSIENT_ERRORS = {"RateLimitError": "rate_limit", "APITimeoutError": "timeout", "APIConnectionError": "connection",
+                    "InternalServerError": "server_error", "ServiceUnavailableError": "server_error"}
+
+def transient_reason(exc: BaseException) -> Optional[str]:
+    # Checked by class name / status code so the openai package stays an optional import
+    for cls in type(exc).__mro__:
+        if cls.__name__ in TRANSIENT_ERRORS:
+            return TRANSIENT_ERRORS[cls.__name__]
+    status = getattr(exc, "status_code", None)
+    if status in TRANSIENT_STATUS:
+        return "rate_limit" if status == 429 else f"http_{status}"
+    if isinstance(exc, (asyncio.TimeoutError, ConnectionError)):
+        return "timeout" if isinstance(exc, asyncio.TimeoutError) else "connection"
+    return None
 
-    for tid, thread in threads.items():
-        thread_text, msg_chunks = build_thread_text(thread)
-        if redact:
-            thread_text = redact_emails_in_text(thread_text)
-            msg_chunks = [redact_emails_in_text(c) for c in msg_chunks]
+def retry_after_s(exc: BaseException) -> Optional[float]:
+    headers = getattr(getattr(exc, "response", None), "headers", None) or {}
+    try:
+        if "retry-after-ms" in headers:
+            return float(headers["retry-after-ms"]) / 1000.0
+        if "retry-after" in headers:
+            return float(headers["retry-after"])
+    except (TypeError, ValueError):
+        pass
+    return None
 
-        # Step 1: Draft issues from full thread
-        draft: ThreadIssuesDraft = draft_chain.invoke({"thread_text": thread_text})
+class TokenBucket:
+    # Refills continuously at capacity/60 per second; may go negative when a call used more than was reserved
+    def __init__(self, per_minute: float, now: float):
+        self.capacity = float(per_minute)
+        self.level = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.updated = now
+
+    def refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_s(self, amount: float) -> float:
+        # Time until `amount` fits; a request larger than the whole bucket only waits for a full one
+        need = min(amount, self.capacity) - self.level
+        return need / self.rate if need > 0 else 0.0
+
+class RequestScheduler:
+    """
+    Every LLM call goes through here. Waiting requests are ordered by (stage priority, thread start, arrival).
+    A request starts when a concurrency slot is free and its model's RPM/TPM buckets can cover it;
+    a request for another model is not held up by a throttled one.
+    `clock` and `sleep` are the time source for buckets, cooldowns, throttle wake-ups and retry backoff.
+    """
+
+    def __init__(self, max_concurrency: int = DEFAULT_MAX_CONCURRENCY, limits: Optional[Dict[str, Tuple[int, int]]] = None,
+                 max_retries: int = DEFAULT_MAX_RETRIES, metrics: Optional[RunMetrics] = None,
+                 clock: Callable[[], float] = time.monotonic, sleep: Callable[[float], Awaitable[Any]] = asyncio.sleep):
+        self.max_concurrency = max(1, max_concurrency)
+        self.slots = self.max_concurrency
+        self.limits = dict(limits or {})
+        self.max_retries = max_retries
+        self.metrics = metrics or RunMetrics()
+        self.clock = clock
+        self.sleep = sleep
+        self.buckets: Dict[str, Tuple[TokenBucket, TokenBucket]] = {}
+        self.cooldown_until: Dict[str, float] = {}
+        self.waiting: Dict[str, List[Tuple[Tuple[int, float, int], int, asyncio.Future]]] = {}
+        self.seq = 0
+        self.timer: Optional[asyncio.Task] = None
+        # Per model: total time its queue head waited on the RPM/TPM budget or a 429 cooldown
+        self.throttled_s: Dict[str, float] = {}
+        self.throttled_since: Dict[str, float] = {}
+
+    def _buckets(self, model: str) -> Optional[Tuple[TokenBucket, TokenBucket]]:
+        if model not in self.limits:
+            return None
+        if model not in self.buckets:
+            rpm, tpm = self.limits[model]
+            now = self.clock()
+            self.buckets[model] = (TokenBucket(rpm, now), TokenBucket(tpm, now))
+        return self.buckets[model]
+
+    def _wait_s(self, model: str, tokens: int, now: float) -> float:
+        wait = max(0.0, self.cooldown_until.get(model, 0.0) - now)
+        b = self._buckets(model)
+        if b is not None:
+            for bucket in b:
+                bucket.refill(now)
+            wait = max(wait, b[0].wait_s(1), b[1].wait_s(tokens))
+        return wait
+
+    def _pump(self) -> None:
+        # Grant slots to the best admissible head among the per-model queues; re-arm a timer for the throttled rest
+        now = self.clock()
+        next_wake = None
+        while self.slots > 0:
+            best = None
+            for model, queue in self.waiting.items():
+                while queue and queue[0][2].done():
+                    heapq.heappop(queue)  # cancelled waiter
+                if not queue:
+                    continue
+                wait = self._wait_s(model, queue[0][1], now)
+                if wait > 0:
+                    self.throttled_since.setdefault(model, now)
+                    next_wake = wait if next_wake is None else min(next_wake, wait)
+                    continue
+                if model in self.throttled_since:
+                    self.throttled_s[model] = self.throttled_s.get(model, 0.0) + now - self.throttled_since.pop(model)
+                if best is None or queue[0][0] < self.waiting[best][0][0]:
+                    best = model
+            if best is None:
+                break
+            _, tokens, fut = heapq.heappop(self.waiting[best])
+            b = self._buckets(best)
+            if b is not None:
+                b[0].level -= 1
+                b[1].level -= tokens
+            self.slots -= 1
+            fut.set_result(None)
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        if next_wake is not None and self.slots > 0:
+            self.timer = asyncio.get_running_loop().create_task(self._wake(next_wake))
+
+    async def _wake(self, delay: float) -> None:
+        await self.sleep(delay)
+        self.timer = None
+        self._pump()
+
+    async def _acquire(self, model: str, tokens: int, priority: Tuple[int, float]) -> None:
+        fut = asyncio.get_running_loop().create_future()
+        self.seq += 1
+        heapq.heappush(self.waiting.setdefault(model, []), ((priority[0], priority[1], self.seq), tokens, fut))
+        self._pump()
+        try:
+            await fut
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled():
+                self._release(model, tokens, None)  # granted just before the cancellation landed
+            raise
+
+    def _release(self, model: str, reserved: int, used: Optional[int]) -> None:
+        b = self._buckets(model)
+        if b is not None and used is not None:
+            # Settle the reservation against what the call actually consumed
+            b[1].level -= used - reserved
+        self.slots += 1
+        self._pump()
+
+    async def submit(self, model: str, tokens: int, priority: Tuple[int, float], call: Callable[[], Any],
+                     thread_id: Optional[str] = None, stage: str = "") -> Any:
+        # `call` returns (result, usage) like LLMBackend.acall; transient failures are retried with full-jitter backoff
+        attempt = 0
+        while True:
+            await self._acquire(model, tokens, priority)
+            used = None
+            try:
+                result, usage = await call()
+                if usage:
+                    used = int(usage.get("input_tokens") or 0) + int(usage.get("output_tokens") or 0)
+                return result, usage
+            except Exception as exc:
+                reason = transient_reason(exc)
+                if reason is None or attempt >= self.max_retries:
+                    raise
+                hinted = retry_after_s(exc)
+                delay = hinted if hinted is not None else random.uniform(0, min(RETRY_CAP_S, RETRY_BASE_S * 2 ** attempt))
+                if reason == "rate_limit":
+                    # The provider says we are over budget: hold back every request for this model, not just this one
+                    self.cooldown_until[model] = max(self.cooldown_until.get(model, 0.0), self.clock() + delay)
+                self.metrics.retry(thread_id, stage, model, reason, delay)
+                attempt += 1
+            finally:
+                self._release(model, tokens, used)
+            await self.sleep(delay)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "max_retries": self.max_retries,
+            "rate_limits": {m: {"rpm": v[0], "tpm": v[1]} for m, v in sorted(self.limits.items())},
+            "throttled_s": {m: round(v, 3) for m, v in sorted(self.throttled_s.items())},
+            "retries": dict(sorted(self.metrics.retries.items())),
+        }
+
+# Report generation
+RESOLVE_MODES = ("per_issue", "batch")
+DEFAULT_RESOLVE_MODE = os.getenv("AGENT_RESOLVE_MODE", "per_issue")
+RESOLVE_CONTEXTS = ("sliced", "full")
+DEFAULT_RESOLVE_CONTEXT = os.getenv("AGENT_RESOLVE_CONTEXT", "sliced")
+DEFAULT_CASCADE = os.getenv("AGENT_CASCADE", "0") == "1"
+# Threads above this many tokens skip the fast tier (small models lose track of long threads)
+DEFAULT_CASCADE_MAX_TOKENS = int(os.getenv("AGENT_CASCADE_MAX_TOKENS", "8000"))
+SUMMARY_MODES = ("per_thread", "batch")
+DEFAULT_SUMMARY_MODE = os.getenv("AGENT_SUMMARY_MODE", "per_thread")
+# Prompt-side token budget per summary_batch / portfolio call
+DEFAULT_SUMMARY_BATCH_TOKENS = int(os.getenv("AGENT_SUMMARY_BATCH_TOKENS", "6000"))
+SUMMARY_BATCH_MAX_THREADS = 20
+PORTFOLIO_MAX_CLUSTERS = 10
 
-        drafts: List[IssueDraft] = []
-        for it in (draft.issues or []):
-            if not it.title.strip():
-                continue
-            if not quotes_present(thread_text, it.evidence_quotes):
-                continue
-            drafts.append(it)
-
-        finalized: List[Dict[str, Any]] = []
-        evidence_bank: Dict[str, str] = {}
-        ev_counter = 0
-
-        def add_evidence(quotes: List[str]) -> List[str]:
-            nonlocal ev_counter
-            ids: List[str] = []
-            for q in quotes or []:
-                qq = (q or "").strip()
-                if not qq:
+@dataclass
+class RunContext:
+    scheduler: RequestScheduler
+    backend: LLMBackend = field(default_factory=OpenAIBackend)
+    cache: Optional[LLMCache] = None
+    resolve_mode: str = DEFAULT_RESOLVE_MODE
+    draft_window_tokens: int = DEFAULT_DRAFT_WINDOW_TOKENS
+    window_overlap: int = DEFAULT_WINDOW_OVERLAP_MSGS
+    resolve_context: str = DEFAULT_RESOLVE_CONTEXT
+    quote_match: str = DEFAULT_QUOTE_MATCH
+    resolve_tokens: Dict[str, int] = field(default_factory=lambda: {"full_thread": 0, "sent": 0, "calls": 0})
+    metrics: RunMetrics = field(default_factory=RunMetrics)
+    pseudonyms: Pseudonymizer = field(default_factory=lambda: PSEUDONYMS)
+    triage_mode: str = DEFAULT_TRIAGE_MODE
+    triage_threshold: float = DEFAULT_TRIAGE_THRESHOLD
+    cascade: bool = DEFAULT_CASCADE
+    cascade_max_tokens: int = DEFAULT_CASCADE_MAX_TOKENS
+    # stage -> {"answered:<tier>" | "escalated:<reason>": count}, shared by all threads of the run
+    cascade_stats: Dict[str, Dict[str, int]] = field(default_factory=dict)
+    # Set on the per-thread copy made by analyze_thread so LLM calls are attributed to their thread
+    dedupe: Optional["IssueDeduper"] = None
+    summaries: Optional["SummaryBatcher"] = None
+    thread_id: Optional[str] = None
+    thread_started: float = 0.0
+    thread_tokens: int = 0
+
+async def run_chain(ctx: RunContext, stage: str, inputs: Dict[str, Any], attempt: int = 1, model: Optional[str] = None):
+    # Single choke point for every LLM call; the scheduler bounds in-flight requests and paces them per model.
+    # `attempt` is part of the cache key so deliberate re-asks are not collapsed into the first answer.
+    model = model or STAGE_MODELS[stage]
+    cache = ctx.cache if ctx.backend.cacheable else None
+    key = None
+    t0 = time.perf_counter()
+    if cache is not None:
+        key = request_key(stage, model, inputs, attempt)
+        cached = cache.get(stage, key)
+        if cached is not None:
+            ctx.metrics.record(ctx.thread_id, stage, model, llm_cache_hits=1)
+            ctx.metrics.trace(thread_id=ctx.thread_id, stage=stage, model=model, attempt=attempt, llm_cache_hit=True,
+                              wall_s=round(time.perf_counter() - t0, 6))
+            return STAGE_SCHEMAS[stage].model_validate_json(cached)
+    started: List[float] = []
+
+    def call():
+        started.append(time.perf_counter())
+        return ctx.backend.acall(stage, inputs, attempt, model)
+
+    reserve = prompt_tokens(stage, inputs, model) if model in ctx.scheduler.limits else 0
+    result, usage = await ctx.scheduler.submit(model, reserve, (STAGE_PRIORITY.get(stage, 9), ctx.thread_started), call,
+                                               thread_id=ctx.thread_id, stage=stage)
+    t1, t2 = started[-1], time.perf_counter()
+    if cache is not None:
+        cache.put(stage, model, key, result.model_dump_json())
+    tokens, estimated = call_tokens(stage, inputs, result, usage, model)
+    cost = estimate_cost(model, **tokens)
+    ctx.metrics.token_source["estimated" if estimated else "usage"] += 1
+    ctx.metrics.record(ctx.thread_id, stage, model, calls=1, wall_s=t2 - t1, queue_s=t1 - t0, cost_usd=cost, **tokens)
+    ctx.metrics.trace(thread_id=ctx.thread_id, stage=stage, model=model, attempt=attempt, llm_cache_hit=False,
+                      wall_s=round(t2 - t1, 6), queue_s=round(t1 - t0, 6), tokens_estimated=estimated, cost_usd=round(cost, 8), **tokens)
+    return result
+
+# Model cascade: the fast tier answers first, the strong tier (the configured stage model) only when needed
+def cascade_count(ctx: RunContext, stage: str, key: str) -> None:
+    st = ctx.cascade_stats.setdefault(stage, {})
+    st[key] = st.get(key, 0) + 1
+
+def stage_tiers(ctx: RunContext, stage: str, count: bool = True) -> List[Tuple[str, str]]:
+    # count=False only looks the tiers up (e.g. to size prompts) without recording a thread-size escalation
+    strong = ("strong", STAGE_MODELS[stage])
+    if not ctx.cascade or FAST_STAGE_MODELS[stage] == STAGE_MODELS[stage]:
+        return [strong]
+    if ctx.thread_tokens > ctx.cascade_max_tokens:
+        if count:
+            cascade_count(ctx, stage, "escalated:thread_size")
+        return [strong]
+    return [("fast", FAST_STAGE_MODELS[stage]), strong]
+
+async def run_cascade(ctx: RunContext, stage: str, inputs: Dict[str, Any], accept: Callable[[Any], bool],
+                      attempt: int = 1, tiers: Optional[List[Tuple[str, str]]] = None) -> Tuple[Any, str]:
+    # A tier's answer is kept when it passes `accept` (the stage's guardrails) or when no stronger tier is left
+    tiers = tiers or stage_tiers(ctx, stage)
+    for n, (tier, model) in enumerate(tiers):
+        result = await run_chain(ctx, stage, inputs, attempt, model=model)
+        if n == len(tiers) - 1 or accept(result):
+            if ctx.cascade:
+                cascade_count(ctx, stage, f"answered:{tier}")
+            return result, tier
+        cascade_count(ctx, stage, "escalated:guardrail")
+    raise AssertionError("unreachable")
+
+async def aiter_threads(input_dir: str, workers: int = DEFAULT_INGEST_WORKERS, metrics: Optional[RunMetrics] = None,
+                        grouping: str = DEFAULT_THREAD_GROUPING, max_gap_days: float = DEFAULT_THREAD_GAP_DAYS):
+    # Drives iter_threads from a worker thread so the event loop keeps running LLM calls while files are parsed
+    it = iter_threads(input_dir, workers, metrics, grouping, max_gap_days)
+    done = object()
+    while True:
+        item = await asyncio.to_thread(next, it, done)
+        if item is done:
+            return
+        yield item
+
+def resolution_is_grounded(qi: QuoteIndex, it: IssueDraft, res_quotes: List[str]) -> bool:
+    return bool(res_quotes) and qi.present(res_quotes) and qi.resolution_is_later(it.evidence_quotes, res_quotes)
+
+def issue_candidates(qi: QuoteIndex, it: IssueDraft) -> List[str]:
+    prob_idx = qi.max_index(it.evidence_quotes)
+    return harvest_resolution_snippets(qi.chunks, after_msg_index=prob_idx + 1, limit=6)
+
+# Resolve context slicing: the resolver only needs the problem messages and everything after them
+CHUNK_HEADER_RE = re.compile(r"(?m)^(Subject|Date|From): (.*)$")
+
+def chunk_header_line(idx: int, chunk: str) -> str:
+    hdr = dict(CHUNK_HEADER_RE.findall(chunk.split("Body:\n", 1)[0]))
+    return f"[MSG {idx}] {hdr.get('Date', '')} | {hdr.get('From', '')} | {hdr.get('Subject', '')}"
+
+def build_resolve_context(thread_text: str, msg_chunks: List[str], start_idx: int) -> str:
+    # Messages from start_idx on are sent verbatim; earlier ones are reduced to one header line each
+    if start_idx <= 1:
+        return thread_text
+    earlier = "\n".join(chunk_header_line(i, msg_chunks[i-1]) for i in range(1, start_idx))
+    tail = "\n---\n".join(msg_chunks[start_idx-1:]).strip()
+    return f"[EARLIER MESSAGES 1-{start_idx - 1}: headers only]\n{earlier}\n---\n{tail}"
+
+def resolve_context_for(ctx: RunContext, thread_text: str, qi: QuoteIndex, drafts: List[IssueDraft]) -> Tuple[str, Dict[str, int]]:
+    text = thread_text
+    if ctx.resolve_context == "sliced":
+        starts = [qi.min_index(it.evidence_quotes) for it in drafts]
+        text = build_resolve_context(thread_text, qi.chunks, 0 if 0 in starts else min(starts, default=0))
+    full = estimate_tokens(thread_text, RESOLVE_MODEL)
+    sent = full if text is thread_text else estimate_tokens(text, RESOLVE_MODEL)
+    return text, {"full_thread": full, "sent": sent}
+
+def count_resolve_call(ctx: RunContext, tokens: Dict[str, int]) -> None:
+    ctx.resolve_tokens["full_thread"] += tokens["full_thread"]
+    ctx.resolve_tokens["sent"] += tokens["sent"]
+    ctx.resolve_tokens["calls"] += 1
+
+def split_batch_tokens(tokens: Dict[str, int], n: int) -> List[Dict[str, int]]:
+    # Per-issue shares of one batched call that sum back to it: tokens split evenly (remainder to the
+    # first issues) and the call itself counted on the first issue
+    shares = []
+    for i in range(n):
+        share = {k: v // n + (1 if i < v % n else 0) for k, v in tokens.items()}
+        share["calls"] = 1 if i == 0 else 0
+        shares.append(share)
+    return shares
+
+async def resolve_issue(ctx: RunContext, it: IssueDraft, thread_text: str, qi: QuoteIndex, second_pass: bool = True,
+                        strong_only: bool = False) -> Tuple[str, List[str], ResolutionDecision, Dict[str, int], str]:
+    candidates = issue_candidates(qi, it)
+    context, call_tokens = resolve_context_for(ctx, thread_text, qi, [it])
+    # Every resolve call for this issue (cascade tiers, second pass) adds the same input to its own and the run's totals
+    tokens = {"full_thread": 0, "sent": 0, "calls": 0}
+
+    def count_call() -> None:
+        count_resolve_call(ctx, call_tokens)
+        tokens["full_thread"] += call_tokens["full_thread"]
+        tokens["sent"] += call_tokens["sent"]
+        tokens["calls"] += 1
+
+    inputs = {
+        "thread_text": context,
+        "issue_json": json.dumps(it.model_dump(), ensure_ascii=False),
+        "candidate_snippets": json.dumps(candidates, ensure_ascii=False),
+    }
+    # A resolved claim without later, present proof escalates to the strong tier before it is downgraded
+    tiers = stage_tiers(ctx, "resolve")
+    asked = tiers[-1:] if strong_only else tiers
+    decision, tier = await run_cascade(ctx, "resolve", inputs, tiers=asked,
+                                       accept=lambda d: d.status != "resolved" or resolution_is_grounded(qi, it, d.resolution_quotes or []))
+    for _ in range([t for t, _ in asked].index(tier) + 1):
+        count_call()
+
+    status = decision.status
+    res_quotes = decision.resolution_quotes or []
+
+    # If AI claims resolved, enforce proof + ordering
+    if status == "resolved" and not resolution_is_grounded(qi, it, res_quotes):
+        ctx.metrics.reject(ctx.thread_id, "resolution_ungrounded")
+        status = "unknown"
+        res_quotes = []
+
+    # Second pass if we found candidates but status isn't resolved
+    if second_pass and status in ("unresolved", "unknown") and candidates:
+        # The re-ask always goes to the strongest tier
+        strong_tier, strong_model = tiers[-1]
+        decision2: ResolutionDecision = await run_chain(ctx, "resolve", inputs, attempt=2, model=strong_model)
+        count_call()
+        if decision2.status == "resolved" and resolution_is_grounded(qi, it, decision2.resolution_quotes):
+            status = "resolved"
+            res_quotes = decision2.resolution_quotes
+            decision = decision2
+            tier = strong_tier
+        elif decision2.status == "resolved":
+            ctx.metrics.reject(ctx.thread_id, "resolution_ungrounded")
+
+    return status, res_quotes, decision, tokens, tier
+
+async def resolve_issues_batch(ctx: RunContext, drafts: List[IssueDraft], thread_text: str, qi: QuoteIndex) -> List[Tuple[str, List[str], ResolutionDecision, Dict[str, int], str]]:
+    # One call adjudicates every issue of the thread; only issues whose decision is missing
+    # or fails the grounding guardrails fall back to a single-issue call (on the strong tier when cascading).
+    issues = []
+    for n, it in enumerate(drafts, 1):
+        item = it.model_dump()
+        item["issue_id"] = f"I{n}"
+        item["candidate_resolution_snippets"] = issue_candidates(qi, it)
+        issues.append(item)
+    context, tokens = resolve_context_for(ctx, thread_text, qi, drafts)
+    tier, model = stage_tiers(ctx, "resolve_batch")[0]
+    batch: ThreadResolutions = await run_chain(ctx, "resolve_batch", {
+        "thread_text": context,
+        "issues_json": json.dumps(issues, ensure_ascii=False),
+    }, model=model)
+    count_resolve_call(ctx, tokens)
+    shares = split_batch_tokens(tokens, len(drafts))
+    by_id = {d.issue_id.strip(): d for d in (batch.decisions or [])}
+
+    results: List[Optional[Tuple[str, List[str], ResolutionDecision, Dict[str, int], str]]] = [None] * len(drafts)
+    retry: List[int] = []
+    for n, it in enumerate(drafts):
+        decision = by_id.get(f"I{n + 1}")
+        if decision is None:
+            ctx.metrics.reject(ctx.thread_id, "batch_decision_missing")
+            retry.append(n)
+            continue
+        res_quotes = decision.resolution_quotes or []
+        if decision.status == "resolved" and not resolution_is_grounded(qi, it, res_quotes):
+            ctx.metrics.reject(ctx.thread_id, "resolution_ungrounded")
+            retry.append(n)
+            continue
+        results[n] = (decision.status, res_quotes if decision.status == "resolved" else [], decision, shares[n], tier)
+        if ctx.cascade:
+            cascade_count(ctx, "resolve_batch", f"answered:{tier}")
+
+    if retry and ctx.cascade and tier != "strong":
+        cascade_count(ctx, "resolve_batch", "escalated:guardrail")
+    retried = await asyncio.gather(*(resolve_issue(ctx, drafts[n], thread_text, qi, second_pass=False, strong_only=ctx.cascade) for n in retry))
+    for n, (status, res_quotes, decision, own, tier) in zip(retry, retried):
+        results[n] = (status, res_quotes, decision, {k: own[k] + shares[n][k] for k in own}, tier)
+    return results
+
+def draft_is_grounded(qi: QuoteIndex, draft: ThreadIssuesDraft) -> bool:
+    return all(it.title.strip() and qi.present(it.evidence_quotes) for it in (draft.issues or []))
+
+async def draft_issues(ctx: RunContext, thread_text: str, qi: QuoteIndex) -> Tuple[List[IssueDraft], str]:
+    # Returns the drafts and the tier that produced them ("strong" if any window needed it).
+    # Windows must fit every model the cascade may send them to, so the smallest budget wins.
+    budget, model = min((draft_window_budget(m, ctx.draft_window_tokens), m) for _, m in stage_tiers(ctx, "draft", count=False))
+    accept = functools.partial(draft_is_grounded, qi)
+    if (ctx.thread_tokens if model == ANALYZE_MODEL else estimate_tokens(thread_text, model)) <= budget:
+        draft, tier = await run_cascade(ctx, "draft", {"thread_text": thread_text}, accept)
+        return list(draft.issues or []), tier
+
+    windows = split_windows(qi.chunks, budget, ctx.window_overlap, model)
+    answered = await asyncio.gather(*(
+        run_cascade(ctx, "draft", {"thread_text": "\n---\n".join(qi.chunks[a:b]).strip()}, accept) for a, b in windows
+    ))
+    window_drafts = [d for d, _ in answered]
+    tier = "strong" if any(t == "strong" for _, t in answered) else "fast"
+    # Quotes are grounded against the full thread before merging so a hallucinated quote can't ride along
+    grounded: List[IssueDraft] = []
+    for it in (it for d in window_drafts for it in (d.issues or [])):
+        if not it.title.strip():
+            ctx.metrics.reject(ctx.thread_id, "draft_empty_title")
+        elif not qi.present(it.evidence_quotes):
+            ctx.metrics.reject(ctx.thread_id, "draft_quote_missing")
+        else:
+            grounded.append(it)
+    return merge_window_drafts(grounded), tier
+
+async def resolve_drafts(ctx: RunContext, drafts: List[IssueDraft], thread_text: str, qi: QuoteIndex,
+                         downgrade: bool = False) -> List[Tuple[str, List[str], ResolutionDecision, Dict[str, int], str]]:
+    # One batched call per thread, or all issues concurrently (gather keeps draft order)
+    if ctx.resolve_mode == "batch" and drafts:
+        return await resolve_issues_batch(ctx, drafts, thread_text, qi)
+    return list(await asyncio.gather(*(resolve_issue(ctx, it, thread_text, qi, second_pass=not downgrade) for it in drafts)))
+
+# Portfolio issue dedupe: MinHash signatures over the content words of title + evidence quotes, LSH banding for
+# candidate pairs, and leader clustering: an issue joins a cluster only if it is similar to the cluster's first issue
+DEFAULT_DEDUPE = os.getenv("AGENT_DEDUPE", "0") == "1"
+DEFAULT_DEDUPE_THRESHOLD = float(os.getenv("AGENT_DEDUPE_THRESHOLD", "0.6"))
+MINHASH_KEYS = [f"minhash-{i}".encode() for i in range(4)]  # 4 keyed BLAKE2b digests x 16 32-bit words
+MINHASH_PERM = 16 * len(MINHASH_KEYS)
+LSH_BANDS = 16  # x 4 rows: pairs at Jaccard 0.6 share a band with ~89% probability, at 0.8 with >99.9%
+# Issues with fewer content words ("Has this been confirmed with the client?") are generic asks, not incidents; they never cluster
+DEDUPE_MIN_SHINGLES = 4
+# The identical content words in this many threads (a stock question, a signature line) are boilerplate, not one incident
+DEDUPE_BOILERPLATE_SHARE = 0.05
+DEDUPE_BOILERPLATE_MIN_THREADS = 10
+SHINGLE_WORD_RE = re.compile(r"\w{2,}")
+DEDUPE_STOPWORDS = frozenset("""
+    the and for are was were been being has have had not but you your our we they them this that these those with from into
+    over after before since about there here what which who when where why how can could would should will shall may might
+    must all any some its it is be to of in on at by as or if so do does did just also still very please thanks thank hi
+""".split())
+
+def issue_shingles(it: IssueDraft) -> set:
+    # Bag of content words cut to 6 characters (a cheap stem: deploy/deployed/deployment agree), so paraphrased
+    # titles of the same incident overlap while templated asks about different topics do not
+    words = SHINGLE_WORD_RE.findall(unicodedata.normalize("NFKC", " ".join([it.title, *it.evidence_quotes])).casefold())
+    return {w[:6] for w in words if w not in DEDUPE_STOPWORDS}
+
+def minhash(shingles: set) -> Tuple[int, ...]:
+    rows = []
+    for sh in shingles:
+        b = sh.encode("utf-8")
+        rows.append([v for k in MINHASH_KEYS for v in struct.unpack("<16I", hashlib.blake2b(b, digest_size=64, key=k).digest())])
+    return tuple(map(min, zip(*rows))) if rows else ()
+
+def minhash_similarity(a: Tuple[int, ...], b: Tuple[int, ...]) -> float:
+    if not a or not b:
+        return 0.0
+    return sum(x == y for x, y in zip(a, b)) / len(a)
+
+def cluster_signatures(keys: List[str], sigs: List[Tuple[int, ...]], threshold: float,
+                       compatible: Optional[Callable[[int, int], bool]] = None) -> List[List[int]]:
+    # Items only cluster with the same key (flag + project) and, if given, when compatible(item, leader) holds.
+    # Comparing against leaders (not any member) avoids single-linkage chains where A~B and B~C pull unrelated
+    # A and C together; each bucket holds leaders only, so work stays near-linear. Empty signatures stay alone.
+    rows = MINHASH_PERM // LSH_BANDS
+    leader = list(range(len(sigs)))
+    buckets: Dict[Tuple[str, int, Tuple[int, ...]], List[int]] = {}
+    for i, sig in enumerate(sigs):
+        if not sig:
+            continue
+        bands = [(keys[i], band, sig[band*rows:(band+1)*rows]) for band in range(LSH_BANDS)]
+        seen = set()
+        best, best_sim = None, threshold
+        for key in bands:
+            for j in buckets.get(key, ()):
+                if j in seen:
                     continue
-                ev_counter += 1
-                ev_id = f"E{ev_counter}"
-                evidence_bank[ev_id] = qq
-                ids.append(ev_id)
-            return ids
-
-        for it in drafts:
-            prob_idx = max_problem_msg_index(msg_chunks, it.evidence_quotes)
-            candidates = harvest_resolution_snippets(msg_chunks, after_msg_index=prob_idx + 1, limit=6)
-
-            issue_json = json.dumps(it.model_dump(), ensure_ascii=False)
-
-            decision: ResolutionDecision = resolve_chain.invoke({
-                "thread_text": thread_text,
-                "issue_json": issue_json,
-                "candidate_snippets": json.dumps(candidates, ensure_ascii=False),
-            })
-
-            status = decision.status
-            res_quotes = decision.resolution_quotes or []
-
-            # If AI claims resolved, enforce proof + ordering
-            if status == "resolved":
-                if (not res_quotes) or (not quotes_present(thread_text, res_quotes)) or (not resolution_quotes_are_later(msg_chunks, it.evidence_quotes, res_quotes)):
-                    status = "unknown"
-                    res_quotes = []
-
-            # Second pass if we found candidates but status isn't resolved
-            if status in ("unresolved", "unknown") and candidates:
-                decision2: ResolutionDecision = resolve_chain.invoke({
-                    "thread_text": thread_text,
-                    "issue_json": issue_json,
-                    "candidate_snippets": json.dumps(candidates, ensure_ascii=False),
+                seen.add(j)
+                if compatible is not None and not compatible(i, j):
+                    continue
+                sim = minhash_similarity(sig, sigs[j])
+                if sim >= best_sim and (best is None or sim > best_sim):
+                    best, best_sim = j, sim
+        if best is not None:
+            leader[i] = best
+        else:
+            for key in bands:
+                buckets.setdefault(key, []).append(i)
+    groups: Dict[int, List[int]] = {}
+    for i in range(len(sigs)):
+        groups.setdefault(leader[i], []).append(i)
+    return list(groups.values())
+
+@dataclass
+class PendingThread:
+    ctx: "RunContext"
+    drafts: List[IssueDraft]
+    sigs: List[Tuple[int, ...]]
+    thread_text: str
+    qi: QuoteIndex
+    downgrade: bool
+    end_ts: float
+    project: str
+    participants: frozenset
+    done: asyncio.Future
+
+class IssueDeduper:
+    """
+    Barrier across the analyzed threads of a run: each thread submits its grounded drafts after drafting and waits.
+    Once ingestion is finished and every entered thread has submitted (or left), all drafts are clustered,
+    one representative per cluster is resolved in its own thread, and its decision is offered to the rest.
+    Clustering runs on the full set in ingestion order, so results don't depend on completion order.
+
+    A member keeps the representative's decision only if its own thread agrees: a "resolved" needs the resolution
+    quotes present in the member's thread and later than its problem, an open status must not be contradicted by
+    resolution cues after the problem. Otherwise the member is resolved in its own thread like without dedupe.
+
+    The barrier means no thread is resolved before every thread has been drafted: the drafts of the whole run
+    stay in memory, and --out_jsonl writes nothing until drafting has finished for all threads.
+    """
+
+    def __init__(self, threshold: float = DEFAULT_DEDUPE_THRESHOLD):
+        self.threshold = threshold
+        self.order: Dict[str, int] = {}
+        self.pending: Dict[str, PendingThread] = {}
+        self.closed = False
+        self.task: Optional[asyncio.Task] = None
+        self.clusters: List[Dict[str, Any]] = []
+        self.issues = 0
+        self.unique = 0
+        self.resolve_skipped = 0
+        self.resolved_locally = 0
+        self.boilerplate = 0
+
+    def enter(self, tid: str, order: int) -> None:
+        self.order[tid] = order
+
+    def leave(self, tid: str) -> None:
+        # A thread that will not submit (no drafts, or it failed) must not hold the barrier
+        if tid not in self.pending:
+            self.order.pop(tid, None)
+            self._maybe_run()
+
+    def close(self) -> None:
+        self.closed = True
+        self._maybe_run()
+
+    def _maybe_run(self) -> None:
+        if self.closed and self.task is None and len(self.pending) == len(self.order):
+            self.task = asyncio.get_running_loop().create_task(self._run())
+
+    async def resolve(self, ctx: "RunContext", drafts: List[IssueDraft], thread: List[EmailMessage], thread_text: str, qi: QuoteIndex,
+                      downgrade: bool) -> Tuple[List[Tuple[str, List[str], ResolutionDecision, Dict[str, int], str]], List[Optional[Dict[str, Any]]]]:
+        tid = ctx.thread_id
+        if not drafts:
+            self.leave(tid)
+            return [], []
+        t0 = time.perf_counter()
+        shingles = [issue_shingles(it) for it in drafts]
+        sigs = [minhash(sh) if len(sh) >= DEDUPE_MIN_SHINGLES else () for sh in shingles]
+        ctx.metrics.record(tid, "dedupe", calls=1, wall_s=time.perf_counter() - t0)
+        done = asyncio.get_running_loop().create_future()
+        members = frozenset(a for m in thread for a in participants(m))
+        self.pending[tid] = PendingThread(ctx, drafts, sigs, thread_text, qi, downgrade, utc_ts(thread[-1].date),
+                                          project_of(thread[0].subject), members, done)
+        self._maybe_run()
+        return await done
+
+    async def _run(self) -> None:
+        try:
+            await self._resolve_clusters()
+        except BaseException as e:
+            for p in self.pending.values():
+                if not p.done.done():
+                    p.done.set_exception(e)
+            raise
+
+    async def _resolve_clusters(self) -> None:
+        if not self.pending:
+            return
+        items = sorted(((self.order[tid], tid, i) for tid, p in self.pending.items() for i in range(len(p.drafts))))
+        pend = self.pending
+        t0 = time.perf_counter()
+        spread: Dict[Tuple[int, ...], set] = {}
+        for _, tid, i in items:
+            spread.setdefault(pend[tid].sigs[i], set()).add(tid)
+        limit = max(DEDUPE_BOILERPLATE_MIN_THREADS, DEDUPE_BOILERPLATE_SHARE * len(pend))
+        sigs = [() if len(spread[pend[tid].sigs[i]]) >= limit else pend[tid].sigs[i] for _, tid, i in items]
+        self.boilerplate = sum(1 for (_, tid, i), sig in zip(items, sigs) if pend[tid].sigs[i] and not sig)
+        # Same flag and project, and the two threads must share at least one participant
+        groups = cluster_signatures([f"{pend[tid].drafts[i].flag}|{pend[tid].project}" for _, tid, i in items], sigs, self.threshold,
+                                    compatible=lambda a, b: not pend[items[a][1]].participants.isdisjoint(pend[items[b][1]].participants))
+        # Representative: the member from the thread that ran longest (most likely to hold the resolution), then ingestion order
+        reps: Dict[Tuple[str, int], Tuple[str, int]] = {}
+        multi: List[Tuple[Tuple[str, int], List[Tuple[str, int]]]] = []
+        for members in groups:
+            keys = [(items[n][1], items[n][2]) for n in members]
+            rep = min(keys, key=lambda k: (-self.pending[k[0]].end_ts, self.order[k[0]], k[1]))
+            for k in keys:
+                reps[k] = rep
+            if len(keys) > 1:
+                multi.append((rep, keys))
+        self.issues = len(items)
+        self.unique = len(groups)
+        first = next(iter(self.pending.values()))
+        first.ctx.metrics.record(None, "dedupe", calls=1, wall_s=time.perf_counter() - t0)
+
+        # Representatives are resolved per thread with the normal single/batch path; everything else copies their answer
+        rep_idx = {tid: [i for i in range(len(p.drafts)) if reps[(tid, i)] == (tid, i)] for tid, p in self.pending.items()}
+        tids = [tid for tid in rep_idx if rep_idx[tid]]
+        answered = await asyncio.gather(*(
+            resolve_drafts(p.ctx, [p.drafts[i] for i in rep_idx[tid]], p.thread_text, p.qi, p.downgrade)
+            for tid, p in ((tid, self.pending[tid]) for tid in tids)
+        ))
+        decided = {(tid, i): res for tid, results in zip(tids, answered) for i, res in zip(rep_idx[tid], results)}
+        self.clusters = [self._cluster_entry(rep, keys, decided[rep][0]) for rep, keys in multi]
+
+        # Members whose own thread contradicts the representative's decision are resolved in that thread
+        local: Dict[str, List[int]] = {}
+        for tid, p in pend.items():
+            for i, it in enumerate(p.drafts):
+                rep = reps[(tid, i)]
+                if rep != (tid, i) and not self._holds(p, it, decided[rep]):
+                    local.setdefault(tid, []).append(i)
+        answered = await asyncio.gather(*(
+            resolve_drafts(pend[tid].ctx, [pend[tid].drafts[i] for i in idx], pend[tid].thread_text, pend[tid].qi, pend[tid].downgrade)
+            for tid, idx in local.items()
+        ))
+        for (tid, idx), results in zip(local.items(), answered):
+            for i, res in zip(idx, results):
+                reps[(tid, i)] = (tid, i)
+                decided[(tid, i)] = res
+        self.resolved_locally = sum(len(idx) for idx in local.values())
+        self.resolve_skipped = sum(1 for k, r in reps.items() if k != r)
+
+        no_call = {"full_thread": 0, "sent": 0, "calls": 0}
+        for tid, p in self.pending.items():
+            resolutions, links = [], []
+            for i, it in enumerate(p.drafts):
+                rep = reps[(tid, i)]
+                status, res_quotes, decision, tokens, tier = decided[rep]
+                if rep == (tid, i):
+                    resolutions.append((status, res_quotes, decision, tokens, tier))
+                    links.append(None)
+                    continue
+                rep_draft = self.pending[rep[0]].drafts[rep[1]]
+                resolutions.append((status, res_quotes, decision, dict(no_call), tier))
+                links.append({
+                    "representative_thread_id": rep[0],
+                    "representative_title": rep_draft.title,
+                    "similarity": round(minhash_similarity(p.sigs[i], self.pending[rep[0]].sigs[rep[1]]), 3),
                 })
-                if decision2.status == "resolved":
-                    if decision2.resolution_quotes and quotes_present(thread_text, decision2.resolution_quotes) and resolution_quotes_are_later(msg_chunks, it.evidence_quotes, decision2.resolution_quotes):
-                        status = "resolved"
-                        res_quotes = decision2.resolution_quotes
-                        decision = decision2
-
-            # Map to message metadata for opened_at/subject convenience
-            opened_at = thread[0].date.isoformat()
-            subject = thread[0].subject
-            if it.evidence_quotes:
-                mi = locate_quote_msg_index(msg_chunks, it.evidence_quotes[0])
-                if mi and 1 <= mi <= len(thread):
-                    opened_at = thread[mi-1].date.isoformat()
-                    subject = thread[mi-1].subject
-
-            ev_ids = add_evidence(it.evidence_quotes[:3])
-            res_ids = add_evidence(res_quotes[:3]) if res_quotes else []
-
-            out: Dict[str, Any] = {
-                "type": issue_type(it.flag),
-                "subject": subject,
-                "opened_at": opened_at,
-                "title": it.title,
-                issue_level_key(it.flag): it.severity_or_priority,
-                "flag": it.flag,
-                "status": status,
-                "resolved_later": True if status == "resolved" else False,
-                "rationale_flag_level": it.rationale_flag_level,
-                "rationale_status": decision.rationale_status,
-                "evidence_ids": ev_ids,
-                "evidence_quotes": it.evidence_quotes[:3],
-                "resolution_evidence_ids": res_ids,
-                "resolution_quotes": res_quotes[:3],
-            }
-            finalized.append(out)
+            p.done.set_result((resolutions, links))
+
+    @staticmethod
+    def _holds(p: PendingThread, it: IssueDraft, decision: Tuple[str, List[str], ResolutionDecision, Dict[str, int], str]) -> bool:
+        # The same guardrails as a decision made in this thread: proof present here and later than the problem,
+        # and no unexamined resolution cues after the problem for an open status
+        status, res_quotes = decision[0], decision[1]
+        if status == "resolved":
+            return resolution_is_grounded(p.qi, it, res_quotes)
+        return not issue_candidates(p.qi, it)
+
+    def _cluster_entry(self, rep: Tuple[str, int], keys: List[Tuple[str, int]], status: str) -> Dict[str, Any]:
+        rank = {"high": 2, "medium": 1, "low": 0}
+        drafts = [self.pending[tid].drafts[i] for tid, i in keys]
+        rep_draft = self.pending[rep[0]].drafts[rep[1]]
+        return {
+            "title": rep_draft.title,
+            "flag": rep_draft.flag,
+            "level": max((d.severity_or_priority for d in drafts), key=rank.__getitem__),
+            "status": status,
+            "representative_thread_id": rep[0],
+            "thread_ids": sorted({tid for tid, _ in keys}, key=self.order.__getitem__),
+            "issues": len(keys),
+        }
+
+    def rollup(self) -> Dict[str, Any]:
+        # Portfolio view: every cluster with more than one issue, open and most severe first, then by spread
+        rank = {"high": 2, "medium": 1, "low": 0}
+        clusters = sorted(self.clusters, key=lambda c: (c["status"] == "resolved", -rank[c["level"]], -len(c["thread_ids"]), c["title"]))
+        return {
+            "threshold": self.threshold,
+            "issues": self.issues,
+            "unique_issues": self.unique,
+            "duplicates": self.resolve_skipped,
+            "resolved_locally": self.resolved_locally,
+            "boilerplate": self.boilerplate,
+            "clusters": clusters,
+        }
+
+async def analyze_thread(ctx: RunContext, tid: str, thread: List[EmailMessage], redact: bool, downgrade: bool = False) -> Dict[str, Any]:
+    # downgrade (pre-triage): no second-pass resolves and a local summary instead of the summary call
+    started = time.perf_counter()
+    ctx = replace(ctx, thread_id=tid, thread_started=started)
+    if redact:
+        # Once per message; thread text, chunks, quotes and subjects all derive from the redacted messages
+        t0 = time.perf_counter()
+        thread = [ctx.pseudonyms.redact_message(m) for m in thread]
+        ctx.metrics.record(tid, "redact", calls=1, wall_s=time.perf_counter() - t0)
+    thread_text, msg_chunks = build_thread_text(thread)
+    ctx.thread_tokens = estimate_tokens(thread_text, ANALYZE_MODEL)
+
+    # Step 1: Draft issues from full thread (map-reduce over message windows when it exceeds the token budget)
+    qi = QuoteIndex(msg_chunks, ctx.quote_match)
+    raw_drafts, draft_tier = await draft_issues(ctx, thread_text, qi)
+
+    drafts: List[IssueDraft] = []
+    for it in raw_drafts:
+        if not it.title.strip():
+            ctx.metrics.reject(tid, "draft_empty_title")
+            continue
+        if not qi.present(it.evidence_quotes):
+            ctx.metrics.reject(tid, "draft_quote_missing")
+            continue
+        drafts.append(it)
+
+    # Step 2: Resolve issues; with --dedupe, near-duplicates across threads share one representative's decision
+    links: List[Optional[Dict[str, Any]]] = [None] * len(drafts)
+    if ctx.dedupe is not None:
+        resolutions, links = await ctx.dedupe.resolve(ctx, drafts, thread, thread_text, qi, downgrade)
+        # A copied decision passes the same guardrails as one made here; only quotes found in this thread become evidence
+        for n, (it, link) in enumerate(zip(drafts, links)):
+            status, res_quotes, decision, resolve_tokens, resolve_tier = resolutions[n]
+            if link is not None and status == "resolved" and not resolution_is_grounded(qi, it, res_quotes):
+                ctx.metrics.reject(tid, "resolution_ungrounded")
+                resolutions[n] = ("unknown", [], decision, resolve_tokens, resolve_tier)
+    else:
+        resolutions = await resolve_drafts(ctx, drafts, thread_text, qi, downgrade)
+
+    finalized: List[Dict[str, Any]] = []
+    evidence_bank: Dict[str, str] = {}
+    ev_counter = 0
+
+    def add_evidence(quotes: List[str]) -> List[str]:
+        nonlocal ev_counter
+        ids: List[str] = []
+        for q in quotes or []:
+            qq = (q or "").strip()
+            if not qq:
+                continue
+            ev_counter += 1
+            ev_id = f"E{ev_counter}"
+            evidence_bank[ev_id] = qq
+            ids.append(ev_id)
+        return ids
+
+    # Evidence IDs are assigned only after all resolutions are back, so numbering is deterministic
+    for it, (status, res_quotes, decision, resolve_tokens, resolve_tier), link in zip(drafts, resolutions, links):
+        # Map to message metadata for opened_at/subject convenience
+        opened_at = thread[0].date.isoformat()
+        subject = thread[0].subject
+        if it.evidence_quotes:
+            mi = qi.locate(it.evidence_quotes[0])
+            if mi and 1 <= mi <= len(thread):
+                opened_at = thread[mi-1].date.isoformat()
+                subject = thread[mi-1].subject
+
+        ev_ids = add_evidence(it.evidence_quotes[:3])
+        res_ids = add_evidence(res_quotes[:3]) if res_quotes else []
+
+        out: Dict[str, Any] = {
+            "type": issue_type(it.flag),
+            "subject": subject,
+            "opened_at": opened_at,
+            "title": it.title,
+            issue_level_key(it.flag): it.severity_or_priority,
+            "flag": it.flag,
+            "status": status,
+            "resolved_later": True if status == "resolved" else False,
+            "rationale_flag_level": it.rationale_flag_level,
+            "rationale_status": decision.rationale_status,
+            "evidence_ids": ev_ids,
+            "evidence_quotes": it.evidence_quotes[:3],
+            "resolution_evidence_ids": res_ids,
+            "resolution_quotes": res_quotes[:3],
+            "resolve_input_tokens": resolve_tokens,
+        }
+        if ctx.cascade:
+            out["answered_by"] = {"draft": draft_tier, "resolve": resolve_tier}
+        if link is not None:
+            out["duplicate"] = link
+        finalized.append(out)
+
+    # Attention flags = unresolved + unknown only
+    A = [x for x in finalized if x["flag"] == "A_unresolved_action_item" and x["status"] in ("unresolved", "unknown")]
+    B = [x for x in finalized if x["flag"] == "B_emerging_risk_blocker" and x["status"] in ("unresolved", "unknown")]
+
+    rank = {"high": 2, "medium": 1, "low": 0}
+    def sort_key(x):
+        level = x.get("priority") or x.get("severity") or "low"
+        return (-rank.get(level, 0), 0 if x["status"] == "unresolved" else 1)
+
+    A.sort(key=sort_key)
+    B.sort(key=sort_key)
+
+    # Step 3: Executive summary (with --summary_mode batch: template text when nothing is open, else packed with other threads)
+    summary_tier = summary_source = "local"
+    if ctx.summaries is not None and not (A or B):
+        summary, summary_source = SummaryResult(summary_md=template_summary_md(finalized)), "template"
+        ctx.summaries.stats["templates"] += 1
+        ctx.summaries.leave(tid)
+    elif downgrade:
+        summary = SummaryResult(summary_md=local_summary_md(A, B))
+        if ctx.summaries is not None:
+            ctx.summaries.leave(tid)
+    else:
+        payload = {"thread_id": tid, "attention_flag_A": A, "attention_flag_B": B, "evidence": evidence_bank}
+        if ctx.summaries is not None:
+            summary, summary_tier, summary_source = await ctx.summaries.summarize(ctx, payload)
+        else:
+            summary, summary_tier = await run_cascade(ctx, "summary", {"payload_json": json.dumps(payload, ensure_ascii=False)},
+                                                      accept=lambda r: summary_is_grounded(r.summary_md, evidence_bank, bool(A or B)))
+    ctx.metrics.thread_done(tid, time.perf_counter() - started)
+
+    entry = {
+        "thread_id": tid,
+        "source_files": sorted(set(m.source_file for m in thread)),
+        "time_range": {"start": thread[0].date.isoformat(), "end": thread[-1].date.isoformat()},
+        "attention_flags": {"A_unresolved_action_items": A, "B_emerging_risks_blockers": B},
+        "all_issues": finalized,
+        "evidence": evidence_bank,
+        "executive_summary_md": summary.summary_md,
+    }
+    if ctx.cascade:
+        entry["answered_by"] = {"draft": draft_tier, "summary": summary_tier}
+    if ctx.summaries is not None:
+        entry["summary_source"] = summary_source
+    return entry
+
+EVIDENCE_REF_RE = re.compile(r"\[(E\d+)\]")
+
+def summary_is_grounded(summary_md: str, evidence_bank: Dict[str, str], has_items: bool) -> bool:
+    # Every cited [E#] must exist, and a thread with open items must cite at least one
+    refs = EVIDENCE_REF_RE.findall(summary_md or "")
+    return all(r in evidence_bank for r in refs) and (bool(refs) or not has_items)
+
+def pack_by_tokens(sizes: List[int], budget: int, max_items: int = 0, min_items: int = 1) -> List[Tuple[int, int]]:
+    # Consecutive [start, end) groups within the token budget; an item larger than the budget goes alone (or with min_items - 1 others)
+    groups: List[Tuple[int, int]] = []
+    start, used = 0, 0
+    for i, n in enumerate(sizes):
+        size = i - start
+        if size >= min_items and (used + n > budget or (max_items and size >= max_items)):
+            groups.append((start, i))
+            start, used = i, 0
+        used += n
+    if start < len(sizes):
+        groups.append((start, len(sizes)))
+    return groups
 
-        # Attention flags = unresolved + unknown only
-        A = [x for x in finalized if x["flag"] == "A_unresolved_action_item" and x["status"] in ("unresolved", "unknown")]
-        B = [x for x in finalized if x["flag"] == "B_emerging_risk_blocker" and x["status"] in ("unresolved", "unknown")]
+@dataclass
+class PendingSummary:
+    ctx: "RunContext"
+    payload: Dict[str, Any]
+    tokens: int
+    done: asyncio.Future
+
+class SummaryBatcher:
+    """
+    Packs the summary requests of several threads into one summary_batch call within a token budget.
+    Threads are taken strictly in ingestion order (a batch waits until the next thread submits or leaves),
+    so batch composition and cache keys don't depend on completion order. A thread that is missing from
+    the batch answer, or whose summary cites unknown evidence, falls back to its own summary call.
+    """
+
+    def __init__(self, budget: int = DEFAULT_SUMMARY_BATCH_TOKENS, max_threads: int = SUMMARY_BATCH_MAX_THREADS):
+        self.budget = budget
+        self.max_threads = max_threads
+        self.queue: List[str] = []
+        self.pos: Dict[str, int] = {}
+        self.ready: Dict[str, PendingSummary] = {}
+        self.left: set = set()
+        self.cursor = 0
+        self.batch: List[PendingSummary] = []
+        self.batch_tokens = 0
+        self.closed = False
+        self.tasks: set = set()
+        self.stats = {"batch_calls": 0, "batched_threads": 0, "single_calls": 0, "fallbacks": 0, "templates": 0}
+
+    def enter(self, tid: str) -> None:
+        self.pos[tid] = len(self.queue)
+        self.queue.append(tid)
+
+    def leave(self, tid: str) -> None:
+        # A thread that will not submit (template/local summary, reused, skipped or failed) must not hold up its batch
+        if tid in self.pos and tid not in self.ready:
+            self.left.add(tid)
+            self._advance()
+
+    def close(self) -> None:
+        self.closed = True
+        self._advance()
+
+    async def summarize(self, ctx: "RunContext", payload: Dict[str, Any]) -> Tuple[SummaryResult, str, str]:
+        tokens = estimate_tokens(json.dumps(payload, ensure_ascii=False), SUMMARY_MODEL)
+        done = asyncio.get_running_loop().create_future()
+        self.ready[ctx.thread_id] = PendingSummary(ctx, payload, tokens, done)
+        self._advance()
+        return await done
+
+    def _advance(self) -> None:
+        while self.cursor < len(self.queue):
+            tid = self.queue[self.cursor]
+            if tid in self.left:
+                self.left.discard(tid)
+            elif tid in self.ready:
+                p = self.ready.pop(tid)
+                if self.batch and self.batch_tokens + p.tokens > self.budget:
+                    self._flush()
+                self.batch.append(p)
+                self.batch_tokens += p.tokens
+                if len(self.batch) >= self.max_threads:
+                    self._flush()
+            else:
+                break  # the next thread in order is still being analyzed
+            del self.pos[tid]
+            self.cursor += 1
+        if self.closed and self.cursor == len(self.queue) and self.batch:
+            self._flush()
+
+    def _flush(self) -> None:
+        batch, self.batch, self.batch_tokens = self.batch, [], 0
+        task = asyncio.get_running_loop().create_task(self._run(batch))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def _run(self, batch: List[PendingSummary]) -> None:
+        try:
+            await self._summarize_batch(batch)
+        except Exception as e:
+            # Delivered to every waiting thread; nobody awaits this task itself
+            for p in batch:
+                if not p.done.done():
+                    p.done.set_exception(e)
+        except BaseException:
+            for p in batch:
+                p.done.cancel()
+            raise
+
+    @staticmethod
+    async def _summarize_one(p: PendingSummary) -> Tuple[SummaryResult, str]:
+        evidence = p.payload["evidence"]
+        return await run_cascade(p.ctx, "summary", {"payload_json": json.dumps(p.payload, ensure_ascii=False)},
+                                 accept=lambda r: summary_is_grounded(r.summary_md, evidence, True))
+
+    async def _summarize_batch(self, batch: List[PendingSummary]) -> None:
+        if len(batch) == 1:
+            # Same inputs as --summary_mode per_thread, so the cache is shared between the modes
+            self.stats["single_calls"] += 1
+            summary, tier = await self._summarize_one(batch[0])
+            batch[0].done.set_result((summary, tier, "single"))
+            return
+        # The batch call is attributed to no thread; it runs on the first tier the longest member would get
+        ctx = replace(batch[0].ctx, thread_id=None, thread_started=min(p.ctx.thread_started for p in batch),
+                      thread_tokens=max(p.ctx.thread_tokens for p in batch))
+        tier, model = stage_tiers(ctx, "summary_batch")[0]
+        answer = await run_chain(ctx, "summary_batch", {"threads_json": json.dumps([p.payload for p in batch], ensure_ascii=False)}, model=model)
+        self.stats["batch_calls"] += 1
+        if ctx.cascade:
+            cascade_count(ctx, "summary_batch", f"answered:{tier}")
+        by_tid = {s.thread_id: s.summary_md for s in answer.summaries}
+        retry: List[PendingSummary] = []
+        for p in batch:
+            md = by_tid.get(p.ctx.thread_id)
+            if md is not None and summary_is_grounded(md, p.payload["evidence"], True):
+                self.stats["batched_threads"] += 1
+                p.done.set_result((SummaryResult(summary_md=md), tier, "batch"))
+            else:
+                p.ctx.metrics.reject(p.ctx.thread_id, "summary_batch_missing" if md is None else "summary_batch_ungrounded")
+                retry.append(p)
+        self.stats["fallbacks"] += len(retry)
+        for p, (summary, t) in zip(retry, await asyncio.gather(*(self._summarize_one(p) for p in retry))):
+            p.done.set_result((summary, t, "single"))
+
+    def report(self) -> Dict[str, Any]:
+        return {"mode": "batch", "batch_tokens": self.budget, "max_threads": self.max_threads, **self.stats}
+
+EVIDENCE_REF_STRIP_RE = re.compile(r"\s*\[E\d+\]")
+
+def portfolio_digest(entry: Dict[str, Any], summary_md: str) -> Dict[str, Any]:
+    # Evidence IDs are per thread and mean nothing at portfolio level
+    return {"thread_id": entry["thread_id"], "open_items": attention_count(entry), "summary_md": EVIDENCE_REF_STRIP_RE.sub("", summary_md).strip()}
+
+async def portfolio_summary(ctx: RunContext, digests: List[Dict[str, Any]], clusters: List[Dict[str, Any]], budget: int) -> Dict[str, Any]:
+    # Map-reduce: budget-sized groups of thread summaries -> partial overviews -> ... -> one overview
+    if not digests:
+        return {"summary_md": "No unresolved or unknown items in any thread.", "threads": 0, "calls": 0, "levels": 0}
+    clusters_json = json.dumps(clusters, ensure_ascii=False)
+    budget = max(1, budget - estimate_tokens(clusters_json, SUMMARY_MODEL))
+    items, calls, level = digests, 0, 0
+    while True:
+        level += 1
+        sizes = [estimate_tokens(json.dumps(it, ensure_ascii=False), SUMMARY_MODEL) for it in items]
+        # From the second level on every group merges at least two partials, so the reduction always terminates
+        groups = pack_by_tokens(sizes, budget, min_items=1 if level == 1 else 2)
+        results = await asyncio.gather(*(
+            run_chain(ctx, "portfolio", {"clusters_json": clusters_json, "items_json": json.dumps(items[a:b], ensure_ascii=False)})
+            for a, b in groups
+        ))
+        calls += len(groups)
+        if len(results) == 1:
+            return {"summary_md": results[0].summary_md, "threads": len(digests), "calls": calls, "levels": level}
+        items = [{"summary_md": r.summary_md} for r in results]
+
+def skipped_thread_entry(tid: str, thread: List[EmailMessage], triage: Dict[str, Any], threshold: float) -> Dict[str, Any]:
+    return {
+        "thread_id": tid,
+        "source_files": sorted(set(m.source_file for m in thread)),
+        "time_range": {"start": thread[0].date.isoformat(), "end": thread[-1].date.isoformat()},
+        "attention_flags": {"A_unresolved_action_items": [], "B_emerging_risks_blockers": []},
+        "all_issues": [],
+        "evidence": {},
+        "executive_summary_md": f"_Not analyzed: skipped by local pre-triage (score {triage['score']} < threshold {threshold})._",
+    }
 
-        rank = {"high": 2, "medium": 1, "low": 0}
-        def sort_key(x):
-            level = x.get("priority") or x.get("severity") or "low"
-            return (-rank.get(level, 0), 0 if x["status"] == "unresolved" else 1)
+def attention_count(t: Dict[str, Any]) -> int:
+    return len(t["attention_flags"]["A_unresolved_action_items"]) + len(t["attention_flags"]["B_emerging_risks_blockers"])
+
+# Streaming output: one durable JSON line per finished thread
+class JsonlSink:
+    # Each line is a thread entry plus its "ingest_order", which iter_jsonl_sorted uses as the tiebreak and strips again
+    def __init__(self, path: str, resume: bool = False):
+        self.path = path
+        self.completed: set = set()
+        p = Path(path)
+        p.parent.mkdir(parents=True, exist_ok=True)
+        if resume and p.exists():
+            # Keep every complete line; a crash mid-write leaves at most one partial trailing line, which is cut off
+            good = 0
+            with open(path, "rb") as f:
+                for raw in iter(f.readline, b""):
+                    try:
+                        entry = json.loads(raw.decode("utf-8"))
+                    except ValueError:
+                        break
+                    if not raw.endswith(b"\n"):
+                        break
+                    self.completed.add(entry["thread_id"])
+                    good = f.tell()
+            with open(path, "r+b") as f:
+                f.truncate(good)
+        else:
+            p.write_text("", encoding="utf-8")
+        # Threads kept from earlier runs: the run's statistics don't cover them
+        self.resumed = frozenset(self.completed)
+        self.f = open(path, "a", encoding="utf-8")
+
+    def append(self, entry: Dict[str, Any], order: int) -> None:
+        self.f.write(json.dumps(dict(entry, ingest_order=order), ensure_ascii=False) + "\n")
+        self.f.flush()
+        os.fsync(self.f.fileno())
+        self.completed.add(entry["thread_id"])
+
+    def close(self) -> None:
+        self.f.close()
+
+def iter_jsonl_sorted(path: str) -> Iterator[Dict[str, Any]]:
+    # Pass 1 keeps only (sort key, offset) per thread; pass 2 seeks and decodes one thread at a time.
+    # Same order as the in-memory report: most attention flags first, then ingestion order.
+    index: List[Tuple[int, float, int]] = []
+    with open(path, "rb") as f:
+        while True:
+            offset = f.tell()
+            raw = f.readline()
+            if not raw:
+                break
+            t = json.loads(raw.decode("utf-8"))
+            order = t.get("ingest_order")
+            index.append((-attention_count(t), float("inf") if order is None else order, offset))
+    index.sort()
+    with open(path, "rb") as f:
+        for _, _, offset in index:
+            f.seek(offset)
+            t = json.loads(f.readline().decode("utf-8"))
+            t.pop("ingest_order", None)
+            yield t
+
+# Incremental rebuilds: per-thread fingerprint manifest stored next to report.json
+MANIFEST_VERSION = 1
+
+@dataclass
+class IncrementalState:
+    previous_threads: Dict[str, Dict[str, Any]] = field(default_factory=dict)
+    previous_fingerprints: Dict[str, str] = field(default_factory=dict)
+    fingerprints: Dict[str, str] = field(default_factory=dict)
+    source_files: Dict[str, List[str]] = field(default_factory=dict)
+    signature: Dict[str, Any] = field(default_factory=dict)
+    reused: List[str] = field(default_factory=list)
+    analyzed: List[str] = field(default_factory=list)
+
+def pipeline_signature(redact: bool, ctx: RunContext, deredact: bool = False) -> Dict[str, Any]:
+    return {
+        "models": dict(STAGE_MODELS),
+        "prompt_versions": {stage: prompt_hash(stage)[:16] for stage in STAGE_PROMPTS},
+        "backend": ctx.backend.name,
+        "resolve_mode": ctx.resolve_mode,
+        "resolve_context": ctx.resolve_context,
+        "quote_match": ctx.quote_match,
+        "draft_window_tokens": draft_window_budget(ANALYZE_MODEL, ctx.draft_window_tokens),
+        "window_overlap": ctx.window_overlap,
+        "redact": redact,
+        "deredact": deredact,
+        "triage": [ctx.triage_mode, ctx.triage_threshold] if ctx.triage_mode != "off" else "off",
+        "cascade": {"fast_models": dict(FAST_STAGE_MODELS), "max_thread_tokens": ctx.cascade_max_tokens} if ctx.cascade else "off",
+        "dedupe": ctx.dedupe.threshold if ctx.dedupe is not None else "off",
+        "summary_mode": ["batch", ctx.summaries.budget] if ctx.summaries is not None else "per_thread",
+    }
 
-        A.sort(key=sort_key)
-        B.sort(key=sort_key)
+def thread_fingerprint(thread: List[EmailMessage], signature: Dict[str, Any]) -> str:
+    msgs = [
+        [m.source_file, m.from_email, m.to_emails, m.cc_emails, m.date.isoformat(), m.subject, m.body]
+        for m in thread
+    ]
+    return sha256_hex(json.dumps({"pipeline": signature, "messages": msgs}, ensure_ascii=False, sort_keys=True))
+
+def manifest_path(out_json: str) -> Path:
+    p = Path(out_json)
+    return p.with_name(p.stem + ".manifest.json")
+
+def load_incremental_state(out_json: str) -> IncrementalState:
+    mp = manifest_path(out_json)
+    if not (mp.exists() and Path(out_json).exists()):
+        return IncrementalState()
+    try:
+        manifest = json.loads(mp.read_text(encoding="utf-8"))
+        report = json.loads(Path(out_json).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return IncrementalState()
+    if manifest.get("version") != MANIFEST_VERSION:
+        return IncrementalState()
+    return IncrementalState(
+        previous_threads={t["thread_id"]: t for t in report.get("threads", [])},
+        previous_fingerprints={tid: v["fingerprint"] for tid, v in (manifest.get("threads") or {}).items()},
+    )
 
-        payload = {"thread_id": tid, "attention_flag_A": A, "attention_flag_B": B, "evidence": evidence_bank}
-        summary: SummaryResult = summary_chain.invoke({"payload_json": json.dumps(payload, ensure_ascii=False)})
-
-        report["threads"].append({
-            "thread_id": tid,
-            "source_files": sorted(set(m.source_file for m in thread)),
-            "time_range": {"start": thread[0].date.isoformat(), "end": thread[-1].date.isoformat()},
-            "attention_flags": {"A_unresolved_action_items": A, "B_emerging_risks_blockers": B},
-            "all_issues": finalized,
-            "evidence": evidence_bank,
-            "executive_summary_md": summary.summary_md,
-        })
-
-    report["threads"].sort(key=lambda t: -(len(t["attention_flags"]["A_unresolved_action_items"]) + len(t["attention_flags"]["B_emerging_risks_blockers"])))
+def write_manifest(out_json: str, state: IncrementalState, report: Dict[str, Any]) -> None:
+    manifest = {
+        "version": MANIFEST_VERSION,
+        "generated_at": report["generated_at"],
+        "pipeline": state.signature,
+        "threads": {tid: {"fingerprint": fp, "source_files": state.source_files.get(tid, [])} for tid, fp in sorted(state.fingerprints.items())},
+    }
+    manifest_path(out_json).write_text(json.dumps(manifest, ensure_ascii=False, indent=2), encoding="utf-8")
+
+# Message store: parsed messages, per-thread analysis, issues and quotes in one SQLite file,
+# with an FTS5 index over subjects/bodies and date/project columns for selection and repeat queries
+DEFAULT_STORE = os.getenv("AGENT_STORE", "")
+STORE_SCHEMA_VERSION = 1
+
+def project_of(subject: str) -> str:
+    # "Re: Project Phoenix - Login page" -> "project phoenix"; subjects without " - " are their own project
+    return normalize_subject(subject).split(" - ", 1)[0].strip()
+
+def utc_ts(dt: datetime) -> float:
+    return (dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)).timestamp()
+
+def parse_day(s: str) -> datetime:
+    # CLI dates: "2025-07-01" or a full ISO timestamp; naive values are UTC
+    dt = datetime.fromisoformat(s)
+    return dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
+
+def thread_content_hash(thread: List[EmailMessage]) -> str:
+    return sha256_hex(json.dumps([
+        [m.source_file, m.message_id, m.from_email, m.to_emails, m.cc_emails, m.date.isoformat(), m.subject, m.body]
+        for m in thread
+    ], ensure_ascii=False))
+
+def thread_selected(thread: List[EmailMessage], since: Optional[datetime], until: Optional[datetime], project: Optional[str]) -> bool:
+    # Same rule as MessageStore.select_threads: any message in [since, until) and the project substring in the first subject
+    if project and project.lower() not in project_of(thread[0].subject):
+        return False
+    if since is None and until is None:
+        return True
+    lo = utc_ts(since) if since else float("-inf")
+    hi = utc_ts(until) if until else float("inf")
+    return any(lo <= utc_ts(m.date) < hi for m in thread)
+
+# FTS5 query tokens: quoted phrases (an unterminated one is passed on and rejected by SQLite), parentheses, other runs
+FTS_TOKEN_RE = re.compile(r'"[^"]*"?|[()]|[^\s()"]+')
+FTS_BAREWORD_RE = re.compile(r"(\w+:)?\w+\*?|AND|OR|NOT")
+
+def fts_query(text: str) -> str:
+    # Plain terms with punctuation ("prod-outage", "v2.1") become phrases instead of FTS5 syntax errors
+    return " ".join(t if t[0] in '"()' or FTS_BAREWORD_RE.fullmatch(t) else f'"{t}"' for t in FTS_TOKEN_RE.findall(text))
+
+class MessageStore:
+    def __init__(self, path: str):
+        self.path = path
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+            CREATE TABLE IF NOT EXISTS messages (
+                thread_id TEXT NOT NULL, seq INTEGER NOT NULL, source_file TEXT NOT NULL, message_id TEXT NOT NULL,
+                from_email TEXT NOT NULL, to_emails TEXT NOT NULL, cc_emails TEXT NOT NULL, date TEXT NOT NULL,
+                date_utc REAL NOT NULL, subject TEXT NOT NULL, project TEXT NOT NULL, body TEXT NOT NULL,
+                content_hash TEXT NOT NULL, analysis_version TEXT NOT NULL, PRIMARY KEY (thread_id, seq));
+            CREATE INDEX IF NOT EXISTS messages_date ON messages (date_utc);
+            CREATE TABLE IF NOT EXISTS threads (
+                thread_id TEXT PRIMARY KEY, content_hash TEXT NOT NULL, analysis_version TEXT NOT NULL, project TEXT NOT NULL,
+                start_utc REAL NOT NULL, end_utc REAL NOT NULL, attention INTEGER NOT NULL, entry TEXT NOT NULL, updated_at REAL NOT NULL);
+            CREATE INDEX IF NOT EXISTS threads_project ON threads (project);
+            CREATE TABLE IF NOT EXISTS issues (
+                id INTEGER PRIMARY KEY, thread_id TEXT NOT NULL, idx INTEGER NOT NULL, flag TEXT NOT NULL, level TEXT NOT NULL,
+                status TEXT NOT NULL, title TEXT NOT NULL, subject TEXT NOT NULL, opened_at TEXT NOT NULL, opened_utc REAL NOT NULL,
+                rationale_status TEXT NOT NULL, content_hash TEXT NOT NULL, analysis_version TEXT NOT NULL);
+            CREATE INDEX IF NOT EXISTS issues_thread ON issues (thread_id);
+            CREATE INDEX IF NOT EXISTS issues_opened ON issues (opened_utc);
+            CREATE TABLE IF NOT EXISTS quotes (
+                issue_id INTEGER NOT NULL, kind TEXT NOT NULL, evidence_id TEXT NOT NULL, text TEXT NOT NULL,
+                content_hash TEXT NOT NULL, analysis_version TEXT NOT NULL);
+            CREATE INDEX IF NOT EXISTS quotes_issue ON quotes (issue_id);
+        """)
+        # FTS5 ships with practically every SQLite build; without it text search falls back to LIKE scans
+        try:
+            self.db.execute("CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(subject, body, content='messages', content_rowid='rowid')")
+            self.fts = True
+        except sqlite3.OperationalError:
+            self.fts = False
+        self.db.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('schema_version', ?)", (str(STORE_SCHEMA_VERSION),))
+        self.db.commit()
+        self.reused = 0
+        self.written = 0
+
+    def analysis(self, tid: str, content_hash: str, analysis_version: str) -> Optional[Dict[str, Any]]:
+        row = self.db.execute("SELECT content_hash, analysis_version, entry FROM threads WHERE thread_id = ?", (tid,)).fetchone()
+        if row is None or row[0] != content_hash or row[1] != analysis_version:
+            return None
+        self.reused += 1
+        return json.loads(row[2])
+
+    def put_thread(self, tid: str, thread: List[EmailMessage], entry: Dict[str, Any], content_hash: str, analysis_version: str) -> None:
+        # One transaction per thread: its messages, FTS rows, issues and quotes are replaced together
+        with self.db:
+            self._delete_thread(tid)
+            for seq, m in enumerate(thread):
+                cur = self.db.execute(
+                    "INSERT INTO messages (thread_id, seq, source_file, message_id, from_email, to_emails, cc_emails, date, date_utc,"
+                    " subject, project, body, content_hash, analysis_version) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (tid, seq, m.source_file, m.message_id, m.from_email, json.dumps(m.to_emails), json.dumps(m.cc_emails),
+                     m.date.isoformat(), utc_ts(m.date), m.subject, project_of(m.subject), m.body, content_hash, analysis_version))
+                if self.fts:
+                    self.db.execute("INSERT INTO messages_fts (rowid, subject, body) VALUES (?, ?, ?)", (cur.lastrowid, m.subject, m.body))
+            self.db.execute(
+                "INSERT INTO threads (thread_id, content_hash, analysis_version, project, start_utc, end_utc, attention, entry, updated_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (tid, content_hash, analysis_version, project_of(thread[0].subject), utc_ts(thread[0].date), utc_ts(thread[-1].date),
+                 attention_count(entry), json.dumps(entry, ensure_ascii=False), time.time()))
+            evidence = entry.get("evidence") or {}
+            for idx, it in enumerate(entry.get("all_issues") or []):
+                cur = self.db.execute(
+                    "INSERT INTO issues (thread_id, idx, flag, level, status, title, subject, opened_at, opened_utc, rationale_status,"
+                    " content_hash, analysis_version) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (tid, idx, it["flag"], it.get(issue_level_key(it["flag"]), ""), it["status"], it["title"], it["subject"],
+                     it["opened_at"], utc_ts(datetime.fromisoformat(it["opened_at"])), it.get("rationale_status", ""),
+                     content_hash, analysis_version))
+                quotes = [("evidence", e) for e in it.get("evidence_ids") or []] + [("resolution", e) for e in it.get("resolution_evidence_ids") or []]
+                self.db.executemany("INSERT INTO quotes (issue_id, kind, evidence_id, text, content_hash, analysis_version) VALUES (?, ?, ?, ?, ?, ?)",
+                                    [(cur.lastrowid, kind, e, evidence.get(e, ""), content_hash, analysis_version) for kind, e in quotes])
+        self.written += 1
+
+    def _delete_thread(self, tid: str) -> None:
+        if self.fts:
+            self.db.executemany("INSERT INTO messages_fts (messages_fts, rowid, subject, body) VALUES ('delete', ?, ?, ?)",
+                                self.db.execute("SELECT rowid, subject, body FROM messages WHERE thread_id = ?", (tid,)).fetchall())
+        self.db.execute("DELETE FROM quotes WHERE issue_id IN (SELECT id FROM issues WHERE thread_id = ?)", (tid,))
+        for table in ("issues", "messages", "threads"):
+            self.db.execute(f"DELETE FROM {table} WHERE thread_id = ?", (tid,))
+
+    def select_threads(self, since: Optional[datetime] = None, until: Optional[datetime] = None, project: Optional[str] = None) -> List[str]:
+        sql, params = "SELECT thread_id FROM threads t WHERE 1=1", []
+        if project:
+            sql += " AND instr(t.project, ?) > 0"
+            params.append(project.lower())
+        if since is not None or until is not None:
+            sql += " AND EXISTS (SELECT 1 FROM messages m WHERE m.thread_id = t.thread_id AND m.date_utc >= ? AND m.date_utc < ?)"
+            params += [utc_ts(since) if since else float("-inf"), utc_ts(until) if until else float("inf")]
+        return [r[0] for r in self.db.execute(sql + " ORDER BY t.start_utc, t.thread_id", params)]
+
+    def thread_messages(self, tid: str) -> List[EmailMessage]:
+        return [
+            EmailMessage(thread_id=tid, source_file=r[0], message_id=r[1], from_email=r[2], to_emails=json.loads(r[3]),
+                         cc_emails=json.loads(r[4]), date=datetime.fromisoformat(r[5]), subject=r[6], body=r[7])
+            for r in self.db.execute(
+                "SELECT source_file, message_id, from_email, to_emails, cc_emails, date, subject, body FROM messages"
+                " WHERE thread_id = ? ORDER BY seq", (tid,))
+        ]
+
+    def query_issues(self, status: Optional[List[str]] = None, flag: Optional[List[str]] = None, level: Optional[List[str]] = None,
+                     since: Optional[datetime] = None, until: Optional[datetime] = None, project: Optional[str] = None,
+                     text: Optional[str] = None, limit: int = 100) -> List[Dict[str, Any]]:
+        # Issues are dated by opened_at; `text` matches the title or any of the issue's quotes
+        sql = ("SELECT i.id, i.thread_id, i.flag, i.level, i.status, i.title, i.subject, i.opened_at, i.rationale_status, t.project"
+               " FROM issues i JOIN threads t ON t.thread_id = i.thread_id WHERE 1=1")
+        params: List[Any] = []
+        for col, values in (("i.status", status), ("i.flag", flag), ("i.level", level)):
+            if values:
+                sql += f" AND {col} IN ({','.join('?' * len(values))})"
+                params += values
+        if since is not None:
+            sql += " AND i.opened_utc >= ?"
+            params.append(utc_ts(since))
+        if until is not None:
+            sql += " AND i.opened_utc < ?"
+            params.append(utc_ts(until))
+        if project:
+            sql += " AND instr(t.project, ?) > 0"
+            params.append(project.lower())
+        if text:
+            sql += " AND (i.title LIKE ? OR EXISTS (SELECT 1 FROM quotes q WHERE q.issue_id = i.id AND q.text LIKE ?))"
+            params += [f"%{text}%"] * 2
+        sql += " ORDER BY i.opened_utc DESC, i.thread_id, i.id LIMIT ?"
+        params.append(limit)
+        cols = ("id", "thread_id", "flag", "level", "status", "title", "subject", "opened_at", "rationale_status", "project")
+        rows = [dict(zip(cols, r)) for r in self.db.execute(sql, params)]
+        for r in rows:
+            r["quotes"] = [{"kind": k, "evidence_id": e, "text": q} for k, e, q in self.db.execute(
+                "SELECT kind, evidence_id, text FROM quotes WHERE issue_id = ? ORDER BY rowid", (r.pop("id"),))]
+        return rows
+
+    def search_messages(self, text: str, since: Optional[datetime] = None, until: Optional[datetime] = None,
+                        project: Optional[str] = None, limit: int = 50) -> List[Dict[str, Any]]:
+        # `text` is an FTS5 query ("prod AND outage", "deploy*", '"rolled back"') when FTS5 is available
+        if self.fts:
+            sql = ("SELECT m.thread_id, m.date, m.from_email, m.subject, snippet(messages_fts, 1, '[', ']', ' … ', 12)"
+                   " FROM messages_fts JOIN messages m ON m.rowid = messages_fts.rowid WHERE messages_fts MATCH ?")
+            params: List[Any] = [fts_query(text)]
+        else:
+            sql = "SELECT m.thread_id, m.date, m.from_email, m.subject, substr(m.body, 1, 120) FROM messages m WHERE m.body LIKE ?"
+            params = [f"%{text}%"]
+        if since is not None:
+            sql += " AND m.date_utc >= ?"
+            params.append(utc_ts(since))
+        if until is not None:
+            sql += " AND m.date_utc < ?"
+            params.append(utc_ts(until))
+        if project:
+            sql += " AND instr(m.project, ?) > 0"
+            params.append(project.lower())
+        sql += " ORDER BY m.date_utc DESC LIMIT ?"
+        params.append(limit)
+        cols = ("thread_id", "date", "from_email", "subject", "snippet")
+        return [dict(zip(cols, r)) for r in self.db.execute(sql, params)]
+
+    def stats(self) -> Dict[str, Any]:
+        count = lambda table: self.db.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+        return {"path": self.path, "fts5": self.fts, "threads": count("threads"), "messages": count("messages"),
+                "issues": count("issues"), "reused": self.reused, "written": self.written}
+
+    def close(self) -> None:
+        self.db.close()
+
+async def store_threads(store: MessageStore, since: Optional[datetime], until: Optional[datetime], project: Optional[str]):
+    # Report input straight from the store: no files are read or parsed
+    for tid in store.select_threads(since, until, project):
+        yield tid, store.thread_messages(tid)
+
+async def build_report_async(input_dir: str, redact: bool, max_concurrency: int = DEFAULT_MAX_CONCURRENCY, cache: Optional[LLMCache] = None,
+                             resolve_mode: str = DEFAULT_RESOLVE_MODE, incremental: Optional[IncrementalState] = None,
+                             sink: Optional[JsonlSink] = None, draft_window_tokens: int = DEFAULT_DRAFT_WINDOW_TOKENS,
+                             window_overlap: int = DEFAULT_WINDOW_OVERLAP_MSGS, resolve_context: str = DEFAULT_RESOLVE_CONTEXT,
+                             quote_match: str = DEFAULT_QUOTE_MATCH, backend: Optional[LLMBackend] = None,
+                             metrics: Optional[RunMetrics] = None, ingest_workers: int = DEFAULT_INGEST_WORKERS,
+                             thread_grouping: str = DEFAULT_THREAD_GROUPING, thread_gap_days: float = DEFAULT_THREAD_GAP_DAYS,
+                             deredact: bool = False, roster: Optional[Dict[str, Colleague]] = None,
+                             triage_mode: str = DEFAULT_TRIAGE_MODE, triage_threshold: float = DEFAULT_TRIAGE_THRESHOLD,
+                             triage_reference: Optional[Dict[str, bool]] = None, cascade: bool = DEFAULT_CASCADE,
+                             cascade_max_tokens: int = DEFAULT_CASCADE_MAX_TOKENS,
+                             rate_limits: Optional[Dict[str, Tuple[int, int]]] = None,
+                             max_retries: int = DEFAULT_MAX_RETRIES, store: Optional[MessageStore] = None,
+                             from_store: bool = False, since: Optional[datetime] = None, until: Optional[datetime] = None,
+                             project: Optional[str] = None, dedupe: bool = DEFAULT_DEDUPE,
+                             dedupe_threshold: float = DEFAULT_DEDUPE_THRESHOLD, summary_mode: str = DEFAULT_SUMMARY_MODE,
+                             summary_batch_tokens: int = DEFAULT_SUMMARY_BATCH_TOKENS) -> Dict[str, Any]:
+    metrics = metrics or RunMetrics()
+    backend = backend or make_backend()
+    # Provider limits apply to live backends by default; pass rate_limits explicitly to pace a stub load test
+    if rate_limits is None:
+        rate_limits = MODEL_RATE_LIMITS if backend.rate_limited else {}
+    scheduler = RequestScheduler(max_concurrency, rate_limits, max_retries, metrics)
+    deduper = IssueDeduper(dedupe_threshold) if dedupe else None
+    batcher = SummaryBatcher(summary_batch_tokens) if summary_mode == "batch" else None
+    ctx = RunContext(scheduler=scheduler, backend=backend, cache=cache, resolve_mode=resolve_mode,
+                     draft_window_tokens=draft_window_tokens, window_overlap=window_overlap, resolve_context=resolve_context,
+                     quote_match=quote_match, metrics=metrics, triage_mode=triage_mode, triage_threshold=triage_threshold,
+                     cascade=cascade, cascade_max_tokens=cascade_max_tokens, dedupe=deduper, summaries=batcher)
+
+    report: Dict[str, Any] = {
+        "generated_at": datetime.now(timezone.utc).isoformat(),
+        "threads": [],
+        "models": {"draft": ANALYZE_MODEL, "resolve": RESOLVE_MODEL, "summary": SUMMARY_MODEL},
+        "resolve_mode": resolve_mode,
+        "backend": backend.name,
+        "thread_grouping": thread_grouping,
+        "redaction": {"redact": redact, "deredacted": deredact},
+    }
+
+    if incremental is not None:
+        incremental.signature = pipeline_signature(redact, ctx, deredact)
+    analysis_version = sha256_hex(json.dumps(pipeline_signature(redact, ctx, deredact), sort_keys=True))[:16]
+    if since is not None or until is not None or project:
+        report["selection"] = {"since": since.isoformat() if since else None, "until": until.isoformat() if until else None,
+                               "project": project, "source": "store" if from_store else "input_dir"}
+
+    # Per thread: (triage score, action, attention count of the result); a few numbers even for 100k threads
+    triaged: Dict[str, Tuple[float, str, int]] = {}
+    # Batch mode: (input position, digest) of every thread with open items, for the portfolio summary
+    digests: List[Tuple[int, Dict[str, Any]]] = []
+
+    async def thread_entry(tid: str, thread: List[EmailMessage], order: int) -> Optional[Dict[str, Any]]:
+        try:
+            return await thread_entry_inner(tid, thread, order)
+        finally:
+            if deduper is not None:
+                # Reused, skipped or failed threads never submit drafts; release them from the dedupe barrier
+                deduper.leave(tid)
+            if batcher is not None:
+                batcher.leave(tid)
+
+    async def thread_entry_inner(tid: str, thread: List[EmailMessage], order: int) -> Optional[Dict[str, Any]]:
+        if not thread_selected(thread, since, until, project):
+            return None
+        entry: Optional[Dict[str, Any]] = None
+        stored = False
+        tri = triage_thread(thread)
+        below = triage_mode != "off" and tri["score"] < triage_threshold
+        action = ("skipped" if triage_mode == "skip" else "downgraded") if below else "full"
+        if incremental is not None:
+            fp = thread_fingerprint(thread, incremental.signature)
+            incremental.fingerprints[tid] = fp
+            incremental.source_files[tid] = sorted(set(m.source_file for m in thread))
+            prev = incremental.previous_threads.get(tid)
+            if prev is not None and incremental.previous_fingerprints.get(tid) == fp:
+                incremental.reused.append(tid)
+                entry = prev
+        if sink is not None and tid in sink.completed:
+            return None
+        if store is not None:
+            content_hash = thread_content_hash(thread)
+            prior = store.analysis(tid, content_hash, analysis_version)
+            if prior is not None:
+                # Same messages, same pipeline: serve the stored analysis instead of calling the LLM again
+                entry = entry or prior
+                stored = True
+        analyzed = entry is None
+        if entry is None:
+            if incremental is not None:
+                incremental.analyzed.append(tid)
+            if action == "skipped":
+                entry = skipped_thread_entry(tid, thread, tri, triage_threshold)
+            else:
+                entry = await analyze_thread(ctx, tid, thread, redact, downgrade=action == "downgraded")
+            if deredact:
+                # Output only: the analysis itself (and the LLM cache keys) stays on pseudonymized text
+                entry = deredact_entry(entry, ctx.pseudonyms, roster or {})
+        entry = dict(entry, triage={**tri, "action": action})
+        triaged[tid] = (tri["score"], action, attention_count(entry))
+        if store is not None and not stored:
+            store.put_thread(tid, thread, entry, content_hash, analysis_version)
+        if batcher is not None and attention_count(entry):
+            if deredact and not analyzed:
+                # A reused entry was not redacted in this run, so its addresses may be missing from the map. make_reredactor
+                # only maps back what the map holds; without them its de-redacted summary would reach the portfolio call in clear.
+                for m in thread:
+                    ctx.pseudonyms.register([m.from_email, *m.to_emails, *m.cc_emails, *extract_emails(f"{m.subject}\n{m.body}")])
+            digests.append((order, portfolio_digest(entry, entry["executive_summary_md"])))
+        if sink is not None:
+            # Streaming mode: persist immediately and drop the entry from memory
+            sink.append(entry, order)
+            return None
+        return entry
+
+    # Each thread starts as soon as ingestion yields it; gather returns results in input order
+    tasks: List[asyncio.Task] = []
+    source = store_threads(store, since, until, project) if from_store and store is not None else \
+        aiter_threads(input_dir, ingest_workers, metrics, thread_grouping, thread_gap_days)
+    async for tid, thread in source:
+        if deduper is not None:
+            deduper.enter(tid, len(tasks))
+        if batcher is not None:
+            batcher.enter(tid)
+        tasks.append(asyncio.create_task(thread_entry(tid, thread, len(tasks))))
+    if deduper is not None:
+        deduper.close()
+    if batcher is not None:
+        batcher.close()
+    entries = await asyncio.gather(*tasks)
+    # Most attention flags first, then ingestion order (the key iter_jsonl_sorted uses for --out_jsonl)
+    ranked = sorted((n for n, t in enumerate(entries) if t is not None), key=lambda n: (-attention_count(entries[n]), n))
+    report["threads"] = [entries[n] for n in ranked]
+    if sink is not None:
+        report["threads_jsonl"] = sink.path
+        if sink.resumed:
+            # Run statistics (triage, cache, scheduler, metrics, portfolio, ...) cover only this run's threads
+            report["resume"] = {"threads_from_previous_runs": len(sink.resumed), "statistics": "this_run_only"}
+    report["cache"] = cache.stats() if cache is not None else {"enabled": False}
+    rt = ctx.resolve_tokens
+    report["resolve_context"] = {
+        "mode": resolve_context,
+        "calls": rt["calls"],
+        "full_thread_tokens": rt["full_thread"],
+        "sent_tokens": rt["sent"],
+        "saving_pct": round(100.0 * (1 - rt["sent"] / rt["full_thread"]), 1) if rt["full_thread"] else 0.0,
+    }
+    if incremental is not None:
+        report["incremental"] = {"reused": sorted(incremental.reused), "analyzed": sorted(incremental.analyzed)}
+    report["triage"] = triage_report(triaged, triage_mode, triage_threshold, triage_reference)
+    report["cascade"] = cascade_report(ctx)
+    report["scheduler"] = scheduler.stats()
+    if deduper is not None:
+        report["portfolio"] = deduper.rollup()
+    if batcher is not None:
+        # Most open items first, then input order; open dedupe clusters tell the model which items are the same problem
+        ranked = [d for _, d in sorted(digests, key=lambda x: (-x[1]["open_items"], x[0]))]
+        if deredact:
+            # The portfolio call sees pseudonyms, like every other call of a --redact run
+            reredact = make_reredactor(ctx.pseudonyms, roster or {})
+            ranked = [dict(d, summary_md=reredact(d["summary_md"])) for d in ranked]
+        clusters = [{k: c[k] for k in ("title", "flag", "level", "status", "thread_ids")}
+                    for c in (report.get("portfolio") or {}).get("clusters", []) if c["status"] != "resolved"][:PORTFOLIO_MAX_CLUSTERS]
+        ps = await portfolio_summary(ctx, ranked, clusters, summary_batch_tokens)
+        if deredact:
+            ps["summary_md"] = deredact_text(ps["summary_md"], ctx.pseudonyms, roster or {})
+        report["portfolio_summary"] = ps
+        report["summaries"] = batcher.report()
+    if store is not None:
+        report["store"] = store.stats()
+    report["metrics"] = metrics.summary()
     return report
 
-def render_md(report: Dict[str, Any]) -> str:
-    lines: List[str] = []
-    lines.append("# Portfolio Health Report (AI PoC — Thread-level + Resolution)\n")
-    lines.append(f"Generated at: `{report['generated_at']}`")
-    lines.append(f"Models: draft=`{report['models']['draft']}`, resolve=`{report['models']['resolve']}`, summary=`{report['models']['summary']}`\n")
+def cascade_report(ctx: RunContext) -> Dict[str, Any]:
+    if not ctx.cascade:
+        return {"enabled": False}
+    stages = ("draft", "resolve", "resolve_batch", "summary", "summary_batch")
+    out: Dict[str, Any] = {
+        "enabled": True,
+        "max_thread_tokens": ctx.cascade_max_tokens,
+        "tiers": {stage: {"fast": FAST_STAGE_MODELS[stage], "strong": STAGE_MODELS[stage]} for stage in stages},
+        "stages": {},
+    }
+    for stage in stages:
+        st = ctx.cascade_stats.get(stage) or {}
+        answered = {k.split(":", 1)[1]: n for k, n in st.items() if k.startswith("answered:")}
+        escalated = {k.split(":", 1)[1]: n for k, n in st.items() if k.startswith("escalated:")}
+        if answered or escalated:
+            total = sum(answered.values())
+            out["stages"][stage] = {
+                "answered": answered,
+                "escalated": escalated,
+                "fast_share": round(answered.get("fast", 0) / total, 3) if total else 0.0,
+            }
+    return out
+
+def triage_report(triaged: Dict[str, Tuple[float, str, int]], mode: str, threshold: float,
+                  reference: Optional[Dict[str, bool]] = None) -> Dict[str, Any]:
+    out: Dict[str, Any] = {
+        "mode": mode,
+        "threshold": threshold,
+        "threads": len(triaged),
+        "skipped": sorted(tid for tid, (_, a, _) in triaged.items() if a == "skipped"),
+        "downgraded": sorted(tid for tid, (_, a, _) in triaged.items() if a == "downgraded"),
+    }
+    # Lower bound: a skipped thread saves at least the draft + summary calls, a downgraded one the summary call
+    out["llm_calls_saved_min"] = 2 * len(out["skipped"]) + len(out["downgraded"])
+    # Ground truth: a previous full-LLM report, or this run itself when nothing was skipped/downgraded
+    if reference is not None:
+        truth, source = reference, "reference_report"
+    elif mode == "off":
+        truth, source = {tid: n > 0 for tid, (_, _, n) in triaged.items()}, "this_run"
+    else:
+        return out
+    scored = [(score, truth[tid]) for tid, (score, _, _) in triaged.items() if tid in truth]
+    out["evaluation"] = {"ground_truth": source, **triage_evaluation(scored, threshold)}
+    return out
+
+def load_triage_reference(path: str) -> Dict[str, bool]:
+    # thread_id -> has attention flags, from a report produced with --triage off
+    report = json.loads(Path(path).read_text(encoding="utf-8"))
+    if (report.get("triage") or {}).get("mode", "off") != "off":
+        raise SystemExit(f"{path} was produced with pre-triage enabled; use a full-LLM report (--triage off) as reference")
+    return {t["thread_id"]: attention_count(t) > 0 for t in report.get("threads", [])}
+
+def build_report(input_dir: str, redact: bool, **kwargs) -> Dict[str, Any]:
+    return asyncio.run(build_report_async(input_dir, redact, **kwargs))
+
+def iter_md_lines(report: Dict[str, Any], threads: Optional[Iterable[Dict[str, Any]]] = None) -> Iterator[str]:
+    yield "# Portfolio Health Report (AI PoC — Thread-level + Resolution)\n"
+    yield f"Generated at: `{report['generated_at']}`"
+    yield f"Models: draft=`{report['models']['draft']}`, resolve=`{report['models']['resolve']}`, summary=`{report['models']['summary']}`"
+    rs = report.get("resume")
+    if rs:
+        yield (f"Resumed: {rs['threads_from_previous_runs']} threads kept from a previous run; "
+               "the run statistics below cover only the threads processed in this run")
+    cache = report.get("cache") or {}
+    if cache.get("enabled"):
+        yield f"LLM cache: {cache['hit_total']} hits / {cache['miss_total']} misses"
+    rc = report.get("resolve_context") or {}
+    if rc.get("calls"):
+        yield f"Resolve input: {rc['sent_tokens']} of {rc['full_thread_tokens']} full-thread tokens sent ({rc['saving_pct']}% saved, `{rc['mode']}`)"
+    tr = report.get("triage") or {}
+    if tr.get("mode", "off") != "off":
+        yield f"Pre-triage (`{tr['mode']}`, threshold {tr['threshold']}): {len(tr['skipped'])} skipped, {len(tr['downgraded'])} downgraded of {tr['threads']} threads"
+    ev = tr.get("evaluation")
+    if ev:
+        yield f"Pre-triage at threshold {ev['threshold']} vs {ev['ground_truth']}: precision {ev['precision']}, recall {ev['recall']}, skip rate {ev['skip_rate']}"
+    cc = report.get("cascade") or {}
+    if cc.get("enabled"):
+        parts = [f"{stage} {round(100 * v['fast_share'])}% fast" for stage, v in cc["stages"].items()]
+        esc = sum(n for v in cc["stages"].values() for n in v["escalated"].values())
+        yield f"Model cascade: {', '.join(parts) or 'no calls'}; {esc} escalations"
+    sc = report.get("scheduler") or {}
+    if sc.get("retries") or any(v >= 0.5 for v in (sc.get("throttled_s") or {}).values()):
+        throttled = ", ".join(f"{m} {v:.1f}s" for m, v in sc["throttled_s"].items() if v >= 0.5) or "none"
+        yield f"Scheduler: {sum(sc['retries'].values())} retries, throttled {throttled}"
+    mt = report.get("metrics") or {}
+    if mt:
+        tot = mt["totals"]
+        est = " (estimated)" if mt["token_source"]["estimated"] else ""
+        yield (f"Run: {mt['wall_s']:.1f}s, {tot['calls']} LLM calls, {tot['prompt_tokens']} prompt + {tot['completion_tokens']} completion tokens{est}, "
+               f"~${tot['cost_usd']:.4f}")
+    sm = report.get("summaries") or {}
+    if sm:
+        yield (f"Summaries (`{sm['mode']}`, {sm['batch_tokens']} tokens/call): {sm['batched_threads']} threads in {sm['batch_calls']} batch calls, "
+               f"{sm['single_calls'] + sm['fallbacks']} single calls ({sm['fallbacks']} fallbacks), {sm['templates']} from template")
+    yield ""
+
+    ps = report.get("portfolio_summary") or {}
+    if ps:
+        yield "## Portfolio Summary"
+        yield f"_{ps['threads']} threads with open items; {ps['calls']} calls over {ps['levels']} levels._\n"
+        yield ps["summary_md"].strip()
+        yield ""
+
+    pf = report.get("portfolio") or {}
+    if pf:
+        yield "## Portfolio Roll-up — Issues Across Threads"
+        yield (f"{pf['issues']} issues drafted, {pf['unique_issues']} distinct after near-duplicate clustering "
+               f"(threshold {pf['threshold']}); {pf['duplicates']} reused a representative's decision, "
+               f"{pf['resolved_locally']} were re-resolved in their own thread, {pf['boilerplate']} were boilerplate.\n")
+        for c in pf["clusters"]:
+            threads_md = ", ".join(f"`{tid}`" for tid in c["thread_ids"][:8])
+            if len(c["thread_ids"]) > 8:
+                threads_md += f" and {len(c['thread_ids']) - 8} more threads"
+            yield f"- **{c['level']}** | **{c['status']}** | {c['title']} ({c['flag'][0]}; {c['issues']} issues in {threads_md})"
+        if not pf["clusters"]:
+            yield "_No issue appears in more than one place._"
+        yield ""
 
     def fmt_ids(ids: List[str]) -> str:
         return "".join([f" [{i}]" for i in (ids or [])])
 
-    for t in report["threads"]:
-        lines.append(f"## Thread: `{t['thread_id']}`")
-        lines.append("- Source files: " + ", ".join(f"`{sf}`" for sf in t["source_files"]))
-        lines.append(f"- Time range: {t['time_range']['start']} → {t['time_range']['end']}\n")
+    for t in (report["threads"] if threads is None else threads):
+        yield f"## Thread: `{t['thread_id']}`"
+        yield "- Source files: " + ", ".join(f"`{sf}`" for sf in t["source_files"])
+        action = (t.get("triage") or {}).get("action", "full")
+        if action != "full":
+            yield f"- Pre-triage: **{action}** (score {t['triage']['score']})"
+        yield f"- Time range: {t['time_range']['start']} → {t['time_range']['end']}\n"
 
-        lines.append("### Executive Summary")
-        lines.append((t["executive_summary_md"] or "").strip() or "_(empty)_")
-        lines.append("")
+        yield "### Executive Summary"
+        yield (t["executive_summary_md"] or "").strip() or "_(empty)_"
+        yield ""
 
         A = t["attention_flags"]["A_unresolved_action_items"]
         B = t["attention_flags"]["B_emerging_risks_blockers"]
 
         if A:
-            lines.append("### Attention Flag A — Unresolved Action Items")
+            yield "### Attention Flag A — Unresolved Action Items"
             for it in A:
                 lvl = it.get("priority","low")
-                lines.append(f"- **{lvl}** | **{it['status']}** | {it['title']}{fmt_ids(it.get('evidence_ids', []))}")
-                lines.append(f"  - Why A/level: {it.get('rationale_flag_level','')}")
-                lines.append(f"  - Why status: {it.get('rationale_status','')}")
-            lines.append("")
+                yield f"- **{lvl}** | **{it['status']}** | {it['title']}{fmt_ids(it.get('evidence_ids', []))}"
+                yield f"  - Why A/level: {it.get('rationale_flag_level','')}"
+                yield f"  - Why status: {it.get('rationale_status','')}"
+                if it.get("duplicate"):
+                    yield f"  - Same issue as `{it['duplicate']['representative_thread_id']}`: {it['duplicate']['representative_title']}"
+            yield ""
         if B:
-            lines.append("### Attention Flag B — Emerging Risks / Blockers")
+            yield "### Attention Flag B — Emerging Risks / Blockers"
             for it in B:
                 lvl = it.get("severity","low")
-                lines.append(f"- **{lvl}** | **{it['status']}** | {it['title']}{fmt_ids(it.get('evidence_ids', []))}")
-                lines.append(f"  - Why B/level: {it.get('rationale_flag_level','')}")
-                lines.append(f"  - Why status: {it.get('rationale_status','')}")
-            lines.append("")
+                yield f"- **{lvl}** | **{it['status']}** | {it['title']}{fmt_ids(it.get('evidence_ids', []))}"
+                yield f"  - Why B/level: {it.get('rationale_flag_level','')}"
+                yield f"  - Why status: {it.get('rationale_status','')}"
+                if it.get("duplicate"):
+                    yield f"  - Same issue as `{it['duplicate']['representative_thread_id']}`: {it['duplicate']['representative_title']}"
+            yield ""
         if not A and not B:
-            lines.append("_No unresolved/unknown attention flags detected in this thread._\n")
-
-    return "\n".join(lines).strip() + "\n"
+            yield "_No unresolved/unknown attention flags detected in this thread._\n"
+
+def render_md(report: Dict[str, Any], threads: Optional[Iterable[Dict[str, Any]]] = None) -> str:
+    return "\n".join(iter_md_lines(report, threads)).strip() + "\n"
+
+def write_md(path: str, report: Dict[str, Any], threads: Optional[Iterable[Dict[str, Any]]] = None) -> None:
+    # Same output as render_md, written line by line; trailing whitespace is held back so the file ends like .strip() + "\n"
+    pending = ""
+    with open(path, "w", encoding="utf-8") as f:
+        for line in iter_md_lines(report, threads):
+            chunk = line + "\n"
+            text = chunk.rstrip()
+            if text:
+                f.write(pending + text)
+                pending = chunk[len(text):]
+            else:
+                pending += chunk
+        f.write("\n")
+
+def write_report_json(path: str, report: Dict[str, Any], threads: Optional[Iterable[Dict[str, Any]]] = None) -> None:
+    if threads is None:
+        Path(path).write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+        return
+    # Streamed variant: metadata first, then each thread serialized one at a time
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("{\n")
+        for k, v in report.items():
+            if k == "threads":
+                continue
+            f.write(f"  {json.dumps(k)}: " + textwrap.indent(json.dumps(v, ensure_ascii=False, indent=2), "  ").lstrip() + ",\n")
+        f.write('  "threads": [')
+        for n, t in enumerate(threads):
+            f.write(("," if n else "") + "\n" + textwrap.indent(json.dumps(t, ensure_ascii=False, indent=2), "    "))
+        f.write("\n  ]\n}")
 
 def main():
-    import argparse
-    ap = argparse.ArgumentParser()
-    ap.add_argument("--input_dir", default=".", help="Folder containing email*.txt")
+    import argparse, sys
+    if sys.argv[1:2] == ["query"]:
+        return query_main(sys.argv[2:])
+    ap = argparse.ArgumentParser(epilog="Run `%(prog)s query --help` to search a --store without re-running the pipeline.")
+    ap.add_argument("--input_dir", default=".", help="Folder containing email*.txt thread files and/or .eml files / mbox archives")
+    ap.add_argument("--ingest_workers", type=int, default=DEFAULT_INGEST_WORKERS,
+                    help="Processes for parsing input files (0 = one per CPU, 1 = in-process; small inputs always parse in-process)")
+    ap.add_argument("--thread_grouping", choices=THREAD_GROUPINGS, default=DEFAULT_THREAD_GROUPING,
+                    help="file: one thread per email*.txt file; reconstruct: regroup all messages by normalized subject, participants and time")
+    ap.add_argument("--thread_gap_days", type=float, default=DEFAULT_THREAD_GAP_DAYS,
+                    help="With --thread_grouping reconstruct: max days between consecutive messages of one conversation")
     ap.add_argument("--out_json", default="report.json")
     ap.add_argument("--out_md", default="report.md")
     ap.add_argument("--redact", action="store_true", help="Pseudonymize email addresses before sending to models")
+    ap.add_argument("--pseudonym_map", default=None,
+                    help="With --redact: load/save the address->pseudonym map here so pseudonyms can be mapped back across runs (contains real addresses)")
+    ap.add_argument("--deredact", action="store_true", help="With --redact: show real names/roles (from the roster) instead of pseudonyms in the outputs")
+    ap.add_argument("--roster", default=None, help="Roster used by --deredact (default: <input_dir>/Colleagues.txt)")
+    ap.add_argument("--backend", choices=BACKENDS, default=DEFAULT_BACKEND,
+                    help="openai: live; record: live + save fixtures; replay: serve fixtures offline; stub: deterministic fake answers")
+    ap.add_argument("--fixtures_dir", default=DEFAULT_FIXTURES_DIR, help="Fixture directory for --backend record/replay")
+    ap.add_argument("--stub_latency_ms", type=float, default=DEFAULT_STUB_LATENCY_MS, help="Simulated per-call latency for --backend stub")
+    ap.add_argument("--cache_dir", default=DEFAULT_CACHE_DIR, help="Directory for the persistent LLM response cache")
+    ap.add_argument("--no_cache", action="store_true", help="Disable the LLM response cache")
+    ap.add_argument("--resolve_mode", choices=RESOLVE_MODES, default=DEFAULT_RESOLVE_MODE,
+                    help="per_issue: one resolve call per issue; batch: one call adjudicates all issues of a thread")
+    ap.add_argument("--max_concurrency", type=int, default=DEFAULT_MAX_CONCURRENCY, help="Max in-flight LLM calls across all threads")
+    ap.add_argument("--rate_limits", default=None,
+                    help='Per-model limits as JSON, e.g. \'{"gpt-4o-mini": [500, 200000]}\' (RPM, TPM); merged over the built-in table '
+                         "and also applied to offline backends")
+    ap.add_argument("--no_rate_limits", action="store_true", help="Disable RPM/TPM pacing (retries stay on)")
+    ap.add_argument("--max_retries", type=int, default=DEFAULT_MAX_RETRIES, help="Retries per LLM call on 429/timeouts/5xx, with jittered backoff")
+    ap.add_argument("--resolve_context", choices=RESOLVE_CONTEXTS, default=DEFAULT_RESOLVE_CONTEXT,
+                    help="sliced: send problem messages + later ones + headers of earlier ones; full: send the whole thread")
+    ap.add_argument("--quote_match", choices=QUOTE_MATCH_MODES, default=DEFAULT_QUOTE_MATCH,
+                    help="Quote grounding: exact substring, normalized (whitespace/smart quotes/NFKC) or casefold")
+    ap.add_argument("--draft_window_tokens", type=int, default=DEFAULT_DRAFT_WINDOW_TOKENS,
+                    help="Token budget per draft window for long threads (0 = per-model default)")
+    ap.add_argument("--window_overlap", type=int, default=DEFAULT_WINDOW_OVERLAP_MSGS, help="Messages shared between consecutive draft windows")
+    ap.add_argument("--out_jsonl", default=None, help="Stream one JSON line per finished thread to this file (durably flushed)")
+    ap.add_argument("--resume", action="store_true", help="With --out_jsonl: keep threads already in the JSONL and only process the rest")
+    ap.add_argument("--triage", choices=TRIAGE_MODES, default=DEFAULT_TRIAGE_MODE,
+                    help="Local pre-triage below --triage_threshold: skip (no LLM calls) or downgrade (no summary call / second-pass resolves)")
+    ap.add_argument("--triage_threshold", type=float, default=DEFAULT_TRIAGE_THRESHOLD, help="Minimum pre-triage cue score for full analysis")
+    ap.add_argument("--triage_reference", default=None,
+                    help="report.json of a full-LLM run (--triage off) to compute pre-triage precision/recall against")
+    ap.add_argument("--cascade", action="store_true", default=DEFAULT_CASCADE,
+                    help="Run each stage on a fast model first and escalate to the stage model on guardrail failure or long threads")
+    ap.add_argument("--cascade_max_tokens", type=int, default=DEFAULT_CASCADE_MAX_TOKENS,
+                    help="With --cascade: threads above this many tokens go straight to the strong tier")
+    ap.add_argument("--store", default=DEFAULT_STORE or None,
+                    help="SQLite message store: keeps parsed messages, analyses, issues and quotes, and serves unchanged threads without LLM calls. "
+                         "Messages are stored as parsed, NOT redacted, even with --redact: protect the file like the input mailboxes")
+    ap.add_argument("--from_store", action="store_true", help="With --store: read threads from the store instead of parsing --input_dir")
+    ap.add_argument("--since", type=parse_day, default=None, help="Only threads with a message on/after this date (YYYY-MM-DD or ISO)")
+    ap.add_argument("--until", type=parse_day, default=None, help="Only threads with a message before this date")
+    ap.add_argument("--project", default=None, help="Only threads whose normalized subject prefix (before ' - ') contains this text")
+    ap.add_argument("--dedupe", action="store_true", default=DEFAULT_DEDUPE,
+                    help="Cluster near-duplicate issues across threads (MinHash/LSH) and resolve one representative per cluster; "
+                         "threads wait for each other after drafting, so --out_jsonl starts writing only once all threads are drafted")
+    ap.add_argument("--dedupe_threshold", type=float, default=DEFAULT_DEDUPE_THRESHOLD,
+                    help="Estimated Jaccard similarity of title+quote shingles above which two issues are the same")
+    ap.add_argument("--summary_mode", choices=SUMMARY_MODES, default=DEFAULT_SUMMARY_MODE,
+                    help="per_thread: one summary call per thread; batch: pack several threads per call, template text for threads "
+                         "with nothing open, plus a portfolio-level summary")
+    ap.add_argument("--summary_batch_tokens", type=int, default=DEFAULT_SUMMARY_BATCH_TOKENS,
+                    help="With --summary_mode batch: prompt token budget per summary_batch / portfolio call")
+    ap.add_argument("--incremental", action="store_true", help="Re-analyze only threads whose content/models/prompts changed since the last report")
+    ap.add_argument("--watch", action="store_true", help="Poll --input_dir and update the report incrementally as files land")
+    ap.add_argument("--watch_interval", type=float, default=30.0, help="Polling interval in seconds for --watch")
+    ap.add_argument("--metrics_prom", default=None, help="Also write run metrics in Prometheus textfile-collector format to this path")
+    ap.add_argument("--trace_jsonl", default=None, help="Write one JSON line per LLM call / guardrail rejection to this path")
+    ap.add_argument("--profile", type=int, nargs="?", const=10, default=0, metavar="N",
+                    help="Print per-stage totals and the N slowest threads (default 10)")
     args = ap.parse_args()
-
-    if not os.getenv("OPENAI_API_KEY"):
+    if args.resume and not args.out_jsonl:
+        ap.error("--resume requires --out_jsonl")
+    if args.deredact and not args.redact:
+        ap.error("--deredact requires --redact")
+    if args.from_store and not args.store:
+        ap.error("--from_store requires --store")
+    if args.pseudonym_map:
+        PSEUDONYMS.load(args.pseudonym_map)
+
+    backend = make_backend(args.backend, fixtures_dir=args.fixtures_dir, stub_latency_ms=args.stub_latency_ms)
+    if backend.needs_api_key and not os.getenv("OPENAI_API_KEY"):
         raise SystemExit(
             "OPENAI_API_KEY is not set. In PowerShell:\n"
             "  $env:OPENAI_API_KEY='sk-...'\n"
-            "Do NOT hardcode credentials in source files."
+            "Do NOT hardcode credentials in source files.\n"
+            "For offline runs use --backend replay or --backend stub."
         )
 
-    report = build_report(args.input_dir, redact=args.redact)
-    Path(args.out_json).write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
-    Path(args.out_md).write_text(render_md(report), encoding="utf-8")
+    cache = None if args.no_cache else LLMCache(args.cache_dir)
+    try:
+        if args.watch:
+            watch(args, cache, backend)
+        else:
+            run_once(args, cache, backend)
+    finally:
+        if cache is not None:
+            cache.close()
+
+def cli_rate_limits(args) -> Optional[Dict[str, Tuple[int, int]]]:
+    if args.no_rate_limits:
+        return {}
+    if args.rate_limits:
+        return {**MODEL_RATE_LIMITS, **{m: tuple(v) for m, v in json.loads(args.rate_limits).items()}}
+    return None
+
+def run_once(args, cache: Optional[LLMCache], backend: LLMBackend) -> Dict[str, Any]:
+    incremental = load_incremental_state(args.out_json) if args.incremental else None
+    sink = JsonlSink(args.out_jsonl, resume=args.resume) if args.out_jsonl else None
+    metrics = RunMetrics(trace=bool(args.trace_jsonl))
+    store = MessageStore(args.store) if args.store else None
+    try:
+        report = build_report(args.input_dir, redact=args.redact, max_concurrency=args.max_concurrency, cache=cache,
+                              resolve_mode=args.resolve_mode, incremental=incremental, sink=sink,
+                              draft_window_tokens=args.draft_window_tokens, window_overlap=args.window_overlap,
+                              resolve_context=args.resolve_context, quote_match=args.quote_match, backend=backend,
+                              metrics=metrics, ingest_workers=args.ingest_workers, thread_grouping=args.thread_grouping,
+                              thread_gap_days=args.thread_gap_days, deredact=args.deredact,
+                              roster=load_roster(args.roster or os.path.join(args.input_dir, "Colleagues.txt")),
+                              triage_mode=args.triage, triage_threshold=args.triage_threshold,
+                              triage_reference=load_triage_reference(args.triage_reference) if args.triage_reference else None,
+                              cascade=args.cascade, cascade_max_tokens=args.cascade_max_tokens,
+                              rate_limits=cli_rate_limits(args), max_retries=args.max_retries, store=store,
+                              from_store=args.from_store, since=args.since, until=args.until, project=args.project,
+                              dedupe=args.dedupe, dedupe_threshold=args.dedupe_threshold, summary_mode=args.summary_mode,
+                              summary_batch_tokens=args.summary_batch_tokens)
+    finally:
+        if sink is not None:
+            sink.close()
+        if store is not None:
+            store.close()
+    if sink is not None:
+        # Final artifacts are rebuilt from the stream, one thread in memory at a time
+        write_report_json(args.out_json, report, iter_jsonl_sorted(sink.path))
+        write_md(args.out_md, report, iter_jsonl_sorted(sink.path))
+    else:
+        write_report_json(args.out_json, report)
+        write_md(args.out_md, report)
+    if incremental is not None:
+        write_manifest(args.out_json, incremental, report)
+        print(f"Incremental: {len(incremental.analyzed)} analyzed, {len(incremental.reused)} reused")
+    if args.pseudonym_map and args.redact:
+        PSEUDONYMS.save(args.pseudonym_map)
+    if args.metrics_prom:
+        write_prometheus(args.metrics_prom, report["metrics"])
+    if args.trace_jsonl:
+        write_trace_jsonl(args.trace_jsonl, metrics.events or [])
     print(f"Wrote {args.out_json} and {args.out_md}")
+    if args.profile:
+        print_profile(report["metrics"], args.profile)
+    return report
+
+def print_profile(metrics: Dict[str, Any], top: int) -> None:
+    print(f"\nRun wall time: {metrics['wall_s']:.2f}s (token counts: {metrics['token_source']['usage']} reported, "
+          f"{metrics['token_source']['estimated']} estimated)")
+    print(f"{'stage':<14} {'calls':>6} {'cache':>6} {'wall s':>9} {'queue s':>9} {'prompt':>9} {'compl.':>8} {'cached':>8} {'cost $':>9}")
+    for stage, b in metrics["stages"].items():
+        print(f"{stage:<14} {b['calls']:>6} {b['llm_cache_hits']:>6} {b['wall_s']:>9.3f} {b['queue_s']:>9.3f} {b['prompt_tokens']:>9} "
+              f"{b['completion_tokens']:>8} {b['cached_tokens']:>8} {b['cost_usd']:>9.4f}")
+    if metrics["guardrail_rejections"]:
+        print("Guardrail rejections: " + ", ".join(f"{r}={n}" for r, n in metrics["guardrail_rejections"].items()))
+    if metrics.get("retries"):
+        print("Retries: " + ", ".join(f"{r}={n}" for r, n in metrics["retries"].items()))
+    print(f"\nSlowest {top} threads:")
+    print(f"{'thread':<24} {'wall s':>8} {'calls':>6} {'prompt':>9} {'compl.':>8} {'cost $':>9}  slowest stage")
+    for tid, t in slowest_threads(metrics, top):
+        worst = max(t["stages"].items(), key=lambda kv: kv[1]["wall_s"], default=("-", {"wall_s": 0.0}))
+        print(f"{tid:<24} {t['wall_s']:>8.3f} {t['calls']:>6} {t['prompt_tokens']:>9} {t['completion_tokens']:>8} {t['cost_usd']:>9.4f}  "
+              f"{worst[0]} ({worst[1]['wall_s']:.3f}s)")
+
+def query_main(argv: List[str]) -> None:
+    # Repeat questions ("unresolved high-severity risks this quarter") answered from the store, no parsing or LLM calls
+    import argparse
+    ap = argparse.ArgumentParser(prog="email_processing_agent.py query", description="Query issues or messages in a --store")
+    ap.add_argument("--store", default=DEFAULT_STORE or None, required=not DEFAULT_STORE, help="SQLite store written by a report run")
+    ap.add_argument("--messages", action="store_true", help="Full-text search over message bodies instead of listing issues")
+    ap.add_argument("--text", default=None, help="Issues: substring of the title or a quote; --messages: FTS5 query, e.g. 'prod AND outage' "
+                         "(terms with punctuation such as prod-outage are searched as phrases)")
+    ap.add_argument("--status", nargs="*", choices=["resolved", "unresolved", "unknown"], default=None)
+    ap.add_argument("--flag", nargs="*", choices=["A", "B"], default=None, help="A: unresolved action items, B: emerging risks/blockers")
+    ap.add_argument("--level", nargs="*", choices=["low", "medium", "high"], default=None, help="Priority (A) or severity (B)")
+    ap.add_argument("--since", type=parse_day, default=None, help="Issues opened / messages sent on or after this date")
+    ap.add_argument("--until", type=parse_day, default=None, help="... and before this date")
+    ap.add_argument("--project", default=None)
+    ap.add_argument("--limit", type=int, default=100)
+    ap.add_argument("--json", action="store_true", help="Print JSON instead of a table")
+    args = ap.parse_args(argv)
+    if args.messages and not args.text:
+        ap.error("--messages requires --text")
+    if not Path(args.store).exists():
+        raise SystemExit(f"No store at {args.store}. Build one with --store on a report run.")
+
+    store = MessageStore(args.store)
+    try:
+        if args.messages:
+            try:
+                rows = store.search_messages(args.text, args.since, args.until, args.project, args.limit)
+            except sqlite3.OperationalError as e:
+                ap.error(f"--text is not a valid FTS5 query ({e}); quote phrases, e.g. --text '\"rolled back\"'")
+        else:
+            flags = {"A": "A_unresolved_action_item", "B": "B_emerging_risk_blocker"}
+            rows = store.query_issues(args.status, [flags[f] for f in args.flag or []], args.level, args.since, args.until,
+                                      args.project, args.text, args.limit)
+    finally:
+        store.close()
+
+    if args.json:
+        print(json.dumps(rows, ensure_ascii=False, indent=2))
+        return
+    for r in rows:
+        if args.messages:
+            print(f"{r['date'][:16]}  {r['thread_id']:<20} {r['from_email']:<32} {r['subject']}\n    {' '.join(r['snippet'].split())}")
+        else:
+            print(f"{r['opened_at'][:10]}  {r['thread_id']:<20} {r['flag'][0]} {r['level']:<6} {r['status']:<10} {r['title']}")
+    print(f"{len(rows)} {'messages' if args.messages else 'issues'}")
+
+def input_snapshot(input_dir: str) -> Dict[str, Tuple[float, int]]:
+    snap: Dict[str, Tuple[float, int]] = {}
+    for p in input_files(input_dir):
+        try:
+            st = os.stat(p)
+        except OSError:
+            continue
+        snap[p] = (st.st_mtime, st.st_size)
+    return snap
+
+def watch(args, cache: Optional[LLMCache], backend: LLMBackend) -> None:
+    # Poll the input dir and rebuild incrementally whenever an input file appears, changes or disappears
+    args.incremental = True
+    last: Optional[Dict[str, Tuple[float, int]]] = None
+    print(f"Watching {args.input_dir} every {args.watch_interval}s (Ctrl+C to stop)")
+    try:
+        while True:
+            snap = input_snapshot(args.input_dir)
+            if snap != last:
+                run_once(args, cache, backend)
+                last = snap
+            time.sleep(args.watch_interval)
+    except KeyboardInterrupt:
+        print("Stopped watching.")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,27 @@
+import sys
+from pathlib import Path
+from typing import List, Tuple
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import email_processing_agent as agent
+
+@pytest.fixture
+def write_thread(tmp_path):
+    # write_thread("email1", "Project Alpha - Export", [(from, to, "2025-06-02 10:00", body), ...]) -> input dir
+    def write(name: str, subject: str, messages: List[Tuple[str, str, str, str]]) -> Path:
+        blocks = []
+        for n, (frm, to, date, body) in enumerate(messages):
+            subj = subject if n == 0 else f"Re: {subject}"
+            blocks.append(f"From: {frm}\nTo: {to}\nDate: {date.replace('-', '.')}\nSubject: {subj}\n\n{body}")
+        (tmp_path / f"{name}.txt").write_text("\n\n".join(blocks) + "\n", encoding="utf-8")
+        return tmp_path
+    return write
+
+def stub_report(input_dir: Path, **kwargs):
+    return agent.build_report(str(input_dir), redact=False, backend=agent.make_backend("stub"), **kwargs)
+
+def issues_by_thread(report) -> dict:
+    return {t["thread_id"]: t["all_issues"] for t in report["threads"]}
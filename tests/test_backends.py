@@ -0,0 +1,11 @@
+import pytest
+
+import email_processing_agent as agent
+
+def test_backend_without_acall_fails_at_construction():
+    class Incomplete(agent.LLMBackend):
+        name = "incomplete"
+
+    with pytest.raises(TypeError, match="acall"):
+        Incomplete()
+    assert isinstance(agent.make_backend("stub"), agent.LLMBackend)
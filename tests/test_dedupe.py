@@ -0,0 +1,47 @@
+import email_processing_agent as agent
+from conftest import issues_by_thread, stub_report
+
+ASK = "Can you check why the invoice export drops rows with unicode names?"
+FIX = "I've pushed the fix for the invoice export, deployed and tested on staging."
+ANNA, BEN = "Anna Kiss anna@example.com", "Ben Nagy ben@example.com"
+CARL, DORA = "Carl Toth carl@example.com", "Dora Vass dora@example.com"
+
+def test_generic_issue_is_not_merged_across_projects(write_thread):
+    # Same wording, but different projects and no shared participant: two separate issues
+    write_thread("email1", "Project Alpha - Invoice export", [(ANNA, BEN, "2025-06-02 10:00", ASK)])
+    d = write_thread("email2", "Project Beta - Invoice export", [(CARL, DORA, "2025-06-03 10:00", ASK)])
+    report = stub_report(d, dedupe=True)
+    assert report["portfolio"]["clusters"] == []
+    assert all("duplicate" not in it for issues in issues_by_thread(report).values() for it in issues)
+
+def test_same_project_and_participants_merge(write_thread):
+    write_thread("email1", "Project Alpha - Invoice export", [(ANNA, BEN, "2025-06-02 10:00", ASK)])
+    d = write_thread("email2", "Project Alpha - Invoice export", [(BEN, ANNA, "2025-06-03 10:00", ASK)])
+    report = stub_report(d, dedupe=True)
+    assert [c["thread_ids"] for c in report["portfolio"]["clusters"]] == [["email1", "email2"]]
+    assert report["portfolio"]["duplicates"] == 1
+
+def test_own_later_fix_is_not_overridden_by_representative(write_thread):
+    # email2 ends later and becomes the representative (open); email1 has its own later fix
+    write_thread("email1", "Project Alpha - Invoice export", [(ANNA, BEN, "2025-06-02 10:00", ASK), (BEN, ANNA, "2025-06-02 12:00", FIX)])
+    d = write_thread("email2", "Project Alpha - Invoice export", [(BEN, ANNA, "2025-06-05 10:00", ASK)])
+    plain = issues_by_thread(stub_report(d))
+    deduped = issues_by_thread(stub_report(d, dedupe=True))
+    assert [it["status"] for it in deduped["email1"]] == [it["status"] for it in plain["email1"]] == ["resolved"]
+    assert [it["status"] for it in deduped["email2"]] == ["unresolved"]
+
+def test_representative_fix_quote_is_not_copied_into_other_thread(write_thread):
+    # Dates reversed: the representative (email1, latest) is resolved by a quote that email2 does not contain
+    write_thread("email1", "Project Alpha - Invoice export", [(ANNA, BEN, "2025-06-05 10:00", ASK), (BEN, ANNA, "2025-06-05 12:00", FIX)])
+    d = write_thread("email2", "Project Alpha - Invoice export", [(BEN, ANNA, "2025-06-02 10:00", ASK)])
+    report = stub_report(d, dedupe=True)
+    t2 = next(t for t in report["threads"] if t["thread_id"] == "email2")
+    assert [it["status"] for it in t2["all_issues"]] == ["unresolved"]
+    assert all(q in ASK for it in t2["all_issues"] for q in it["resolution_quotes"])
+    assert all(q in ASK for q in t2["evidence"].values())
+
+def test_short_and_boilerplate_signatures_stay_alone():
+    short = agent.IssueDraft(flag="A_unresolved_action_item", title="Confirmed with the client?", severity_or_priority="low",
+                             rationale_flag_level="", evidence_quotes=["Has this been confirmed with the client?"])
+    assert len(agent.issue_shingles(short)) < agent.DEDUPE_MIN_SHINGLES
+    assert agent.cluster_signatures(["A|p", "A|p"], [(), ()], 0.6) == [[0], [1]]
@@ -0,0 +1,47 @@
+from datetime import datetime
+
+import pytest
+
+import email_processing_agent as agent
+
+FROM_FIRST = """From: Anna Kiss anna@example.com
+To: Ben Nagy ben@example.com
+Date: 2025.06.02 10:00
+Subject: Project Alpha - Export
+
+Can you check the export?
+
+From: Ben Nagy ben@example.com
+To: Anna Kiss anna@example.com
+Date: 2025.06.02 12:00
+Subject: Re: Project Alpha - Export
+
+Fixed and deployed.
+"""
+
+SUBJECT_FIRST = """Subject: Project Alpha - Export
+From: Anna Kiss anna@example.com
+Date: 2025.06.02 10:00
+To: Ben Nagy ben@example.com
+
+Can you check the export?
+
+Subject: Re: Project Alpha - Export
+Date: 2025.06.02 12:00
+From: Ben Nagy ben@example.com
+To: Anna Kiss anna@example.com
+
+Fixed and deployed.
+"""
+
+@pytest.mark.parametrize("text", [FROM_FIRST, SUBJECT_FIRST], ids=["from_first", "subject_first"])
+def test_each_header_run_starts_one_message(tmp_path, text):
+    # Header order varies between exports; neither order yields a headerless message or loses the sender/date
+    path = tmp_path / "email1.txt"
+    path.write_text(text, encoding="utf-8")
+    msgs = agent.parse_email_thread(str(path))
+    assert [(m.from_email, m.date.replace(tzinfo=None), m.subject, m.body) for m in msgs] == [
+        ("anna@example.com", datetime(2025, 6, 2, 10, 0), "Project Alpha - Export", "Can you check the export?"),
+        ("ben@example.com", datetime(2025, 6, 2, 12, 0), "Re: Project Alpha - Export", "Fixed and deployed."),
+    ]
+    assert agent.parse_thread_buffer(text.encode("utf-8"), str(path)) == msgs
@@ -0,0 +1,64 @@
+import json
+
+import email_processing_agent as agent
+
+ANNA, BEN = "Anna Kiss anna@example.com", "Ben Nagy ben@example.com"
+
+def stream(input_dir, path, resume, drafted=None, **kwargs):
+    sink = agent.JsonlSink(str(path), resume=resume)
+    draft = agent.StubBackend._draft
+
+    class CountingStub(agent.StubBackend):
+        def _draft(self, inputs):
+            if drafted is not None:
+                drafted.append(inputs["thread_text"])
+            return draft(self, inputs)
+
+    try:
+        report = agent.build_report(str(input_dir), redact=False, backend=CountingStub(), sink=sink, **kwargs)
+    finally:
+        sink.close()
+    return sink, report
+
+def write_open_threads(write_thread, names, newest_first=False):
+    for n, name in enumerate(names, 1):
+        day = len(names) + 1 - n if newest_first else n
+        d = write_thread(name, f"Project Alpha - Item {name}", [
+            (ANNA, BEN, f"2025-06-0{day} 10:00", f"Can you check why export {name} drops rows?"),
+        ])
+    return d
+
+def test_resume_keeps_complete_lines_and_redoes_the_rest(write_thread, tmp_path):
+    d = write_open_threads(write_thread, ["email1", "email2", "email3"])
+    out = tmp_path / "out" / "threads.jsonl"
+    stream(d, out, resume=False)
+    lines = out.read_bytes().splitlines(keepends=True)
+    assert len(lines) == 3
+
+    # Crash mid-write: the first line is durable, the second was cut off halfway
+    out.write_bytes(lines[0] + lines[1][: len(lines[1]) // 2])
+    kept = json.loads(lines[0])["thread_id"]
+    drafted = []
+    sink, report = stream(d, out, resume=True, drafted=drafted)
+
+    assert len(drafted) == 2 and not any(f"export {kept} " in t for t in drafted)
+    assert sink.completed == {"email1", "email2", "email3"}
+    assert out.read_bytes().startswith(lines[0])
+    entries = [json.loads(l) for l in out.read_text(encoding="utf-8").splitlines()]
+    assert sorted(e["thread_id"] for e in entries) == ["email1", "email2", "email3"]
+    # The run statistics only cover the two threads analyzed now, and the report says so
+    assert report["resume"] == {"threads_from_previous_runs": 1, "statistics": "this_run_only"}
+    assert report["triage"]["threads"] == 2
+
+def test_stream_order_matches_in_memory_order(write_thread, tmp_path):
+    # Equal attention counts everywhere: ties keep ingestion order on both paths, not thread_id order.
+    # Regrouped threads are ingested oldest first, so here email5 comes first.
+    d = write_open_threads(write_thread, ["email1", "email2", "email3", "email4", "email5"], newest_first=True)
+    kwargs = dict(thread_grouping="reconstruct", ingest_workers=1)
+    in_memory = agent.build_report(str(d), redact=False, backend=agent.make_backend("stub"), **kwargs)
+    out = tmp_path / "out" / "threads.jsonl"
+    stream(d, out, resume=False, **kwargs)
+    streamed = list(agent.iter_jsonl_sorted(str(out)))
+    assert [t["thread_id"] for t in in_memory["threads"]] == ["email5", "email4", "email3", "email2", "email1"]
+    assert [t["thread_id"] for t in streamed] == [t["thread_id"] for t in in_memory["threads"]]
+    assert streamed == in_memory["threads"]
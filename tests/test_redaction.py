@@ -0,0 +1,50 @@
+import email_processing_agent as agent
+
+def test_reredact_inverts_deredact_without_touching_the_map():
+    p = agent.Pseudonymizer()
+    roster = {"anna@example.com": agent.Colleague(name="Anna Kiss", email="anna@example.com", roles=["PM"]),
+              "never@example.com": agent.Colleague(name="Nobody Seen", email="never@example.com", roles=["QA"])}
+    text = f"Ask {p.pseudonym('anna@example.com')} and {p.pseudonym('ext@vendor.hu')} about the export."
+    forward, reverse = dict(p.forward), dict(p.reverse)
+    shown = agent.deredact_text(text, p, roster)
+    assert "Anna Kiss (PM)" in shown and "ext@vendor.hu" in shown
+    assert agent.make_reredactor(p, roster)(shown) == text
+    # No entries for roster addresses that never occurred, and no pseudonym -> pseudonym entries
+    assert p.forward == forward and p.reverse == reverse
+
+def test_portfolio_call_sees_only_pseudonyms(write_thread, monkeypatch):
+    seen = []
+    portfolio = agent.StubBackend._portfolio
+    monkeypatch.setattr(agent.StubBackend, "_portfolio", lambda self, inputs: seen.append(inputs["items_json"]) or portfolio(self, inputs))
+    d = write_thread("email1", "Project Alpha - Export", [
+        ("Anna Kiss anna@example.com", "Ben Nagy ben@example.com", "2025-06-02 10:00",
+         "Could ben@example.com please check the export before Friday?"),
+    ])
+    (d / "Colleagues.txt").write_text("PM: Anna Kiss (anna@example.com)\nDev: Ben Nagy (ben@example.com)\n", encoding="utf-8")
+    report = agent.build_report(str(d), redact=True, deredact=True, roster=agent.load_roster(str(d / "Colleagues.txt")),
+                                backend=agent.make_backend("stub"), summary_mode="batch")
+    assert seen and report["portfolio_summary"]["threads"] == 1
+    assert not any(s in items for items in seen for s in ("ben@example.com", "Ben Nagy", "anna@example.com"))
+    assert "Ben Nagy (Dev)" in report["threads"][0]["executive_summary_md"]
+
+def test_reused_entries_reach_the_portfolio_call_redacted(write_thread, tmp_path, monkeypatch):
+    # Second run serves the thread from the store: nothing is redacted in that run, the addresses must still map back
+    seen = []
+    portfolio = agent.StubBackend._portfolio
+    monkeypatch.setattr(agent.StubBackend, "_portfolio", lambda self, inputs: seen.append(inputs["items_json"]) or portfolio(self, inputs))
+    d = write_thread("email1", "Project Alpha - Export", [
+        ("Anna Kiss anna@example.com", "Ben Nagy ben@example.com", "2025-06-02 10:00",
+         "Could ext@vendor.hu please check the export before Friday?"),
+    ])
+    for _ in range(2):
+        # Each run starts with an empty pseudonym map, as a new process would
+        monkeypatch.setattr(agent, "PSEUDONYMS", agent.Pseudonymizer())
+        store = agent.MessageStore(str(tmp_path / "agent.db"))
+        try:
+            report = agent.build_report(str(d), redact=True, deredact=True, backend=agent.make_backend("stub"),
+                                        summary_mode="batch", store=store)
+        finally:
+            store.close()
+    assert report["store"]["reused"] == 1 and len(seen) == 2
+    assert seen[0] == seen[1]
+    assert not any(s in seen[1] for s in ("ext@vendor.hu", "anna@example.com", "ben@example.com"))
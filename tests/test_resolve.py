@@ -0,0 +1,39 @@
+import pytest
+
+import email_processing_agent as agent
+from conftest import stub_report
+
+ANNA, BEN = "Anna Kiss anna@example.com", "Ben Nagy ben@example.com"
+OPEN_ITEMS = [
+    (ANNA, BEN, "2025-06-02 10:00", "Can you check why the invoice export drops rows?"),
+    (ANNA, BEN, "2025-06-02 11:00", "URGENT: the staging database is running out of disk space."),
+    (ANNA, BEN, "2025-06-02 12:00", "Could someone confirm the release date with the client?"),
+]
+FIX = (BEN, ANNA, "2025-06-02 15:00", "I've pushed the fix, deployed and tested on staging.")
+
+def assert_issue_tokens_sum_to_totals(report):
+    issues = [it for t in report["threads"] for it in t["all_issues"]]
+    assert issues
+    totals = report["resolve_context"]
+    for key, total in (("calls", totals["calls"]), ("full_thread", totals["full_thread_tokens"]), ("sent", totals["sent_tokens"])):
+        assert sum(it["resolve_input_tokens"][key] for it in issues) == total, key
+    return issues
+
+def test_batched_resolve_tokens_sum_to_run_totals(write_thread):
+    # One batched call for three issues: per-issue shares must add up to the call, not to three of it
+    d = write_thread("email1", "Project Alpha - Release", OPEN_ITEMS)
+    report = stub_report(d, resolve_mode="batch")
+    assert len(assert_issue_tokens_sum_to_totals(report)) == 3
+    assert report["resolve_context"]["calls"] == 1
+
+@pytest.mark.parametrize("cascade, calls", [(False, 2), (True, 3)])
+def test_extra_resolve_calls_are_counted_per_issue(write_thread, monkeypatch, cascade, calls):
+    # Without cascade: unresolved with candidates -> second pass. With cascade: an ungrounded "resolved"
+    # escalates from the fast to the strong tier, is downgraded, and then gets the second pass as well.
+    decision = agent.ResolutionDecision(status="unresolved", rationale_status="Stub: still open.")
+    if cascade:
+        decision = agent.ResolutionDecision(status="resolved", rationale_status="Stub: claims a fix.", resolution_quotes=["Not in the thread."])
+    monkeypatch.setattr(agent.StubBackend, "_resolve", lambda self, inputs: decision)
+    d = write_thread("email1", "Project Alpha - Release", OPEN_ITEMS + [FIX])
+    issues = assert_issue_tokens_sum_to_totals(stub_report(d, resolve_mode="per_issue", cascade=cascade))
+    assert [it["resolve_input_tokens"]["calls"] for it in issues] == [calls] * len(issues)
@@ -0,0 +1,148 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import email_processing_agent as agent
+from conftest import stub_report
+
+class RateLimited(Exception):
+    # Shaped like the provider's 429: status code plus a retry-after-ms header
+    status_code = 429
+    response = SimpleNamespace(headers={"retry-after-ms": "250"})
+
+class Unavailable(Exception):
+    status_code = 503
+
+class FakeClock:
+    # Injected as the scheduler's clock/sleep: sleeping advances time instantly and records the delay
+    def __init__(self):
+        self.t = 0.0
+        self.sleeps = []
+
+    def now(self) -> float:
+        return self.t
+
+    async def sleep(self, delay: float) -> None:
+        self.sleeps.append(delay)
+        self.t += delay
+        await asyncio.sleep(0)
+
+def scheduler(clock, **kwargs):
+    return agent.RequestScheduler(clock=clock.now, sleep=clock.sleep, **kwargs)
+
+def stub_call(stage="summary", payload="{}"):
+    backend = agent.StubBackend()
+    return lambda: backend.acall(stage, {"payload_json": payload})
+
+def test_tpm_bucket_paces_requests_and_spares_other_models():
+    # 6000 TPM refills at 100 tokens/s: after two 2990-token calls the third (40 tokens) waits for 20 more tokens
+    clock = FakeClock()
+    started = {}
+
+    def call(name):
+        async def run():
+            started[name] = clock.t
+            return None, None
+        return run
+
+    async def run():
+        sched = scheduler(clock, max_concurrency=4, limits={"m": (10_000, 6000)})
+        await sched.submit("m", 2990, (1, 0.0), call("m1"))
+        await sched.submit("m", 2990, (1, 0.0), call("m2"))
+        throttled = asyncio.create_task(sched.submit("m", 40, (1, 0.0), call("m3")))
+        await asyncio.sleep(0)
+        await sched.submit("other", 10**6, (1, 0.0), call("other"))
+        await throttled
+        return sched.stats()
+
+    stats = asyncio.run(run())
+    assert started["m1"] == started["m2"] == started["other"] == 0.0
+    assert clock.sleeps == [pytest.approx(0.2)]
+    assert started["m3"] == pytest.approx(0.2)
+    assert stats["throttled_s"]["m"] == pytest.approx(0.2, abs=1e-3)
+
+def test_rate_limit_is_retried_after_the_hinted_delay():
+    clock = FakeClock()
+    attempts = []
+    call = stub_call()
+
+    async def flaky():
+        attempts.append(clock.t)
+        if len(attempts) <= 2:
+            raise RateLimited()
+        return await call()
+
+    sched = scheduler(clock, limits={"m": (500, 200_000)}, max_retries=3)
+    result, _ = asyncio.run(sched.submit("m", 100, (0, 0.0), flaky, thread_id="email1", stage="summary"))
+    assert isinstance(result, agent.SummaryResult)
+    assert clock.sleeps == [0.25, 0.25]
+    assert attempts == [0.0, 0.25, 0.5]
+    # A 429 holds back the whole model until the hinted time
+    assert sched.cooldown_until["m"] == pytest.approx(0.5)
+    assert sched.stats()["retries"] == {"rate_limit": 2}
+    assert sched.slots == sched.max_concurrency
+
+def test_backoff_without_hint_is_jittered_and_capped(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(agent, "RETRY_CAP_S", 3.0)
+
+    async def down():
+        raise Unavailable()
+
+    sched = scheduler(clock, max_retries=4)
+    with pytest.raises(Unavailable):
+        asyncio.run(sched.submit("m", 100, (0, 0.0), down))
+    assert len(clock.sleeps) == 4
+    assert all(0 <= d <= min(3.0, agent.RETRY_BASE_S * 2 ** n) for n, d in enumerate(clock.sleeps))
+    assert sched.stats()["retries"] == {"http_503": 4}
+    assert "m" not in sched.cooldown_until
+
+def test_retries_give_up_after_max_retries():
+    clock = FakeClock()
+    attempts = []
+
+    async def always_429():
+        attempts.append(1)
+        raise RateLimited()
+
+    sched = scheduler(clock, max_retries=2)
+    with pytest.raises(RateLimited):
+        asyncio.run(sched.submit("m", 100, (0, 0.0), always_429))
+    assert len(attempts) == 3
+    assert sched.stats()["retries"] == {"rate_limit": 2}
+    assert sched.slots == sched.max_concurrency
+
+def test_non_transient_errors_are_not_retried():
+    clock = FakeClock()
+    attempts = []
+
+    async def broken():
+        attempts.append(1)
+        raise ValueError("schema mismatch")
+
+    sched = scheduler(clock, max_retries=5)
+    with pytest.raises(ValueError):
+        asyncio.run(sched.submit("m", 100, (0, 0.0), broken))
+    assert len(attempts) == 1 and clock.sleeps == [] and sched.stats()["retries"] == {}
+
+def test_report_survives_rate_limited_stub(write_thread, monkeypatch):
+    # Every third call is rejected with a 429 once; the report matches an undisturbed run
+    class FlakyStub(agent.StubBackend):
+        calls = 0
+
+        async def acall(self, stage, inputs, attempt=1, model=None):
+            FlakyStub.calls += 1
+            if FlakyStub.calls % 3 == 0:
+                raise RateLimited()
+            return await super().acall(stage, inputs, attempt, model)
+
+    monkeypatch.setattr(RateLimited, "response", SimpleNamespace(headers={"retry-after-ms": "1"}))
+    d = write_thread("email1", "Project Alpha - Export", [
+        ("Anna Kiss anna@example.com", "Ben Nagy ben@example.com", "2025-06-02 10:00", "Can you check why the export drops rows?"),
+        ("Ben Nagy ben@example.com", "Anna Kiss anna@example.com", "2025-06-02 12:00", "I've pushed the fix, tested on staging."),
+    ])
+    plain = stub_report(d)
+    flaky = agent.build_report(str(d), redact=False, backend=FlakyStub(), max_retries=2)
+    assert flaky["scheduler"]["retries"].get("rate_limit", 0) >= 1
+    assert [t["all_issues"] for t in flaky["threads"]] == [t["all_issues"] for t in plain["threads"]]
@@ -0,0 +1,50 @@
+import sqlite3
+
+import pytest
+
+import email_processing_agent as agent
+from conftest import stub_report
+
+def test_every_row_records_content_hash_and_analysis_version(write_thread, tmp_path):
+    d = write_thread("email1", "Project Alpha - Export", [
+        ("Anna Kiss anna@example.com", "Ben Nagy ben@example.com", "2025-06-02 10:00", "Can you check why the export drops rows?"),
+        ("Ben Nagy ben@example.com", "Anna Kiss anna@example.com", "2025-06-02 12:00", "I've pushed the fix, tested on staging."),
+    ])
+    store = agent.MessageStore(str(tmp_path / "agent.db"))
+    try:
+        stub_report(d, store=store)
+    finally:
+        store.close()
+    db = sqlite3.connect(str(tmp_path / "agent.db"))
+    (thread_hash, version), = db.execute("SELECT content_hash, analysis_version FROM threads")
+    for table in ("messages", "issues", "quotes"):
+        rows = db.execute(f"SELECT content_hash, analysis_version FROM {table}").fetchall()
+        assert rows and set(rows) == {(thread_hash, version)}, table
+
+def build_store(write_thread, tmp_path):
+    d = write_thread("email1", "Project Alpha - Outage", [
+        ("Anna Kiss anna@example.com", "Ben Nagy ben@example.com", "2025-06-02 10:00", "The prod-outage runbook is missing the v2.1 rollback step."),
+    ])
+    path = str(tmp_path / "agent.db")
+    store = agent.MessageStore(path)
+    try:
+        stub_report(d, store=store)
+    finally:
+        store.close()
+    return path
+
+def test_message_search_accepts_terms_with_punctuation(write_thread, tmp_path):
+    store = agent.MessageStore(build_store(write_thread, tmp_path))
+    try:
+        for text in ("prod-outage", "v2.1 AND rollback", '"rollback step"', "runbook*"):
+            assert [r["thread_id"] for r in store.search_messages(text)] == ["email1"], text
+        assert store.search_messages("prod-incident") == []
+    finally:
+        store.close()
+
+def test_invalid_message_query_is_a_usage_error(write_thread, tmp_path, capsys):
+    path = build_store(write_thread, tmp_path)
+    with pytest.raises(SystemExit) as exc:
+        agent.query_main(["--store", path, "--messages", "--text", '"rollback step'])
+    assert exc.value.code == 2
+    assert "not a valid FTS5 query" in capsys.readouterr().err
@@ -0,0 +1,39 @@
+import email_processing_agent as agent
+from conftest import stub_report
+
+ANNA, BEN = "Anna Kiss anna@example.com", "Ben Nagy ben@example.com"
+
+def write_open_threads(write_thread, n):
+    for i in range(1, n + 1):
+        d = write_thread(f"email{i}", f"Project Alpha - Item {i}", [
+            (ANNA, BEN, f"2025-06-0{i} 10:00", f"Can you check why export number {i} drops rows?"),
+        ])
+    return d
+
+def test_threads_share_one_summary_call(write_thread):
+    d = write_open_threads(write_thread, 3)
+    report = stub_report(d, summary_mode="batch")
+    s = report["summaries"]
+    assert (s["batch_calls"], s["batched_threads"], s["single_calls"], s["fallbacks"]) == (1, 3, 0, 0)
+    per_thread = {t["thread_id"]: t["executive_summary_md"] for t in stub_report(d)["threads"]}
+    assert {t["thread_id"]: t["executive_summary_md"] for t in report["threads"]} == per_thread
+
+def test_budget_splits_batches(write_thread):
+    # A budget below one payload leaves every thread in a batch of its own, answered by a plain summary call
+    d = write_open_threads(write_thread, 3)
+    s = stub_report(d, summary_mode="batch", summary_batch_tokens=1)["summaries"]
+    assert (s["batch_calls"], s["single_calls"]) == (0, 3)
+
+def test_missing_thread_falls_back_to_its_own_call(write_thread, monkeypatch):
+    batch = agent.StubBackend._summary_batch
+
+    def drop_email2(self, inputs):
+        answer = batch(self, inputs)
+        return agent.ThreadSummaries(summaries=[s for s in answer.summaries if s.thread_id != "email2"])
+
+    monkeypatch.setattr(agent.StubBackend, "_summary_batch", drop_email2)
+    d = write_open_threads(write_thread, 3)
+    report = stub_report(d, summary_mode="batch")
+    s = report["summaries"]
+    assert (s["batch_calls"], s["batched_threads"], s["fallbacks"]) == (1, 2, 1)
+    assert all(t["executive_summary_md"] for t in report["threads"])
@@ -0,0 +1,27 @@
+import pytest
+
+import email_processing_agent as agent
+from conftest import stub_report
+
+ANNA, BEN = "Anna Kiss anna@example.com", "Ben Nagy ben@example.com"
+
+@pytest.mark.parametrize("cascade", [False, True])
+def test_windows_fit_the_model_that_drafts_them(write_thread, monkeypatch, cascade):
+    # The fast draft model gets half the strong model's budget; with --cascade every window must fit it
+    fast, strong = agent.FAST_STAGE_MODELS["draft"], agent.ANALYZE_MODEL
+    monkeypatch.setattr(agent, "DRAFT_WINDOW_TOKENS", {strong: 400, fast: 200})
+    seen = []
+    draft = agent.StubBackend._draft
+    monkeypatch.setattr(agent.StubBackend, "_draft", lambda self, inputs: seen.append(inputs["thread_text"]) or draft(self, inputs))
+    d = write_thread("email1", "Project Alpha - Export", [
+        (ANNA if n % 2 else BEN, BEN if n % 2 else ANNA, f"2025-06-{n + 1:02d} 10:00",
+         f"Status update {n}: the invoice export still drops rows for unicode names in batch {n}. Can you check?")
+        for n in range(12)
+    ])
+    stub_report(d, cascade=cascade, cascade_max_tokens=10**6)
+    # The "---" separators between messages are not budgeted, hence the slack
+    limit = 1.05 * (200 if cascade else 400)
+    assert len(seen) > 1
+    assert max(agent.estimate_tokens(t, fast if cascade else strong) for t in seen) <= limit
+    if not cascade:
+        assert max(agent.estimate_tokens(t, strong) for t in seen) > 1.05 * 200